@@ -6,8 +6,125 @@ class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite+aiosqlite:///./data/app.db"
     # Ollama or other LLM endpoint, kept local-only
     LLM_ENDPOINT: str = "http://localhost:11434"
+    LLM_MODEL: str = "llama3.1"
+    # Keep the model (and its KV/prompt cache) loaded between requests, and
+    # pin the context size so Ollama never reloads the model for a new num_ctx.
+    LLM_KEEP_ALIVE: str = "30m"
+    LLM_NUM_CTX: int = 8192
+    LLM_PREFIX_CACHE_SIZE: int = 64
+    # Admission control for the shared model server (see app/services/llm_governor.py)
+    LLM_MAX_CONCURRENCY: int = 2
+    LLM_BATCH_STARVATION_S: float = 30.0
+    # Micro-batching of the in-process transformers fallback (see app/services/batching.py)
+    LLM_LOCAL_BATCH_SIZE: int = 8
+    LLM_LOCAL_BATCH_WAIT_S: float = 0.01
+
+    # Thread pools per class of blocking work (see app/services/executors.py)
+    EXECUTOR_LLM_WORKERS: int = 4
+    EXECUTOR_NETWORK_WORKERS: int = 8
+    EXECUTOR_DISK_WORKERS: int = 2
+    EXECUTOR_CPU_WORKERS: int = 2
+    # Where agent files, traces, profiles and cassettes go (default: backend/data)
+    DATA_DIR: str | None = None
+    # file_writer leaves a file untouched when the new content is identical
+    FILE_WRITE_SKIP_IDENTICAL: bool = True
     tavily_api_key: str | None = None
 
+    # Document chunking (see app/services/chunking.py). Sizes are in the
+    # strategy's unit: characters, or tokens for the "token" strategy.
+    CHUNK_STRATEGY: str = "sentence"
+    CHUNK_SIZE: int | None = None
+    CHUNK_OVERLAP: int | None = None
+
+    # Token budgets for agent prompts (see app/services/context_budget.py)
+    NODE_CONTEXT_TOKEN_BUDGET: int = 2000
+    AGENT_HISTORY_TOKEN_BUDGET: int = 6000
+
+    # ReAct loop budgets; nodes can override them with data.max_steps / data.deadline_s
+    AGENT_MAX_STEPS: int = 3
+    AGENT_DEADLINE_S: float = 180.0
+
+    # Items a map node runs at once unless the node sets data.concurrency
+    MAP_CONCURRENCY: int = 4
+
+    # Compiled workflow graphs kept in memory (see app/services/graph.py)
+    GRAPH_CACHE_SIZE: int = 128
+    # Ready nodes of one streamed graph run at once; admitted longest remaining path first
+    GRAPH_MAX_PARALLEL: int = 4
+    # Latency assumed for a node with no history (see app/services/latency_model.py)
+    GRAPH_DEFAULT_NODE_S: float = 30.0
+
+    # How often a streaming run checks whether its client went away
+    STREAM_DISCONNECT_POLL_S: float = 0.5
+    # Strings at least this long are sent once per stream and referenced afterwards
+    STREAM_BLOB_MIN_CHARS: int = 512
+
+    # Embeddings: "auto" (Ollama, sentence-transformers, then hashed n-grams, or histogram
+    # while the stored chunks are 128-d), "hashed" or "histogram" (see
+    # app/services/embeddings.py and hashed_embeddings.py)
+    EMBEDDING_BACKEND: str = "auto"
+    HASH_EMBED_DIM: int = 1024
+    HASH_EMBED_TFIDF: bool = True
+
+    # Compressed first-pass scoring of chunk embeddings: "none", "int8" or "pq"
+    # (see app/services/vector_index.py); the shortlist is rescored exactly
+    EMBEDDING_QUANTIZATION: str = "none"
+    EMBEDDING_PQ_SUBVECTOR_DIM: int = 4
+    EMBEDDING_RESCORE_CANDIDATES: int = 100
+
+    # Deleted documents' chunks are tombstoned; once this fraction of all chunks is
+    # tombstoned a background compaction removes them and VACUUMs the database
+    COMPACTION_TOMBSTONE_RATIO: float = 0.2
+
+    # Execution event bus (see app/services/event_bus.py)
+    EVENT_REPLAY_SIZE: int = 1000
+    EVENT_SUBSCRIBER_QUEUE: int = 256
+    EVENT_BUS_RETAINED: int = 64
+    SSE_HEARTBEAT_S: float = 15.0
+
+    # Per-execution timeline traces (see app/services/tracing.py), served as
+    # Chrome Trace Event JSON from /execution/{id}/trace
+    TRACING_ENABLED: bool = True
+    TRACE_RETAINED: int = 64
+    TRACE_MAX_EVENTS: int = 50000
+
+    # Record/replay of LLM, web search and embedding calls (see app/services/cassette.py):
+    # "off", "record" or "replay". Replay sleeps for the recorded latency times the scale.
+    CASSETTE_MODE: str = "off"
+    CASSETTE_PATH: str = "cassettes/default.jsonl"
+    CASSETTE_LATENCY_SCALE: float = 0.0
+    CASSETTE_ALLOW_MISSES: bool = False
+
+    # Web search providers (see app/services/tools.py): token buckets per provider as
+    # "provider:rate_per_s:burst" (rate 0 or unlisted = unlimited). A search that would
+    # wait longer than SEARCH_RATE_MAX_WAIT_S for a token moves on to the next provider.
+    # With SEARCH_COALESCE, identical concurrent searches share one outbound call.
+    SEARCH_RATE_LIMITS: str = "tavily:5:10,duckduckgo:1:3,wikipedia:5:10"
+    SEARCH_RATE_MAX_WAIT_S: float = 5.0
+    SEARCH_COALESCE: bool = True
+
+    # Durable execution queue for worker processes (python -m app.worker, see
+    # app/services/job_queue.py). A job whose worker stops heartbeating for JOB_LEASE_S
+    # is claimed again by another worker, at most JOB_MAX_ATTEMPTS times in all.
+    JOB_LEASE_S: float = 30.0
+    JOB_HEARTBEAT_S: float = 10.0
+    JOB_MAX_ATTEMPTS: int = 3
+    # Idle workers and clients following a job's events poll the database this often
+    JOB_POLL_S: float = 0.5
+    # Workers write a job's events in batches of up to JOB_EVENT_BATCH, at least every JOB_EVENT_FLUSH_S
+    JOB_EVENT_BATCH: int = 50
+    JOB_EVENT_FLUSH_S: float = 0.2
+    WORKER_CONCURRENCY: int = 2
+    # SQLite is shared by the API and the workers: WAL, and wait this long for a write lock
+    SQLITE_BUSY_TIMEOUT_S: float = 30.0
+
+    # Admin-only endpoints and per-request profiling (X-Profile: sample|cprofile with
+    # X-Admin-Token, see app/services/profiling.py); both are off while this is empty
+    ADMIN_TOKEN: str = ""
+    PROFILE_SAMPLE_INTERVAL_S: float = 0.005
+    PROFILE_MAX_S: float = 300.0
+    PROFILES_RETAINED: int = 50
+
     class Config:
         env_file = ".env"
 
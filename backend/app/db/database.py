@@ -1,3 +1,4 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -17,7 +18,24 @@ os.makedirs(data_dir, exist_ok=True)
 # Use SQLite for local-first dev; database file stored under backend/data/app.db
 database_url = settings.DATABASE_URL
 
-engine = create_async_engine(database_url, echo=False, future=True)
+is_sqlite = database_url.startswith("sqlite")
+
+# The API and worker processes share the SQLite file: wait for the write lock instead of failing
+engine = create_async_engine(
+    database_url,
+    echo=False,
+    future=True,
+    connect_args={"timeout": settings.SQLITE_BUSY_TIMEOUT_S} if is_sqlite else {},
+)
+
+
+if is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_wal(dbapi_connection, connection_record):
+        # readers (event followers) no longer block the workers' writes
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
 
 AsyncSessionLocal = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
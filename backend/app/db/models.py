@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Text, JSON
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 
@@ -45,6 +45,35 @@ class StepResult(Base):  # Black Box Recorder
     execution = relationship("Execution", back_populates="steps")
 
 
+class ExecutionJob(Base):  # Queued graph run, picked up by a worker process (python -m app.worker)
+    __tablename__ = "execution_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String(64), nullable=False, unique=True, index=True)
+    payload = Column(JSON, nullable=False)  # body of POST /workflow/run
+    priority = Column(String(20), nullable=False, default="batch")
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, completed, failed, cancelled
+    worker_id = Column(String(255), nullable=True)
+    lease_expires_at = Column(Float, nullable=True)  # epoch seconds; the worker's heartbeats push it forward
+    attempts = Column(Integer, nullable=False, default=0)
+    execution_id = Column(Integer, ForeignKey("executions.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    events = relationship("ExecutionEvent", back_populates="job")
+
+
+class ExecutionEvent(Base):  # Engine events of a queued run; clients follow them from the database
+    __tablename__ = "execution_events"
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("execution_jobs.id"), nullable=False, index=True)
+    attempt = Column(Integer, nullable=False, default=1)
+    event = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    job = relationship("ExecutionJob", back_populates="events")
+
+
 class Document(Base):  # File Metadata, file you uploaded
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True, index=True)
@@ -58,8 +87,15 @@ class Document(Base):  # File Metadata, file you uploaded
 class DocumentChunk(Base):  # Vector Storage
     __tablename__ = "document_chunks"
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
     content = Column(Text, nullable=False)  # The actual text snippet
     embedding = Column(JSON, nullable=False)
 
     document = relationship("Document", back_populates="chunks")
+
+
+class ChunkTombstone(Base):  # Deleted chunks: hidden from search until compaction removes them
+    __tablename__ = "chunk_tombstones"
+    chunk_id = Column(Integer, ForeignKey("document_chunks.id"), primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
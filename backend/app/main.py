@@ -1,10 +1,14 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 # Load .env automatically so TAVILY_API_KEY and other vars are available
 from dotenv import load_dotenv
 load_dotenv()
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routes import workflow, documents, search, execution, agent_router
+from app.services.executors import shutdown_all as shutdown_executors
+from app.services.metrics import registry as metrics_registry
+from app.services.profiling import ProfilingMiddleware
 
 app = FastAPI(title="Agentic Workflow Automation Platform - Backend")
 
@@ -16,12 +20,25 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Opt-in profiling of single requests (X-Profile + X-Admin-Token)
+app.add_middleware(ProfilingMiddleware)
 
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_executors()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of latency histograms (LLM, tools, embeddings, RAG, DB)."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # include routers
 app.include_router(workflow.router, prefix="/workflow", tags=["workflow"])
 app.include_router(documents.router, prefix="/documents", tags=["documents"])
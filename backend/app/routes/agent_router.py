@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Any
+from app.services import execution_context
 from app.services.agent_service import run_single_agent
 
 router = APIRouter()
@@ -13,5 +14,6 @@ class AgentRunRequest(BaseModel):
 @router.post("/test_agent")
 async def test_agent(payload: AgentRunRequest):
     goal = payload.goal or "Search for info on LangGraph and save it to a file."
-    res = await run_single_agent(goal)
+    with execution_context.scope(execution_context.new_execution_id(), execution_context.PRIORITY_INTERACTIVE):
+        res = await run_single_agent(goal)
     return res
\ No newline at end of file
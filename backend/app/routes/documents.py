@@ -6,22 +6,51 @@ from app.services.rag_service import rag_service
 router = APIRouter()
 
 
+async def _save_upload(f: UploadFile) -> str:
+    os.makedirs("backend/data/uploads", exist_ok=True)
+    contents = await f.read()
+    out_path = os.path.join("backend", "data", "uploads", f.filename)
+    with open(out_path, "wb") as fh:
+        fh.write(contents)
+    return out_path
+
+
 @router.post("/upload")
 async def upload_documents(files: List[UploadFile] = File(...)):
     saved = []
-    os.makedirs("backend/data/uploads", exist_ok=True)
     for f in files:
-        contents = await f.read()
-        out_path = os.path.join("backend", "data", "uploads", f.filename)
-        with open(out_path, "wb") as fh:
-            fh.write(contents)
+        out_path = await _save_upload(f)
         # process document: chunk, embed, store
-        await rag_service.process_document(out_path, filename=f.filename)
-        saved.append({"filename": f.filename, "path": out_path})
+        res = await rag_service.process_document(out_path, filename=f.filename)
+        saved.append({"filename": f.filename, "path": out_path, "document_id": res["document_id"]})
     return {"saved": saved}
 
 
 @router.get("/list")
 async def list_documents():
-    # TODO: list ingested documents
-    return {"documents": []}
+    return {"documents": await rag_service.list_documents()}
+
+
+@router.delete("/{document_id}")
+async def delete_document(document_id: int):
+    """Remove a document from search at once; its rows are dropped by the next compaction."""
+    out = await rag_service.delete_document(document_id)
+    if out is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"deleted": out}
+
+
+@router.put("/{document_id}")
+async def replace_document(document_id: int, file: UploadFile = File(...)):
+    """Re-index a document from a new upload; the old version is deleted once the new one is stored."""
+    out_path = await _save_upload(file)
+    out = await rag_service.replace_document(document_id, out_path, filename=file.filename)
+    if out is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return out
+
+
+@router.post("/compact")
+async def compact_documents():
+    """Run compaction now instead of waiting for COMPACTION_TOMBSTONE_RATIO."""
+    return await rag_service.compact()
@@ -1,12 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from app.db.database import AsyncSessionLocal
 from app.db import models
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-import json
-from typing import Any, List, Dict
+import asyncio
+import heapq
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Dict
+from app.config import settings
+from app.services import event_encoding, execution_context, job_queue, metrics, profiling, tracing
 from app.services.agent_service import run_single_agent
+from app.services.context_budget import build_parent_context
+from app.services.event_bus import event_bus
+from app.services.executors import POOL_CPU, run_in
+from app.services.graph import GraphCycleError, compile_graph, simulate_makespan
+from app.services.incremental import GraphRunStore, node_fingerprint
+from app.services.latency_model import latency_model, node_signature
+from app.services.node_types import map_node
 
 router = APIRouter()
 
@@ -26,15 +39,197 @@ class Edge(BaseModel):
 class WorkflowRequest(BaseModel):
     nodes: List[Node]
     edges: List[Edge]
+    # With a stored workflow's id the run is persisted and unchanged nodes are reused
+    workflow_id: int | None = None
+    force: bool = False
 
 router = APIRouter()
 
+# Node types the streaming engine executes; anything else is reported as skipped.
+RUNNABLE_TYPES = ("agent", "map")
+
+_disconnects = metrics.registry.counter("stream_client_disconnects_total", "Streaming runs cancelled because the client went away (or a worker lost its job)")
+
+
+class RunStopped(Exception):
+    pass
+
+
+def _node_type(node: Node) -> str | None:
+    return node.type or (node.data or {}).get("nodeType")
+
+
+def _node_estimates(graph, node_map: Dict[str, Node]) -> Dict[str, Dict[str, Any]]:
+    """Expected duration per node from latency history; nodes the engine skips cost nothing."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for nid in graph.order:
+        node = node_map[nid]
+        ntype = _node_type(node)
+        sig = node_signature(ntype, node.data)
+        if ntype in RUNNABLE_TYPES:
+            seconds, source = latency_model.estimate(sig, ntype)
+        else:
+            seconds, source = 0.0, "skipped"
+        out[nid] = {"signature": sig, "estimate_s": seconds, "source": source}
+    return out
+
+
+def _agent_budget(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-node ReAct budgets from node data (max_steps, deadline_s, required_effects)."""
+    budget: Dict[str, Any] = {}
+    try:
+        if data.get("max_steps") not in (None, ""):
+            budget["max_steps"] = max(int(data["max_steps"]), 1)
+        if data.get("deadline_s") not in (None, ""):
+            budget["deadline_s"] = float(data["deadline_s"])
+    except (TypeError, ValueError):
+        pass
+    if isinstance(data.get("required_effects"), list):
+        budget["required_effects"] = [str(e) for e in data["required_effects"]]
+    return budget
+
 
 async def get_session() -> AsyncSession:
     async with AsyncSessionLocal() as s:
         yield s
 
 
+async def _publish_events(run_id: str, events):
+    """Publish each engine event on the event bus, passing it on to the client that started the run."""
+    try:
+        async for event in events:
+            yield event_bus.publish(run_id, event)
+    finally:
+        event_bus.close(run_id)
+        await events.aclose()
+
+
+async def _next_or_heartbeat(events, pending: asyncio.Future | None, timeout: float):
+    """(pending, event) when an event arrives within `timeout`, else (pending, None); raises StopAsyncIteration at the end."""
+    if pending is None:
+        pending = asyncio.ensure_future(events.__anext__())
+    done, _ = await asyncio.wait({pending}, timeout=timeout)
+    if not done:
+        return pending, None
+    return None, pending.result()
+
+
+async def _close_subscription(events, pending: asyncio.Future | None) -> None:
+    if pending is not None and not pending.done():
+        # let the cancelled __anext__ finish before closing the generator it is running
+        pending.cancel()
+        try:
+            await pending
+        except BaseException:
+            pass
+    await events.aclose()
+
+
+@router.get("/{exec_id}/events")
+async def execution_events(
+    exec_id: str,
+    verbosity: str = event_encoding.VERBOSITY_FULL,
+    last_event_id: str | None = Header(None),
+):
+    """Server-Sent Events for a live (or recently finished) execution.
+
+    `exec_id` is the run id from the stream's `run` event, or the stored execution id.
+    Reconnecting clients resume after Last-Event-ID from the replay buffer.
+    """
+    if not event_bus.exists(exec_id):
+        raise HTTPException(status_code=404, detail="No live events for this execution")
+    try:
+        after = int(last_event_id or 0)
+    except ValueError:
+        after = 0
+
+    async def sse():
+        encoder = event_encoding.EventEncoder(verbosity)
+        events = event_bus.subscribe(exec_id, after)
+        pending = None
+        try:
+            while True:
+                try:
+                    pending, event = await _next_or_heartbeat(events, pending, settings.SSE_HEARTBEAT_S)
+                except StopAsyncIteration:
+                    break
+                if event is None:
+                    yield b": keep-alive\n\n"
+                    continue
+                for part in encoder.encode_parts(event):
+                    head = f"id: {part['seq']}\n" if "seq" in part else ""
+                    yield f"{head}event: {part['type']}\ndata: ".encode("utf-8") + event_encoding.dumps(part) + b"\n\n"
+        finally:
+            await _close_subscription(events, pending)
+
+    return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/{exec_id}/ws")
+async def execution_events_ws(websocket: WebSocket, exec_id: str, verbosity: str = event_encoding.VERBOSITY_FULL, after: int = 0):
+    """WebSocket feed of one execution's events (same payloads as the NDJSON stream)."""
+    await websocket.accept()
+    if not event_bus.exists(exec_id):
+        await websocket.close(code=4404)
+        return
+    encoder = event_encoding.EventEncoder(verbosity)
+    events = event_bus.subscribe(exec_id, after)
+    # the client never sends anything we need; receiving only tells us when it goes away
+    closed = asyncio.ensure_future(websocket.receive())
+    pending = None
+    try:
+        while True:
+            pending = pending or asyncio.ensure_future(events.__anext__())
+            done, _ = await asyncio.wait({pending, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed in done:
+                return
+            try:
+                event = pending.result()
+            except StopAsyncIteration:
+                break
+            pending = None
+            for part in encoder.encode_parts(event):
+                await websocket.send_text(event_encoding.dumps(part).decode("utf-8"))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        await _close_subscription(events, pending)
+
+
+@router.get("/{exec_id}/trace")
+async def execution_trace(exec_id: str):
+    """Timeline of one execution as Chrome Trace Event JSON (chrome://tracing, Perfetto).
+
+    One lane per node; spans cover agent steps, LLM and tool calls, queue waits and DB commits.
+    """
+    trace = tracing.get(exec_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace for this execution")
+    return trace
+
+
+@router.get("/{exec_id}/profile")
+async def execution_profile(exec_id: str, format: str = "raw", x_admin_token: str | None = Header(None)):
+    """Profile saved for a run started with `X-Profile` (admin only, see app/services/profiling.py).
+
+    Sampled profiles are collapsed stacks (text); cProfile ones are pstats files,
+    or a cumulative-time summary with `format=text`.
+    """
+    if not profiling.authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="Needs a valid X-Admin-Token")
+    found = profiling.find_profile(exec_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="No profile for this execution")
+    path, mode = found
+    if mode == profiling.MODE_CPROFILE:
+        if format == "text":
+            return PlainTextResponse(await run_in(POOL_CPU, profiling.render_text, path))
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
+
+
 @router.get("/{exec_id}")
 async def get_execution(exec_id: int, session: AsyncSession = Depends(get_session)):
     ex = await session.get(models.Execution, exec_id)
@@ -55,118 +250,384 @@ async def get_execution(exec_id: int, session: AsyncSession = Depends(get_sessio
     return {"execution_id": ex.id, "status": ex.status, "steps": steps_out}
 
 
-@router.post("/run")
-async def run_workflow_graph(payload: WorkflowRequest):
-    """Run a provided workflow graph (nodes + edges) and stream NDJSON events for UI feedback."""
+async def graph_events(
+    payload: WorkflowRequest,
+    run_id: str,
+    priority: str = execution_context.PRIORITY_INTERACTIVE,
+    should_stop: Callable[[], Awaitable[bool]] | None = None,
+    source: str = "workflow_run",
+):
+    """The streaming engine: run a graph and yield its events (run, start, progress, result, error, end).
+
+    `should_stop` is polled while nodes run; once it returns True running nodes are
+    cancelled and no further nodes start (a client disconnect, or a worker that lost its job).
+    """
+    store = GraphRunStore(payload.workflow_id)
+    trace = tracing.start(run_id)
+    profiling.attach(run_id)
+    status = "failed"
+    try:
+        # first event: the id other clients use to follow this run (/execution/{run_id}/events)
+        yield {"type": "run", "run_id": run_id}
+        try:
+            print(f"Received Graph: {len(payload.nodes)} nodes, {len(payload.edges)} edges")
+        except Exception:
+            print("Received Graph: could not read payload sizes")
 
-    async def event_generator():
         try:
-            try:
-                print(f"Received Graph: {len(payload.nodes)} nodes, {len(payload.edges)} edges")
-            except Exception:
-                print("Received Graph: could not read payload sizes")
-
-            # Build adjacency and indegree maps
-            node_ids = [n.id for n in payload.nodes]
-            adj: Dict[str, List[str]] = {nid: [] for nid in node_ids}
-            indeg: Dict[str, int] = {nid: 0 for nid in node_ids}
-
-            for e in payload.edges:
-                # ensure edge endpoints exist
-                if e.source not in adj or e.target not in adj:
-                    print(f"Warning: edge references unknown node: {e}")
-                    continue
-                adj[e.source].append(e.target)
-                indeg[e.target] = indeg.get(e.target, 0) + 1
-
-            # Kahn's algorithm for topological ordering
-            queue = [nid for nid, d in indeg.items() if d == 0]
-            topo: List[str] = []
-            while queue:
-                cur = queue.pop(0)
-                topo.append(cur)
-                for nb in adj.get(cur, []):
-                    indeg[nb] -= 1
-                    if indeg[nb] == 0:
-                        queue.append(nb)
-
-            if len(topo) != len(node_ids):
-                # cycle detected
-                print("⚠️ Cycle detected in workflow graph; aborting run")
-                # Yield an error and end
-                yield (json.dumps({"type": "error", "node_id": None, "error": "Cycle detected in workflow graph"}) + "\n")
+            with tracing.activate(trace), tracing.span("compile_graph", "graph"):
+                graph = compile_graph([n.id for n in payload.nodes], [(e.source, e.target) for e in payload.edges])
+        except GraphCycleError:
+            print("⚠️ Cycle detected in workflow graph; aborting run")
+            # Yield an error and end
+            yield {"type": "error", "node_id": None, "error": "Cycle detected in workflow graph"}
+            return
+        for w in graph.warnings:
+            print(f"Warning: {w}")
+        topo = graph.order
+        parents = graph.parents
+
+        # Map node id -> node object for quick lookup
+        node_map: Dict[str, Node] = {n.id: n for n in payload.nodes}
+
+        # Merkle-style fingerprints: a node's data plus its parents' fingerprints
+        fingerprints: Dict[str, str] = {}
+        for nid in topo:
+            n = node_map[nid]
+            fingerprints[nid] = node_fingerprint(_node_type(n), n.data, [fingerprints[p] for p in parents[nid]])
+        with tracing.activate(trace), tracing.span("open_execution", "db"):
+            await store.open()
+        if store.execution_id is not None:
+            event_bus.alias(store.execution_id, run_id)
+            tracing.alias(trace, store.execution_id)
+            profiling.attach(store.execution_id)
+        rerun: set = set()  # nodes executed in this run; their descendants cannot be reused
+        context: Dict[str, Any] = {}
+
+        # Ready nodes are admitted longest expected remaining path first
+        await latency_model.ensure_loaded()
+        estimates = _node_estimates(graph, node_map)
+        remaining_s = graph.longest_to_sink(lambda n: estimates[n]["estimate_s"])
+        max_parallel = max(settings.GRAPH_MAX_PARALLEL, 1)
+
+        pending_events: deque = deque()
+        wake = asyncio.Event()
+
+        def emit(event: Dict[str, Any]) -> None:
+            pending_events.append(event)
+            wake.set()
+
+        async def run_node(nid: str) -> None:
+            # one trace lane per node, so nodes running at once show up side by side
+            with tracing.activate(trace, lane=f"node {nid}"), tracing.span(f"node {nid}", "node", type=_node_type(node_map[nid])):
+                await execute_node(nid)
+
+        async def execute_node(nid: str) -> None:
+            node = node_map[nid]
+            # Notify start of node
+            emit({"type": "start", "node_id": nid})
+
+            print(f"Executing node {nid} (type={node.type})")
+            ntype = _node_type(node)
+            if ntype not in RUNNABLE_TYPES:
+                print(f"Skipping non-agent node {nid}")
+                # send skipped as result
+                emit({"type": "result", "node_id": nid, "result": {"status": "skipped", "reason": "not agent"}})
                 return
 
-            # Map node id -> node object for quick lookup
-            node_map: Dict[str, Node] = {n.id: n for n in payload.nodes}
-
-            # Execute nodes sequentially in topo order
-            context: Dict[str, Any] = {}
-
-            for nid in topo:
-                node = node_map.get(nid)
-                if not node:
-                    continue
+            goal = (node.data or {}).get("goal") or (node.data or {}).get("prompt") or ""
+            if not goal:
+                print(f"⚠️ Node {nid} missing goal; skipping")
+                emit({"type": "result", "node_id": nid, "result": {"status": "skipped", "reason": "missing goal"}})
+                return
 
-                # Notify start of node
-                yield (json.dumps({"type": "start", "node_id": nid}) + "\n")
+            fp = fingerprints[nid]
+            stored = None if payload.force or any(p in rerun for p in parents[nid]) else store.lookup(fp)
+            if stored is not None:
+                print(f"♻️ Node {nid} unchanged; reusing stored result")
+                context[nid] = stored
+                await store.record(nid, ntype, fp, node.data, stored, cached=True)
+                emit({"type": "result", "node_id": nid, "result": stored, "cached": True})
+                return
+            rerun.add(nid)
 
-                print(f"Executing node {nid} (type={node.type})")
-                ntype = node.type or (node.data or {}).get("nodeType")
-                if ntype != 'agent':
-                    print(f"Skipping non-agent node {nid}")
-                    # send skipped as result
-                    yield (json.dumps({"type": "result", "node_id": nid, "result": json.dumps({"status": "skipped", "reason": "not agent"})}) + "\n")
-                    continue
+            # Build a deduplicated, token-budgeted context from parent nodes' results
+            parent_ids = parents[nid]
+            context_string, context_stats = build_parent_context(
+                [(pid, context.get(pid)) for pid in parent_ids],
+                settings.NODE_CONTEXT_TOKEN_BUDGET,
+            )
+            signature = estimates[nid]["signature"]
 
-                goal = (node.data or {}).get("goal") or (node.data or {}).get("prompt") or ""
-                if not goal:
-                    print(f"⚠️ Node {nid} missing goal; skipping")
-                    yield (json.dumps({"type": "result", "node_id": nid, "result": json.dumps({"status": "skipped", "reason": "missing goal"})}) + "\n")
-                    continue
-
-                # Build context string from parent nodes' results
-                parent_ids = [e.source for e in payload.edges if e.target == nid]
-                parent_texts: List[str] = []
-                for pid in parent_ids:
-                    p_res = context.get(pid)
-                    # If the parent produced a structured result, prefer passing along its raw search_context
-                    if isinstance(p_res, dict):
-                        if p_res.get('search_context'):
-                            parent_texts.append("Previous Step Raw Findings:\n" + str(p_res.get('search_context')))
-                        if p_res.get('result'):
-                            parent_texts.append(str(p_res.get('result')))
-                        else:
-                            parent_texts.append(str(p_res))
+            try:
+                t0 = time.perf_counter()
+                with execution_context.scope(run_id, priority), metrics.node_breakdown() as breakdown:
+                    if ntype == "map":
+                        # items finish out of order; stream each one as a progress event
+                        res = await map_node.execute(
+                            node.data or {},
+                            parent_results=[context.get(pid) for pid in parent_ids],
+                            context=context_string,
+                            agent_budget=_agent_budget(node.data or {}),
+                            on_item=lambda item: emit({"type": "progress", "node_id": nid, **item}),
+                        )
                     else:
-                        parent_texts.append(str(p_res))
+                        res = await run_single_agent(goal, context=context_string, **_agent_budget(node.data or {}))
+                elapsed = time.perf_counter() - t0
+                metrics.record("node_duration_seconds", elapsed, node_type=ntype)
+                latency_model.observe(signature, ntype, elapsed)
+                timing = {"total_ms": round(elapsed * 1000, 3), **breakdown}
+                print(f"Node {nid} result: {res}")
+                context[nid] = res
+                await store.record(nid, ntype, fp, node.data, res, signature=signature, duration_s=round(elapsed, 4))
+
+                # send result event
+                emit({"type": "result", "node_id": nid, "result": res, "context": context_stats, "timing": timing})
+
+            except HTTPException:
+                # re-raise HTTPExceptions
+                raise
+            except Exception as e:
+                print(f"Error executing node {nid}: {e}")
+                context[nid] = {"status": "error", "detail": str(e)}
+                await store.record(nid, ntype, fp, node.data, context[nid])
+                emit({"type": "error", "node_id": nid, "error": str(e)})
+
+        topo_index = {nid: i for i, nid in enumerate(topo)}
+        waiting = {nid: len(parents[nid]) for nid in topo}
+        ready = [(-remaining_s[nid], topo_index[nid], nid) for nid in topo if waiting[nid] == 0]
+        heapq.heapify(ready)
+        running: Dict[asyncio.Task, str] = {}
+        t_run = time.perf_counter()
+        last_stop_check = time.monotonic()
+        try:
+            while ready or running or pending_events:
+                while ready and len(running) < max_parallel:
+                    _, _, nid = heapq.heappop(ready)
+                    running[asyncio.ensure_future(run_node(nid))] = nid
+                while pending_events:
+                    yield pending_events.popleft()
+                if not running:
+                    continue
+                wake.clear()
+                waker = asyncio.ensure_future(wake.wait())
+                done, _ = await asyncio.wait(
+                    {*running, waker}, timeout=settings.STREAM_DISCONNECT_POLL_S, return_when=asyncio.FIRST_COMPLETED
+                )
+                waker.cancel()
+                for task in done:
+                    if task is waker:
+                        continue
+                    nid = running.pop(task)
+                    task.result()  # run_node reports node errors itself; anything else aborts the run
+                    for child in graph.children[nid]:
+                        waiting[child] -= 1
+                        if waiting[child] == 0:
+                            heapq.heappush(ready, (-remaining_s[child], topo_index[child], child))
+                # checked on every pass (not only when idle): a busy run emits events constantly
+                if should_stop is not None and time.monotonic() - last_stop_check >= settings.STREAM_DISCONNECT_POLL_S:
+                    last_stop_check = time.monotonic()
+                    if await should_stop():
+                        raise RunStopped()
+        finally:
+            # a disconnect (or the response being closed) cancels queued executor work and
+            # LLM-governor waits of every running node; threads already running finish alone
+            for task in running:
+                task.cancel()
+            for task in running:
+                try:
+                    await task
+                except BaseException:
+                    pass
+        makespan_s = round(time.perf_counter() - t_run, 4)
+
+        # final end event
+        status = "completed"
+        yield {"type": "end", "run_id": run_id, "execution_id": store.execution_id, "makespan_s": makespan_s}
+
+    except RunStopped:
+        status = "cancelled"
+        _disconnects.inc(route=source)
+        print(f"🔌 Run {run_id} stopped ({source}); cancelled its nodes")
+    except Exception as e:
+        # If some unexpected error occurs at generator level, emit an error event
+        try:
+            yield {"type": "error", "node_id": None, "error": str(e)}
+        except Exception:
+            pass
+    finally:
+        with tracing.activate(trace):
+            await store.close(status)
+        await tracing.finish(trace)
 
-                context_string = "\n---\n".join(parent_texts) if parent_texts else ""
 
-                try:
-                    res = await run_single_agent(goal, context=context_string)
-                    print(f"Node {nid} result: {res}")
-                    context[nid] = res
-
-                    # send result event
-                    yield (json.dumps({"type": "result", "node_id": nid, "result": res}) + "\n")
-
-                except HTTPException:
-                    # re-raise HTTPExceptions
-                    raise
-                except Exception as e:
-                    print(f"Error executing node {nid}: {e}")
-                    context[nid] = {"status": "error", "detail": str(e)}
-                    yield (json.dumps({"type": "error", "node_id": nid, "error": str(e)}) + "\n")
-
-            # final end event
-            yield (json.dumps({"type": "end"}) + "\n")
-
-        except Exception as e:
-            # If some unexpected error occurs at generator level, emit an error event
-            try:
-                yield (json.dumps({"type": "error", "node_id": None, "error": str(e)}) + "\n")
-            except Exception:
-                pass
+@router.post("/run")
+async def run_workflow_graph(
+    payload: WorkflowRequest,
+    request: Request = None,
+    priority: str = execution_context.PRIORITY_INTERACTIVE,
+    verbosity: str = event_encoding.VERBOSITY_FULL,
+    compress: str | None = None,
+):
+    """Run a provided workflow graph (nodes + edges) and stream NDJSON events for UI feedback.
+
+    `priority` ("interactive" or "batch") is the LLM admission class for this run's calls.
+    Up to GRAPH_MAX_PARALLEL ready nodes run at once, longest expected remaining path first.
+    If the client disconnects, running nodes are cancelled and no further nodes start.
+    With `workflow_id`, nodes whose fingerprint (data + parents) matches a stored successful
+    step are re-emitted with `cached: true` instead of re-running; `force` re-runs everything.
+    `verbosity` ("full", "summary", "minimal") and `compress` ("gzip", "deflate") shape the
+    stream; long strings arrive once as `blob` events and are referenced as {"$ref": id}.
+    """
+    run_id = execution_context.new_execution_id()
+    priority = execution_context.normalize_priority(priority)
+    should_stop = request.is_disconnected if request is not None else None
+    events = graph_events(payload, run_id, priority, should_stop)
+
+    headers = {"Content-Encoding": compress} if compress in event_encoding.COMPRESSIONS else None
+    return StreamingResponse(
+        event_encoding.encode_stream(_publish_events(run_id, events), verbosity, compress),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@router.post("/explain")
+async def explain_workflow_graph(
+    payload: WorkflowRequest,
+    execution_id: int | None = None,
+    session: AsyncSession = Depends(get_session),
+):
+    """Predicted schedule of a graph: per-node estimates, critical path and makespan.
+
+    `predicted_makespan_s` uses the engine's critical-path admission at GRAPH_MAX_PARALLEL;
+    `predicted_makespan_fifo_s` admits ready nodes in topological order for comparison.
+    `actual` compares against `execution_id`, or the latest run of `workflow_id`.
+    """
+    try:
+        graph = compile_graph([n.id for n in payload.nodes], [(e.source, e.target) for e in payload.edges])
+    except GraphCycleError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e), "nodes": e.nodes})
+    node_map: Dict[str, Node] = {n.id: n for n in payload.nodes}
+
+    await latency_model.ensure_loaded()
+    estimates = _node_estimates(graph, node_map)
+
+    def cost(nid: str) -> float:
+        return estimates[nid]["estimate_s"]
+
+    remaining_s = graph.longest_to_sink(cost)
+    critical_path, critical_path_s = graph.heaviest_path(cost)
+    parallel = max(settings.GRAPH_MAX_PARALLEL, 1)
+
+    if execution_id is None and payload.workflow_id is not None:
+        q = await session.execute(
+            select(models.Execution.id)
+            .where(models.Execution.workflow_id == payload.workflow_id)
+            .order_by(models.Execution.id.desc())
+            .limit(1)
+        )
+        execution_id = q.scalar()
+    actual = None
+    if execution_id is not None:
+        ex = await session.get(models.Execution, execution_id)
+        if not ex:
+            raise HTTPException(status_code=404, detail="Execution not found")
+        steps_q = await session.execute(select(models.StepResult).where(models.StepResult.execution_id == ex.id))
+        durations = {}
+        for s in steps_q.scalars():
+            if isinstance(s.input, dict) and isinstance(s.input.get("duration_s"), (int, float)):
+                durations[s.node_id] = s.input["duration_s"]
+        wall = None
+        if ex.started_at and ex.finished_at:
+            # SQLite hands back naive datetimes (UTC) for server-side defaults
+            wall = (ex.finished_at.replace(tzinfo=None) - ex.started_at.replace(tzinfo=None)).total_seconds()
+        actual = {"execution_id": ex.id, "status": ex.status, "duration_s": wall, "nodes": durations}
+
+    return {
+        "nodes": {
+            nid: {
+                "estimate_s": round(cost(nid), 4),
+                "source": estimates[nid]["source"],
+                "remaining_s": round(remaining_s[nid], 4),
+                "level": graph.level_of[nid],
+            }
+            for nid in graph.order
+        },
+        "critical_path": list(critical_path),
+        "critical_path_s": round(critical_path_s, 4),
+        "parallelism": parallel,
+        "predicted_makespan_s": round(simulate_makespan(graph, cost, parallel, remaining_s), 4),
+        "predicted_makespan_fifo_s": round(simulate_makespan(graph, cost, parallel), 4),
+        "actual": actual,
+        "warnings": list(graph.warnings),
+    }
+
+
+@router.post("/enqueue", status_code=202)
+async def enqueue_workflow_graph(payload: WorkflowRequest, priority: str = execution_context.PRIORITY_BATCH):
+    """Queue a graph run for the worker processes (python -m app.worker) instead of running it here.
+
+    Follow it with GET /execution/jobs/{job_id}/events; see app/services/job_queue.py.
+    """
+    job = await job_queue.enqueue(payload.model_dump(), priority)
+    return job_queue.job_info(job)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_queue.job_info(job)
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    """Cancel a queued or running job; a running one stops at its worker's next heartbeat."""
+    if not await job_queue.cancel(job_id):
+        job = await job_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return job_queue.job_info(await job_queue.get(job_id))
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: int,
+    after: int = 0,
+    follow: bool = True,
+    verbosity: str = event_encoding.VERBOSITY_FULL,
+    compress: str | None = None,
+):
+    """NDJSON events of a queued run from the database, the same payloads as POST /workflow/run.
+
+    Each event carries `event_id` (pass the last one as `after` to resume) and `attempt`: a job
+    retried after its worker died repeats from a new `run` event. With `follow` the stream
+    stays open until the job finishes and ends with a `job` event holding its status.
+    """
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        cursor = after
+        while True:
+            rows = await job_queue.events_after(job_id, cursor)
+            for event_id, attempt, event in rows:
+                cursor = event_id
+                yield {**event, "event_id": event_id, "attempt": attempt}
+            if rows:
+                continue
+            job = await job_queue.get(job_id)
+            if job is None or job.status in job_queue.TERMINAL or not follow:
+                # events written just before the status changed
+                for event_id, attempt, event in await job_queue.events_after(job_id, cursor):
+                    cursor = event_id
+                    yield {**event, "event_id": event_id, "attempt": attempt}
+                yield {"type": "job", **(job_queue.job_info(job) if job else {"job_id": job_id, "status": None})}
+                return
+            await asyncio.sleep(settings.JOB_POLL_S)
 
-    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+    headers = {"Content-Encoding": compress} if compress in event_encoding.COMPRESSIONS else None
+    return StreamingResponse(event_encoding.encode_stream(events(), verbosity, compress), media_type="application/x-ndjson", headers=headers)
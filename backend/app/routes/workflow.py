@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from typing import Any
 from app.db import models, schemas
 from app.db.database import AsyncSessionLocal, init_db
+from app.services import metrics
 from app.services.workflow_engine import run_workflow
 from sqlalchemy.ext.asyncio import AsyncSession
 import json
@@ -30,7 +31,8 @@ async def create_workflow(payload: WorkflowCreate, session: AsyncSession = Depen
     wf = models.Workflow(name=payload.name, graph_json=payload.graph_json)
     session.add(wf)
     await session.flush()
-    await session.commit()
+    with metrics.timer("db_commit_seconds", op="workflow"):
+        await session.commit()
     return {"id": wf.id, "name": wf.name}
 
 
@@ -43,9 +45,9 @@ async def get_workflow(workflow_id: int, session: AsyncSession = Depends(get_ses
 
 
 @router.post("/run/{workflow_id}")
-async def run_workflow_endpoint(workflow_id: int):
+async def run_workflow_endpoint(workflow_id: int, priority: str = "interactive"):
     # synchronous run for MVP
-    res = await run_workflow(workflow_id)
+    res = await run_workflow(workflow_id, priority=priority)
     return res
 
 
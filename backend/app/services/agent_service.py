@@ -1,331 +1,468 @@
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Set, Tuple
 import asyncio
 import json
 import re
+import time
 import traceback
+from functools import lru_cache
+from types import SimpleNamespace
+
+from app.config import settings
+from app.services import metrics, mock_providers, tracing
+from app.services.cassette import KIND_AGENT_LLM, cassette
+from app.services.context_budget import compact_messages, dedupe_blocks
+from app.services.executors import POOL_LLM, POOL_NETWORK, run_in
+from app.services.llm_governor import llm_governor
+from app.services.tools import EFFECT_FILE_WRITTEN, EFFECT_SEARCHED, TOOL_POOLS, TOOL_RUNNERS, ToolResult
+from app.services.utils import count_tokens
 
 # --- HELPER FUNCTION TO FIX INVOKE ERROR ---
-def _execute_tool_safe(tool, args):
+def _execute_tool_safe(tool, args) -> ToolResult:
     """
     Synchronously execute a tool.
     This wrapper ensures arguments are passed correctly to LangChain tools,
-    preventing the 'missing input' error when using asyncio.to_thread.
+    preventing the 'missing input' error when run on an executor thread.
     """
+    name = getattr(tool, "name", getattr(tool, "__name__", "tool"))
     try:
         if hasattr(tool, "invoke"):
             # If args is a dict, pass as keyword args to tool.invoke
             if isinstance(args, dict):
                 try:
-                    return tool.invoke(**args)
+                    out = tool.invoke(**args)
                 except TypeError:
-                    return tool.invoke(args)
+                    out = tool.invoke(args)
             else:
-                return tool.invoke(args)
+                out = tool.invoke(args)
         else:
-            return tool(**(args or {}))
+            out = tool(**(args or {}))
     except Exception as e:
-        return f"Error executing tool: {str(e)}"
+        return ToolResult(name, False, f"Error executing tool: {str(e)}")
+    return out if isinstance(out, ToolResult) else ToolResult(name, True, str(out))
+
+
+_FILENAME_RE = re.compile(r"\b([\w\-]+\.(?:txt|md|csv|json|html|log))\b", re.IGNORECASE)
+_WRITE_WORD_RE = re.compile(r"\b(?:save|write)\b", re.IGNORECASE)
+
+
+def infer_required_effects(goal: str) -> Set[str]:
+    """Tool effects a goal cannot be complete without (currently: asked to save a file)."""
+    if _WRITE_WORD_RE.search(goal or "") or _FILENAME_RE.search(goal or ""):
+        return {EFFECT_FILE_WRITTEN}
+    return set()
+
+
+def _goal_filename(goal: str) -> str:
+    m = _FILENAME_RE.search(goal or "")
+    return m.group(1) if m else "output.txt"
+
+
+def _extract_json_blob(s: str):
+    """Find the JSON object around the first "name" key in model text."""
+    m = re.search(r'"name"|\'"name"\'|\'name\'', s)
+    if not m:
+        return None
+    name_pos = m.start()
+    open_idx = s.rfind('{', 0, name_pos)
+    if open_idx == -1:
+        return None
+    depth = 0
+    for i in range(open_idx, len(s)):
+        if s[i] == '{':
+            depth += 1
+        elif s[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return s[open_idx:i+1]
+    return None
+
+
+def _parse_text_tool_call(content: str) -> Tuple[str, Any] | None:
+    """(tool name, params) for a tool call the model printed as JSON text, if any."""
+    json_blob = _extract_json_blob(content)
+    if not json_blob:
+        return None
+    try:
+        parsed = json.loads(json_blob)
+    except Exception:
+        try:
+            parsed = json.loads(json_blob.replace("'", '"'))
+        except Exception:
+            print("   ❌ Failed to decode JSON blob from model text:")
+            traceback.print_exc()
+            return None
+    if not isinstance(parsed, dict):
+        return None
+    tool_name = parsed.get('name') or parsed.get('tool') or parsed.get('action')
+    if not tool_name:
+        return None
+    params = parsed.get('parameters') or parsed.get('args') or parsed
+    if not isinstance(params, dict):
+        params = {'filename': str(params)} if params else {}
+    return str(tool_name), params
+
+
+# Shared by every agent so the prompt prefix is byte-identical across nodes and
+# steps; keep it free of per-run values (dates, ids, goals) for cache reuse.
+SYSTEM_PROMPT = (
+    "You are a truthful execution agent.\n"
+    "You have access to tools: web_search_tool, file_writer.\n\n"
+    "CRITICAL RULES:\n"
+    "1. You are a truthful execution agent.\n"
+    "2. If you cannot find information, admit it. Do NOT make up facts.\n"
+    "3. You must be SEQUENTIAL. Do NOT call multiple tools at once.\n"
+    "4. If you need to search, call web_search_tool ONLY and record the exact findings.\n"
+    "5. If you write a file, you MUST use data you actually found in step 1.\n"
+    "6. Do NOT output JSON strings in your final answer. Use the tool calling API.\n"
+    "7. Do NOT guess or use placeholders like '[value found]'. If you don't have the value, search again.\n"
+    "8. If the search returns garbage or no results, try a different search query immediately.\n"
+    "9. Your goal is to write REAL data to the file."
+)
+
+
+@lru_cache(maxsize=1)
+def _get_bound_llm():
+    """Build the tool-bound chat model once per process.
+
+    A fixed `num_ctx` matters: Ollama reloads the model whenever it changes,
+    and `keep_alive` keeps the model (and its prompt cache) resident between
+    agent runs instead of unloading it after the default 5 minutes.
+    """
+    from app.services.tools import web_search_tool, file_writer
+    from langchain_ollama import ChatOllama
+
+    # Temperature 0 = Precise.
+    llm = ChatOllama(
+        model=settings.LLM_MODEL,
+        base_url=settings.LLM_ENDPOINT,
+        temperature=0,
+        keep_alive=settings.LLM_KEEP_ALIVE,
+        num_ctx=settings.LLM_NUM_CTX,
+    )
+    return llm.bind_tools([web_search_tool, file_writer])
+
+
+def _tool_calls(msg: Any) -> list:
+    return [{"name": c["name"], "args": c["args"], "id": c.get("id")} for c in getattr(msg, "tool_calls", None) or []]
+
+
+def _llm_request(messages) -> Dict[str, Any]:
+    """The model call as the cassette keys it: model name plus role/content/tool calls per message."""
+    return {
+        "model": "mock" if mock_providers.llm_enabled() else settings.LLM_MODEL,
+        # model replies without a `type` are the mock's; they stand for AI messages
+        "messages": [
+            {"role": getattr(m, "type", "ai"), "content": getattr(m, "content", "") or "", "tool_calls": _tool_calls(m)}
+            for m in messages
+        ],
+    }
+
+
+def _encode_ai_message(ai_msg: Any) -> Dict[str, Any]:
+    return {
+        "content": getattr(ai_msg, "content", "") or "",
+        "tool_calls": _tool_calls(ai_msg),
+        "response_metadata": dict(getattr(ai_msg, "response_metadata", None) or {}),
+    }
+
+
+def _decode_ai_message(data: Dict[str, Any]) -> Any:
+    try:
+        from langchain_core.messages import AIMessage
+        return AIMessage(content=data["content"], tool_calls=data["tool_calls"], response_metadata=data["response_metadata"])
+    except Exception:
+        return SimpleNamespace(**data)
 
 
-async def run_single_agent(goal: str, context: str = "") -> Dict[str, Any]:
+async def _invoke_llm(llm_with_tools, messages):
+    """One model call: wait for a governor slot, then run the blocking invoke off the loop.
+
+    A call abandoned at the agent's deadline keeps its slot until the model
+    server is done with it. Recorded or replayed through the cassette (see
+    app/services/cassette.py).
+    """
+    def invoke(msgs):
+        with metrics.timer("llm_request_seconds", breakdown="llm", source="agent"):
+            return llm_with_tools.invoke(msgs)
+
+    async def live():
+        return await llm_governor.run_blocking("llm", POOL_LLM, invoke, messages)
+
+    return await cassette.call(KIND_AGENT_LLM, _llm_request(messages), live, _encode_ai_message, _decode_ai_message)
+
+
+def _llm_step_timing(step: int, ai_msg: Any, wall_s: float) -> Dict[str, Any]:
+    """Extract Ollama's per-call timings (nanoseconds) from the response metadata."""
+    meta = getattr(ai_msg, "response_metadata", None) or {}
+    ns = 1e-6
+    return {
+        "step": step,
+        "wall_ms": round(wall_s * 1000, 2),
+        "prompt_tokens": meta.get("prompt_eval_count"),
+        "prompt_eval_ms": round(meta["prompt_eval_duration"] * ns, 2) if meta.get("prompt_eval_duration") else None,
+        "eval_ms": round(meta["eval_duration"] * ns, 2) if meta.get("eval_duration") else None,
+        "load_ms": round(meta["load_duration"] * ns, 2) if meta.get("load_duration") else None,
+    }
+
+
+def _accumulate(accumulated: str, output: str, seen: set) -> str:
+    """Append the blocks of a tool output that are not already in `accumulated`."""
+    new_blocks, _ = dedupe_blocks([output], seen)
+    if not new_blocks:
+        return accumulated
+    return accumulated + "\n\n".join(new_blocks) + "\n"
+
+
+async def run_single_agent(
+    goal: str,
+    context: str = "",
+    max_steps: int | None = None,
+    deadline_s: float | None = None,
+    required_effects: Iterable[str] | None = None,
+) -> Dict[str, Any]:
     """
     Run an agent using a MULTI-STEP Loop (The "ReAct" Loop).
     Enforces sequential tool execution and captures raw search outputs
     so they can be propagated to downstream nodes as `search_context`.
+
+    The loop is bounded by `max_steps` LLM calls and a wall-clock `deadline_s`
+    (settings defaults), and exits as soon as every effect in `required_effects`
+    (inferred from the goal when omitted) has been produced by a tool.
     """
     print(f"🚀 run_single_agent called with goal: {goal}")
     if context:
         print(f"📚 Context provided (truncated): {context[:400]}")
 
     try:
-        from app.services.tools import web_search_tool, file_writer, file_writer_raw
-        from langchain_ollama import ChatOllama
+        from app.services.tools import web_search_tool, file_writer
         from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
     except Exception as e:
         return {"status": "error", "detail": "Dependencies missing", "error": str(e)}
 
     # Optionally use a mock LLM for deterministic testing when MOCK_LLM=1
-    import os
-    if os.getenv("MOCK_LLM") == "1":
-        from types import SimpleNamespace
-
-        class MockBound:
-            def __init__(self, tools):
-                self.tools = tools
-                self._step = 0
-
-            def invoke(self, messages):
-                # Return a simple object with `tool_calls` and `content` attributes.
-                # Sequence: 1) web_search_tool, 2) file_writer (no content), 3) stop
-                self._step += 1
-                if self._step == 1:
-                    return SimpleNamespace(tool_calls=[{"name": "web_search_tool", "args": {"query": "hotels in paris"}, "id": "1"}], content="")
-                elif self._step == 2:
-                    return SimpleNamespace(tool_calls=[{"name": "file_writer", "args": {"filename": "hotels.txt"}, "id": "2"}], content="")
-                else:
-                    return SimpleNamespace(tool_calls=[], content="Done")
-
-        class MockLLM:
-            def __init__(self, model=None, temperature=0):
-                self.model = model
-
-            def bind_tools(self, tools):
-                return MockBound(tools)
-
-        llm = MockLLM()
+    if mock_providers.llm_enabled():
+        llm = mock_providers.MockLLM()
         tools = [web_search_tool, file_writer]
         llm_with_tools = llm.bind_tools(tools)
     else:
-        # Temperature 0 = Precise.
-        llm = ChatOllama(model="llama3.1", temperature=0)
         tools = [web_search_tool, file_writer]
-        llm_with_tools = llm.bind_tools(tools)
-
-    # System Prompt (anti-hallucination rules)
-    system_prompt = (
-        "You are a truthful execution agent.\n"
-        "You have access to tools: web_search_tool, file_writer.\n\n"
-        "CRITICAL RULES:\n"
-        "1. You are a truthful execution agent.\n"
-        "2. If you cannot find information, admit it. Do NOT make up facts.\n"
-        "3. You must be SEQUENTIAL. Do NOT call multiple tools at once.\n"
-        "4. If you need to search, call web_search_tool ONLY and record the exact findings.\n"
-        "5. If you write a file, you MUST use data you actually found in step 1.\n"
-        "6. Do NOT output JSON strings in your final answer. Use the tool calling API.\n"
-        "7. Do NOT guess or use placeholders like '[value found]'. If you don't have the value, search again.\n"
-        "8. If the search returns garbage or no results, try a different search query immediately.\n"
-        "9. Your goal is to write REAL data to the file."
-    )
-
-    # If context provided, include it so the model can reference prior raw findings
+        try:
+            llm_with_tools = _get_bound_llm()
+        except Exception as e:
+            if not cassette.replaying():
+                return {"status": "error", "detail": "Dependencies missing", "error": str(e)}
+            llm_with_tools = None  # replayed runs never call the model
+
+    # Stable-prefix layout: the byte-identical system prompt first, then the
+    # parent context (shared by sibling nodes), then the node-specific goal.
+    # Ollama reuses the KV cache for whatever prefix matches its previous prompt.
+    messages = [SystemMessage(content=SYSTEM_PROMPT)]
     if context and isinstance(context, str) and context.strip():
-        user_content = f"GOAL: {goal}\n\n--- CONTEXT FROM PREVIOUS STEPS ---\n{context}"
+        messages.append(HumanMessage(content=f"--- CONTEXT FROM PREVIOUS STEPS ---\n{context}"))
+        messages.append(HumanMessage(content=f"GOAL: {goal}"))
     else:
-        user_content = goal
-
-    messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_content)]
-
-    # Max steps for the loop (shorter to be faster)
-    max_steps = 3
+        messages.append(HumanMessage(content=goal))
+    prefix_len = len(messages)
+
+    budget_steps = max_steps if max_steps is not None else settings.AGENT_MAX_STEPS
+    deadline_s = deadline_s if deadline_s is not None else settings.AGENT_DEADLINE_S
+    deadline = time.monotonic() + deadline_s if deadline_s and deadline_s > 0 else None
+    required = set(required_effects) if required_effects is not None else infer_required_effects(goal)
+    # writing on the agent's behalf only when a file was really asked for
+    may_auto_write = required_effects is not None or _FILENAME_RE.search(goal or "") is not None
+    done_effects: set = set()
     final_answer = ""
 
     # Accumulate tool outputs so downstream nodes receive useful context
     accumulated_data = ""
 
-    # Keep a running search history of raw search outputs (for context passing)
+    # Keep a running search history of raw search outputs (for context passing).
+    # Repeated hits across searches are deduplicated block by block.
     search_history: list[str] = []
-
-    # Track whether the agent successfully wrote a file
-    file_written = False
-
-    stop_now = False
-
-    for step in range(max_steps):
-        print(f"🔄 Step {step + 1}/{max_steps}...")
-
-        try:
-            ai_msg = await asyncio.to_thread(llm_with_tools.invoke, messages)
-        except Exception as e:
-            return {"status": "error", "detail": "LLM crash", "error": str(e)}
-
-        messages.append(ai_msg)
-
-        # CHECK FOR "TEXT-BASED TOOL CALLS" (LLM printed JSON instead of using tool_calls)
-        content = getattr(ai_msg, "content", "") or ""
-        if not getattr(ai_msg, "tool_calls", None) and content and "{" in content and ("name" in content or "parameters" in content):
-            try:
-                # Try to extract a JSON blob that contains a 'name' field and optional 'parameters'
-                def extract_json_blob(s: str):
-                    m = re.search(r'"name"|\'"name"\'|\'name\'', s)
-                    if not m:
-                        return None
-                    name_pos = m.start()
-                    open_idx = s.rfind('{', 0, name_pos)
-                    if open_idx == -1:
-                        return None
-                    depth = 0
-                    for i in range(open_idx, len(s)):
-                        if s[i] == '{':
-                            depth += 1
-                        elif s[i] == '}':
-                            depth -= 1
-                            if depth == 0:
-                                return s[open_idx:i+1]
-                    return None
-
-                json_blob = extract_json_blob(content)
-                if json_blob:
-                    print("⚠️ Text-based tool call detected. Executing...")
-                    try:
-                        parsed = json.loads(json_blob)
-                    except Exception:
-                        try:
-                            parsed = json.loads(json_blob.replace("'", '"'))
-                        except Exception:
-                            print("   ❌ Failed to decode JSON blob from model text:")
-                            traceback.print_exc()
-                            parsed = None
-
-                    if parsed and isinstance(parsed, dict):
-                        tool_name = parsed.get('name') or parsed.get('tool') or parsed.get('action')
-                        params = parsed.get('parameters') or parsed.get('args') or parsed
-
-                        if tool_name:
-                            tool_name_str = str(tool_name)
-                            selected_tool = next((t for t in tools if getattr(t, 'name', getattr(t, '__name__', '')) == tool_name_str), None)
-                            if not selected_tool:
-                                print(f"   ⚠️ Tool named '{tool_name_str}' not found among available tools.")
-                            else:
-                                # If it's a file_writer, ensure content is present; if missing, auto-fill from search_history
-                                if tool_name_str == 'file_writer':
-                                    # Normalize params to a dict for easier manipulation
-                                    if not isinstance(params, dict):
-                                        params = {'filename': str(params)} if params else {}
-
-                                    # If there are no params at all, initialize filename
-                                    if len(params) == 0:
-                                        print("⚠️ Agent called file_writer with no args. Auto-filling filename and content.")
-                                        params['filename'] = params.get('filename') or 'output.txt'
-
-                                    # Check content presence
-                                    content_val = (
-                                        params.get('content')
-                                        or params.get('data')
-                                        or params.get('text')
-                                        or params.get('body')
-                                        or None
-                                    )
-
-                                    if not content_val or (isinstance(content_val, str) and content_val.strip() == ''):
-                                        # Auto-fill from search_history
-                                        print("⚠️ Agent forgot content. Auto-filling with Search History.")
-                                        params['content'] = "\n".join(search_history) if search_history else (accumulated_data or "")
-
-                                    # Execute the raw writer directly (avoid LangChain .invoke issues)
-                                    try:
-                                        res = await asyncio.to_thread(file_writer_raw, **(params if isinstance(params, dict) else {}))
-                                    except ValueError:
-                                        res = "Error: No content provided for file_writer"
-                                    except Exception as e:
-                                        res = f"Error executing file_writer: {e}"
-
-                                    print(f"   <- Executed {tool_name_str} via text-fallback. Result preview: {str(res)[:200]}")
-                                    messages.append(ToolMessage(tool_call_id='text-fallback', content=str(res)))
-                                    try:
-                                        accumulated_data += str(res) + "\n"
-                                    except Exception:
-                                        pass
-                                    # If the writer reported success, mark file_written
-                                    try:
-                                        if isinstance(res, str):
-                                            rl = res.lower()
-                                            if ('success' in rl) or any(k in rl for k in ['write', 'wrote', 'written']):
-                                                file_written = True
-                                    except Exception:
-                                        pass
-                                    continue
-                # if we get here, either no json_blob or execution fell through
-            except Exception:
-                print("   ❌ Error handling text-based tool call:")
-                traceback.print_exc()
-
-        # If we were instructed to stop (e.g., empty file write detected), break the loop
-        if stop_now:
-            print("⚠️ Stopping agent loop due to empty write prevention.")
+    search_seen: set = set()
+    accumulated_seen: set = set()
+
+    # Token accounting reported back with the result
+    token_stats = {"context": count_tokens(context or ""), "prompt_peak": 0, "history_compactions": 0}
+
+    # Per-step prompt processing / generation timings reported by the model server
+    llm_timing: list[Dict[str, Any]] = []
+
+    # What this run spent, and why it stopped
+    counters: Dict[str, Any] = {
+        "llm_calls": 0,
+        "tool_calls": 0,
+        "tool_errors": 0,
+        "kicks": 0,
+        "auto_writes": 0,
+        "max_steps": budget_steps,
+        "required_effects": sorted(required),
+        "stop_reason": "step_budget",
+    }
+    started = time.monotonic()
+
+    def fill_content() -> str:
+        # only what this agent gathered; the parent context belongs to other nodes
+        return "\n".join(search_history) if search_history else accumulated_data
+
+    async def run_tool(name: str, args: Any) -> ToolResult:
+        """Execute one tool call (auto-filling file_writer content) and record its effects."""
+        nonlocal accumulated_data
+        runner = TOOL_RUNNERS.get(name)
+        if name == 'file_writer':
+            # Normalize args to dict
+            if not isinstance(args, dict):
+                args = {'filename': str(args)} if args else {}
+            # Interceptor: if no content present, inject search_history
+            content_present = any(args.get(k) for k in ['content', 'data', 'text', 'body'])
+            if not content_present:
+                print("⚠️ Agent forgot content. Auto-filling with Search History.")
+                args['content'] = fill_content()
+            args.setdefault('filename', 'output.txt')
+
+        with metrics.timer("tool_call_seconds", breakdown=f"tool:{name}", tool=name):
+            if runner is not None:
+                kwargs = args if isinstance(args, dict) else {"query": str(args)}
+                if asyncio.iscoroutinefunction(runner):
+                    result = await runner(**kwargs)
+                else:
+                    result = await run_in(TOOL_POOLS.get(name, POOL_NETWORK), runner, **kwargs)
+            else:
+                selected_tool = next((t for t in tools if getattr(t, "name", getattr(t, "__name__", "")) == name), None)
+                if selected_tool is None:
+                    result = ToolResult(name, False, "Error: Tool not found")
+                else:
+                    result = await run_in(POOL_NETWORK, _execute_tool_safe, selected_tool, args)
+
+        counters["tool_calls"] += 1
+        if not result.ok:
+            counters["tool_errors"] += 1
+        done_effects.update(result.effects)
+        print(f"   <- Result: {result.output[:100]}...")
+
+        # accumulate tool output for downstream nodes
+        accumulated_data = _accumulate(accumulated_data, result.output, accumulated_seen)
+        # capture web_search outputs into search history specifically
+        if EFFECT_SEARCHED in result.effects:
+            new_blocks, _ = dedupe_blocks([result.output], search_seen)
+            if new_blocks:
+                search_history.append("\n\n".join(new_blocks))
+        return result
+
+    for step in range(budget_steps):
+        # Early exit: everything the goal needed from tools has happened, so the
+        # extra "I'm done" round-trip to the model would be wasted.
+        if required and required <= done_effects:
+            print("✅ Required tool effects done; stopping early.")
+            counters["stop_reason"] = "effects_done"
             break
 
-        if not getattr(ai_msg, "tool_calls", None) and not final_answer:
-            # Self-Correction "Kick": if the goal suggests saving and we haven't written the file yet,
-            # force the agent to try again instead of exiting.
-            lower_goal = (goal or "").lower()
-            if any(k in lower_goal for k in ["save", "write", "file"]) and not file_written:
-                print("⚠️ Agent tried to quit without saving. Forcing retry...")
-                messages.append(HumanMessage(content="SYSTEM ALERT: You have NOT saved the file yet. You are NOT done. Call file_writer now."))
-                continue
-
-            print("✅ Agent decided to stop.")
-            final_answer = ai_msg.content
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            print("⏱️ Agent deadline reached.")
+            counters["stop_reason"] = "deadline"
             break
 
-        # --- FORCE SEQUENTIAL EXECUTION ---
-        if getattr(ai_msg, "tool_calls", None):
+        print(f"🔄 Step {step + 1}/{budget_steps}...")
+        with tracing.span(f"step {step + 1}", "agent_step"):
+            # Keep the history inside its token budget before every LLM call
+            compaction = compact_messages(messages, settings.AGENT_HISTORY_TOKEN_BUDGET, protected=prefix_len)
+            token_stats["history_compactions"] += compaction["compacted_messages"]
+            token_stats["prompt_peak"] = max(token_stats["prompt_peak"], compaction["after_tokens"])
+
+            try:
+                t0 = time.perf_counter()
+                counters["llm_calls"] += 1
+                ai_msg = await asyncio.wait_for(_invoke_llm(llm_with_tools, messages), timeout=remaining)
+                llm_timing.append(_llm_step_timing(step + 1, ai_msg, time.perf_counter() - t0))
+            except asyncio.TimeoutError:
+                print("⏱️ Agent deadline reached while waiting for the LLM.")
+                counters["stop_reason"] = "deadline"
+                break
+            except Exception as e:
+                counters["elapsed_s"] = round(time.monotonic() - started, 3)
+                return {"status": "error", "detail": "LLM crash", "error": str(e), "counters": counters}
+
+            messages.append(ai_msg)
+
+            # CHECK FOR "TEXT-BASED TOOL CALLS" (LLM printed JSON instead of using tool_calls)
+            content = getattr(ai_msg, "content", "") or ""
+            if not getattr(ai_msg, "tool_calls", None) and content and "{" in content and ("name" in content or "parameters" in content):
+                try:
+                    parsed = _parse_text_tool_call(content)
+                    if parsed:
+                        tool_name_str, params = parsed
+                        selected_tool = next((t for t in tools if getattr(t, 'name', getattr(t, '__name__', '')) == tool_name_str), None)
+                        if not selected_tool:
+                            print(f"   ⚠️ Tool named '{tool_name_str}' not found among available tools.")
+                        elif tool_name_str == 'file_writer':
+                            # Execute the writer directly (avoid LangChain .invoke issues)
+                            print("⚠️ Text-based tool call detected. Executing...")
+                            res = await run_tool(tool_name_str, params)
+                            messages.append(ToolMessage(tool_call_id='text-fallback', content=res.output))
+                            continue
+                except Exception:
+                    print("   ❌ Error handling text-based tool call:")
+                    traceback.print_exc()
+
+            if not getattr(ai_msg, "tool_calls", None):
+                missing = required - done_effects
+                if EFFECT_FILE_WRITTEN in missing:
+                    payload = fill_content() if may_auto_write else ""
+                    if payload.strip():
+                        # Safety net without another model round-trip: the agent has data
+                        # but skipped the write, so write it for the agent.
+                        print("⚠️ Agent tried to quit without saving. Writing collected data for it.")
+                        counters["auto_writes"] += 1
+                        res = await run_tool('file_writer', {'filename': _goal_filename(goal), 'content': payload})
+                        if res.ok:
+                            counters["stop_reason"] = "effects_done"
+                            final_answer = ai_msg.content
+                            break
+                    if counters["kicks"] < 1 and step + 1 < budget_steps:
+                        # Nothing to write yet: one nudge at most, and only if a step remains to act on it
+                        print("⚠️ Agent tried to quit without saving. Forcing retry...")
+                        counters["kicks"] += 1
+                        messages.append(HumanMessage(content="SYSTEM ALERT: You have NOT saved the file yet. You are NOT done. Call file_writer now."))
+                        continue
+
+                print("✅ Agent decided to stop.")
+                counters["stop_reason"] = "agent_stopped"
+                final_answer = ai_msg.content
+                break
+
+            # --- FORCE SEQUENTIAL EXECUTION ---
             print(f"🛠️ Model requested {len(ai_msg.tool_calls)} tools. Executing ONLY the first one.")
 
             # Take only the first tool call
             tool_call = ai_msg.tool_calls[0]
-
             tool_name = tool_call["name"]
             tool_args = tool_call["args"]
             print(f"   -> Calling {tool_name} with {tool_args}")
 
-            selected_tool = next((t for t in tools if getattr(t, "name", getattr(t, "__name__", "")) == tool_name), None)
-            if selected_tool:
-                tool_output = None
-                # Interceptor: if calling file_writer, ensure content exists and auto-fill from search_history if missing
-                if tool_name == 'file_writer':
-                    # Normalize tool_args to dict
-                    if not isinstance(tool_args, dict):
-                        tool_args = {'filename': str(tool_args)} if tool_args else {}
-
-                    # If no content present, inject search_history
-                    content_present = any(k in tool_args for k in ['content', 'data', 'text', 'body']) and bool(tool_args.get('content'))
-                    if not content_present:
-                        print("⚠️ Agent forgot content. Auto-filling with Search History.")
-                        tool_args['content'] = "\n".join(search_history) if search_history else (accumulated_data or "")
-
-                    # If tool_args is empty entirely, return explicit error (shouldn't happen due to injection)
-                    if not tool_args:
-                        tool_output = "Error: You called file_writer with no arguments. You MUST provide 'filename' and 'content'."
-                        print(f"   <- {tool_output}")
-                    else:
-                        # Call the raw writer directly to avoid LangChain tool.invoke positional/kw mismatch
-                        try:
-                            tool_output = await asyncio.to_thread(file_writer_raw, **(tool_args if isinstance(tool_args, dict) else {}))
-                        except ValueError:
-                            tool_output = "Error: No content provided for file_writer"
-                        except Exception as e:
-                            tool_output = f"Error executing file_writer: {e}"
-
-                        print(f"   <- Result: {str(tool_output)[:100]}...")
-                        try:
-                            if isinstance(tool_output, str):
-                                rl = tool_output.lower()
-                                if ('success' in rl) or any(k in rl for k in ['write', 'wrote', 'written']):
-                                    file_written = True
-                        except Exception:
-                            pass
-                else:
-                    # normal tool execution
-                    tool_output = await asyncio.to_thread(_execute_tool_safe, selected_tool, tool_args)
-                    print(f"   <- Result: {str(tool_output)[:100]}...")
+            res = await run_tool(tool_name, tool_args)
+            messages.append(ToolMessage(tool_call_id=tool_call["id"], content=res.output))
 
-                messages.append(ToolMessage(tool_call_id=tool_call["id"], content=str(tool_output)))
-                # accumulate tool output for downstream nodes
-                try:
-                    accumulated_data += str(tool_output) + "\n"
-                except Exception:
-                    pass
-                # capture web_search outputs into search history specifically
-                try:
-                    if tool_name == 'web_search_tool' or tool_call.get('name') == 'web_search_tool':
-                        search_history.append(str(tool_output))
-                except Exception:
-                    pass
+            if len(ai_msg.tool_calls) > 1:
+                print("   ⚠️ Dropped extra tool calls.")
+    else:
+        if required and required <= done_effects:
+            counters["stop_reason"] = "effects_done"
 
-                if len(ai_msg.tool_calls) > 1:
-                    print("   ⚠️ Dropped extra tool calls.")
-            else:
-                messages.append(ToolMessage(tool_call_id=tool_call["id"], content="Error: Tool not found"))
+    counters["effects"] = sorted(done_effects)
+    counters["elapsed_s"] = round(time.monotonic() - started, 3)
 
     # If the model didn't produce a meaningful final answer, prefer accumulated tool output
     final_answer_trim = (final_answer or "").strip()
     generic_phrases = ["task completed.", "task completed", "ok", "done"]
     search_context_text = "\n".join(search_history) if search_history else accumulated_data
+    token_stats["search_context"] = count_tokens(search_context_text)
 
+    extras = {"search_context": search_context_text, "tokens": token_stats, "llm_timing": llm_timing, "counters": counters}
     if (not final_answer_trim) or (final_answer_trim.lower() in generic_phrases):
         if accumulated_data.strip():
-            return {"status": "ok", "result": accumulated_data, "search_context": search_context_text}
+            return {"status": "ok", "result": accumulated_data, **extras}
         else:
-            return {"status": "ok", "result": final_answer or "Task completed.", "search_context": search_context_text}
+            return {"status": "ok", "result": final_answer or "Task completed.", **extras}
     else:
-        return {"status": "ok", "result": final_answer, "search_context": search_context_text}
\ No newline at end of file
+        return {"status": "ok", "result": final_answer, **extras}
@@ -0,0 +1,127 @@
+"""Micro-batching of blocking model calls.
+
+A single in-process model (the transformers fallback generator) serves one
+call at a time, so concurrent callers used to queue behind each other. A
+MicroBatcher collects the requests that arrive within `max_wait_s` of the
+first one (at most `max_batch`), runs them as one batch on an executor pool
+and resolves every caller's future with its own result:
+
+    batcher = MicroBatcher("generate", generate_batch, max_batch=8, max_wait_s=0.01)
+    text = await batcher.submit(prompt)
+
+Batches run one at a time; requests arriving while a batch runs form the next
+one. A caller that is cancelled while queued is dropped from its batch.
+"""
+import asyncio
+import contextvars
+import time
+from collections import deque
+from typing import Any, Callable, Deque, List, Sequence, Tuple
+
+from app.services import metrics
+from app.services.executors import POOL_LLM, run_in
+
+_batch_size = metrics.registry.histogram("batch_size", "Requests per micro-batch", buckets=(1, 2, 4, 8, 16, 32, 64))
+metrics.registry.histogram("batch_queue_wait_seconds", "Time a request waited for its micro-batch to start")
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], Sequence[Any]],
+        max_batch: int,
+        max_wait_s: float,
+        pool: str = POOL_LLM,
+    ):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max(int(max_batch), 1)
+        self.max_wait_s = max(float(max_wait_s), 0.0)
+        self.pool = pool
+        self._pending: Deque[Tuple[Any, asyncio.Future, float]] = deque()
+        self._arrived: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_worker(self, loop: asyncio.AbstractEventLoop) -> None:
+        # the worker belongs to one event loop; a new loop (tests, benchmarks) gets a new worker
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._arrived = asyncio.Event()
+            self._pending.clear()
+            # started in an empty context so the first caller's execution/node-breakdown
+            # ContextVars are not inherited by every later batch
+            self._worker = contextvars.Context().run(loop.create_task, self._run())
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        self._ensure_worker(loop)
+        fut = loop.create_future()
+        self._pending.append((item, fut, time.monotonic()))
+        self._arrived.set()
+        return await fut
+
+    async def close(self) -> None:
+        """Stop the worker; requests still queued are cancelled."""
+        worker, self._worker = self._worker, None
+        if worker is not None and not worker.done():
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        while self._pending:
+            self._pending.popleft()[1].cancel()
+
+    async def _wait_for_more(self, timeout: float) -> bool:
+        self._arrived.clear()
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        while not self._pending:
+            self._arrived.clear()
+            await self._arrived.wait()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_s
+        batch = []
+        while len(batch) < self.max_batch:
+            if self._pending:
+                entry = self._pending.popleft()
+                if not entry[1].done():  # skip callers cancelled while queued
+                    batch.append(entry)
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0 or not await self._wait_for_more(remaining):
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            started = time.monotonic()
+            for _, _, queued in batch:
+                metrics.record("batch_queue_wait_seconds", started - queued, batcher=self.name)
+            _batch_size.observe(len(batch), batcher=self.name)
+            try:
+                results = await run_in(self.pool, self.run_batch, [item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch of {len(batch)} returned {len(results)} results")
+            except asyncio.CancelledError:
+                for _, fut, _ in batch:
+                    fut.cancel()
+                raise
+            except Exception as e:
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut, _), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
@@ -0,0 +1,208 @@
+"""Record/replay of LLM, web search and embedding calls ("cassettes").
+
+With CASSETTE_MODE:
+
+    off      every call goes to its backend (default)
+    record   calls go to their backend and each request/response pair is
+             appended to the JSONL cassette at CASSETTE_PATH (under data/)
+    replay   calls are served from the cassette and never reach a backend
+
+Requests are keyed by a hash of their kind and a normalised form of the
+request: JSON with sorted keys, whitespace runs collapsed, the data directory
+replaced by "<data>" and volatile ids (tool-call ids) dropped, so a recorded
+graph replays on another machine. A request recorded several times is served
+its responses in recorded order, wrapping around, so a run can be replayed
+any number of times. Replay sleeps for the recorded duration times
+CASSETTE_LATENCY_SCALE (0 = as fast as possible, 1 = recorded speed); a
+request missing from the cassette raises CassetteMiss, or falls through to
+the live backend with CASSETTE_ALLOW_MISSES.
+
+Keys include the backend (model name, or "mock" for the mock providers), so
+replay with the same configuration the cassette was recorded under. Record
+appends to an existing cassette; delete the file to record afresh.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+from app.config import settings
+from app.services import metrics
+from app.services.executors import POOL_DISK, run_in
+from app.services.file_output import append_text, data_dir, resolve_path
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODES = (MODE_OFF, MODE_RECORD, MODE_REPLAY)
+
+KIND_LLM = "llm"
+KIND_AGENT_LLM = "agent_llm"
+KIND_WEB_SEARCH = "web_search"
+KIND_EMBEDDING = "embedding"
+
+# Ids the backend makes up per call; they differ between recording and replay
+_VOLATILE_KEYS = {"id", "tool_call_id"}
+
+_hits = metrics.registry.counter("cassette_hits_total", "Calls served from the replay cassette")
+_misses = metrics.registry.counter("cassette_misses_total", "Replayed calls missing from the cassette")
+_recorded = metrics.registry.counter("cassette_recorded_total", "Calls recorded to the cassette")
+metrics.registry.histogram("cassette_replay_seconds", "Time spent serving a call from the cassette")
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def mode() -> str:
+    value = (settings.CASSETTE_MODE or MODE_OFF).lower()
+    return value if value in MODES else MODE_OFF
+
+
+def replaying() -> bool:
+    return mode() == MODE_REPLAY
+
+
+def _normalize(value: Any, data_prefix: str) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.replace(data_prefix, "<data>").split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v, data_prefix) for k, v in sorted(value.items(), key=lambda kv: str(kv[0])) if k not in _VOLATILE_KEYS}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v, data_prefix) for v in value]
+    if isinstance(value, float):
+        return round(value, 6)
+    if value is None or isinstance(value, (int, bool)):
+        return value
+    return _normalize(str(value), data_prefix)
+
+
+def request_key(kind: str, request: Any) -> str:
+    canonical = json.dumps({"kind": kind, "request": _normalize(request, str(data_dir()))}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: str | None = None
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._served: Dict[str, int] = defaultdict(int)
+
+    def _load(self) -> None:
+        """(Re)read the cassette when CASSETTE_PATH changed since the last load."""
+        path = settings.CASSETTE_PATH
+        with self._lock:
+            if self._path == path:
+                return
+            entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            try:
+                with open(resolve_path(path), encoding="utf-8") as fh:
+                    for line in fh:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries[entry["key"]].append(entry)
+            except FileNotFoundError:
+                pass
+            self._entries, self._served, self._path = entries, defaultdict(int), path
+            print(f"📼 Loaded cassette {path}: {sum(len(v) for v in entries.values())} recorded calls")
+
+    def lookup(self, kind: str, request: Any) -> Dict[str, Any] | None:
+        self._load()
+        key = request_key(kind, request)
+        with self._lock:
+            recorded = self._entries.get(key)
+            if not recorded:
+                return None
+            entry = recorded[self._served[key] % len(recorded)]
+            self._served[key] += 1
+            return entry
+
+    def _entry_line(self, kind: str, request: Any, response: Any, duration_s: float) -> str:
+        entry = {
+            "key": request_key(kind, request),
+            "kind": kind,
+            "request": request,
+            "response": response,
+            "duration_s": round(duration_s, 6),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+        }
+        return json.dumps(entry, default=str) + "\n"
+
+    def _miss(self, kind: str, request: Any) -> None:
+        _misses.inc(kind=kind)
+        if not settings.CASSETTE_ALLOW_MISSES:
+            raise CassetteMiss(f"{kind} request not in cassette {settings.CASSETTE_PATH}: {json.dumps(request, default=str)[:200]}")
+
+    @staticmethod
+    def _delay(entry: Dict[str, Any]) -> float:
+        return max(float(entry.get("duration_s") or 0.0) * settings.CASSETTE_LATENCY_SCALE, 0.0)
+
+    async def call(
+        self,
+        kind: str,
+        request: Any,
+        live: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = lambda r: r,
+        decode: Callable[[Any], Any] = lambda r: r,
+    ) -> Any:
+        """Serve `request` from the cassette, or await `live()` (recording it in record mode).
+
+        `encode` turns the live response into JSON and `decode` turns it back.
+        """
+        current = mode()
+        if current == MODE_REPLAY:
+            t0 = time.perf_counter()
+            if self._path != settings.CASSETTE_PATH:
+                await run_in(POOL_DISK, self._load)
+            entry = self.lookup(kind, request)
+            if entry is not None:
+                delay = self._delay(entry)
+                if delay:
+                    await asyncio.sleep(delay)
+                _hits.inc(kind=kind)
+                metrics.record("cassette_replay_seconds", time.perf_counter() - t0, breakdown=f"replay:{kind}", kind=kind)
+                return decode(entry["response"])
+            self._miss(kind, request)
+        t0 = time.perf_counter()
+        response = await live()
+        if current == MODE_RECORD:
+            line = self._entry_line(kind, request, encode(response), time.perf_counter() - t0)
+            await run_in(POOL_DISK, append_text, settings.CASSETTE_PATH, line)
+            _recorded.inc(kind=kind)
+        return response
+
+    def call_sync(
+        self,
+        kind: str,
+        request: Any,
+        live: Callable[[], Any],
+        encode: Callable[[Any], Any] = lambda r: r,
+        decode: Callable[[Any], Any] = lambda r: r,
+    ) -> Any:
+        """`call` for blocking code running on an executor thread (web search)."""
+        current = mode()
+        if current == MODE_REPLAY:
+            t0 = time.perf_counter()
+            entry = self.lookup(kind, request)
+            if entry is not None:
+                delay = self._delay(entry)
+                if delay:
+                    time.sleep(delay)
+                _hits.inc(kind=kind)
+                metrics.record("cassette_replay_seconds", time.perf_counter() - t0, breakdown=f"replay:{kind}", kind=kind)
+                return decode(entry["response"])
+            self._miss(kind, request)
+        t0 = time.perf_counter()
+        response = live()
+        if current == MODE_RECORD:
+            append_text(settings.CASSETTE_PATH, self._entry_line(kind, request, encode(response), time.perf_counter() - t0))
+            _recorded.inc(kind=kind)
+        return response
+
+
+cassette = Cassette()
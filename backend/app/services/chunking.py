@@ -0,0 +1,231 @@
+"""Pluggable text chunking strategies for document ingestion.
+
+Every strategy is a generator: it consumes an iterable of text pieces (file
+blocks, PDF pages, ...) and yields chunks as soon as they are complete, so a
+document never has to be materialised as a list of chunks before embedding.
+
+Strategies:
+    fixed      legacy fixed-width character windows (kept as a baseline)
+    sentence   packs whole sentences up to `chunk_size` characters
+    paragraph  packs whole paragraphs, falling back to sentences for long ones
+    token      packs whole words up to `chunk_size` approximate tokens
+
+Overlap is expressed in the same unit as the size and is always made of whole
+units (sentences / paragraphs / words), so chunks never start mid-word.
+"""
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from app.services.utils import count_tokens
+
+TextSource = Union[str, Iterable[str]]
+
+# (chunk_size, overlap) per strategy when not configured explicitly
+DEFAULTS: Dict[str, Tuple[int, int]] = {
+    "fixed": (800, 200),
+    "sentence": (800, 120),
+    "paragraph": (1200, 0),
+    "token": (200, 20),
+}
+
+# Units keep their trailing whitespace so chunks can be re-joined losslessly.
+_SENTENCE_END = r"[.!?][\"')\]]*(?:\s+|$)|\n\s*\n"
+_PARAGRAPH_END = r"\n[ \t]*\n\s*"
+_WORD_RE = re.compile(r"\S+\s*")
+_SENTENCE_RE = re.compile(rf".+?(?:{_SENTENCE_END}|$)", re.DOTALL)
+_PARAGRAPH_RE = re.compile(rf".+?(?:{_PARAGRAPH_END}|$)", re.DOTALL)
+
+# Where each unit pattern's units end; a stream is only searched for these in new text
+_UNIT_ENDS: Dict["re.Pattern[str]", "re.Pattern[str]"] = {
+    _WORD_RE: re.compile(r"\s+"),
+    _SENTENCE_RE: re.compile(_SENTENCE_END),
+    _PARAGRAPH_RE: re.compile(_PARAGRAPH_END),
+}
+# Every character a unit end can consist of
+_END_CHARS = frozenset(".!?\"')]")
+
+
+def _as_pieces(source: TextSource) -> Iterator[str]:
+    if isinstance(source, str):
+        yield source
+    else:
+        for piece in source:
+            if piece:
+                yield piece
+
+
+def _is_end_char(ch: str) -> bool:
+    return ch in _END_CHARS or ch.isspace()
+
+
+def _units_in(text: str, pattern: "re.Pattern[str]", start: int = 0, end: int | None = None) -> Iterator[str]:
+    for m in pattern.finditer(text, start, len(text) if end is None else end):
+        if m.group(0):
+            yield m.group(0)
+
+
+def _iter_units(source: TextSource, pattern: "re.Pattern[str]") -> Iterator[str]:
+    """Split a stream of text into units, buffering across piece boundaries.
+
+    Yields the same units as `pattern.finditer` over the whole text. A unit end
+    is only final once a character that cannot belong to it follows; the text
+    after the last final end is held back, and the next piece is searched from
+    the trailing run of end characters instead of from the unit's start, so a
+    long unterminated unit is not rescanned for every piece.
+    """
+    ends = _UNIT_ENDS[pattern]
+    held: List[str] = []  # start of the pending unit, already searched
+    buf = ""
+    for piece in _as_pieces(source):
+        buf += piece
+        # everything from `cut` on may still grow into a different unit end
+        cut, low = len(buf), len(buf) - len(piece)
+        while cut > low and _is_end_char(buf[cut - 1]):
+            cut -= 1
+        if cut == low:
+            cut = 0  # the held-back tail is all end characters too
+        start, pos = 0, 0 if held else 1
+        while True:
+            m = ends.search(buf, pos)
+            if m is None or m.end() >= cut:
+                break
+            if held:
+                yield from _units_in("".join(held) + buf[:m.end()], pattern)
+                held = []
+            else:
+                yield from _units_in(buf, pattern, start, m.end())
+            start, pos = m.end(), m.end() + 1
+        # a later unit end can only start at or after `keep`; text before it is settled
+        keep = max(cut, pos)
+        if keep > start:
+            held.append(buf[start:keep])
+        buf = buf[keep:]
+    rest = "".join(held) + buf
+    if rest:
+        yield from _units_in(rest, pattern)
+
+
+def _split_oversized(unit: str, size: int, measure: Callable[[str], int]) -> Iterator[str]:
+    """Break a unit bigger than `size` on word boundaries (chars as last resort)."""
+    current = ""
+    for word in _WORD_RE.findall(unit) or [unit]:
+        if measure(word) > size:
+            if current:
+                yield current
+                current = ""
+            # A single "word" larger than a chunk (e.g. base64 blob): hard split.
+            step = max(size, 1)
+            for i in range(0, len(word), step):
+                yield word[i:i + step]
+            continue
+        if current and measure(current + word) > size:
+            yield current
+            current = ""
+        current += word
+    if current:
+        yield current
+
+
+def _pack(units: Iterable[str], size: int, overlap: int, measure: Callable[[str], int]) -> Iterator[str]:
+    """Greedily pack units into chunks of at most `size`, carrying whole-unit overlap."""
+    window: List[str] = []
+    window_len = 0
+
+    def expand(u: str) -> Iterator[str]:
+        if measure(u) > size:
+            yield from _split_oversized(u, size, measure)
+        else:
+            yield u
+
+    for raw in units:
+        for unit in expand(raw):
+            ulen = measure(unit)
+            if window and window_len + ulen > size:
+                chunk = "".join(window).strip()
+                if chunk:
+                    yield chunk
+                # keep trailing units that fit in the overlap budget
+                carried: List[str] = []
+                carried_len = 0
+                for prev in reversed(window):
+                    plen = measure(prev)
+                    if carried_len + plen > overlap or carried_len + plen + ulen > size:
+                        break
+                    carried.insert(0, prev)
+                    carried_len += plen
+                window, window_len = carried, carried_len
+            window.append(unit)
+            window_len += ulen
+
+    if window:
+        chunk = "".join(window).strip()
+        if chunk:
+            yield chunk
+
+
+def chunk_fixed(source: TextSource, chunk_size: int = 800, overlap: int = 200) -> Iterator[str]:
+    """Legacy fixed-width windows: `chunk_size` chars advancing by `chunk_size - overlap`."""
+    step = max(chunk_size - overlap, 1)
+    buf = ""
+    for piece in _as_pieces(source):
+        buf += piece
+        while len(buf) >= chunk_size:
+            chunk = buf[:chunk_size].strip()
+            if chunk:
+                yield chunk
+            buf = buf[step:]
+    # flush the tail the same way the old while-loop did
+    i = 0
+    while i < len(buf):
+        chunk = buf[i:i + chunk_size].strip()
+        if chunk:
+            yield chunk
+        i += step
+
+
+def chunk_sentences(source: TextSource, chunk_size: int = 800, overlap: int = 120) -> Iterator[str]:
+    return _pack(_iter_units(source, _SENTENCE_RE), chunk_size, overlap, len)
+
+
+def chunk_paragraphs(source: TextSource, chunk_size: int = 1200, overlap: int = 0) -> Iterator[str]:
+    def units() -> Iterator[str]:
+        for para in _iter_units(source, _PARAGRAPH_RE):
+            if len(para) > chunk_size:
+                # long paragraph: degrade to sentence units instead of hard splits
+                yield from _iter_units(para, _SENTENCE_RE)
+            else:
+                yield para
+
+    return _pack(units(), chunk_size, overlap, len)
+
+
+def chunk_tokens(source: TextSource, chunk_size: int = 200, overlap: int = 20) -> Iterator[str]:
+    return _pack(_iter_units(source, _WORD_RE), chunk_size, overlap, count_tokens)
+
+
+STRATEGIES: Dict[str, Callable[..., Iterator[str]]] = {
+    "fixed": chunk_fixed,
+    "sentence": chunk_sentences,
+    "paragraph": chunk_paragraphs,
+    "token": chunk_tokens,
+}
+
+
+def iter_chunks(
+    source: TextSource,
+    strategy: str = "sentence",
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+) -> Iterator[str]:
+    """Yield chunks of `source` using the named strategy.
+
+    `chunk_size` / `overlap` default to the strategy's entry in DEFAULTS.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}'. Choose from: {', '.join(STRATEGIES)}")
+    default_size, default_overlap = DEFAULTS[strategy]
+    size = chunk_size or default_size
+    ov = default_overlap if overlap is None else overlap
+    if ov >= size:
+        raise ValueError("chunk overlap must be smaller than chunk size")
+    return STRATEGIES[strategy](source, size, ov)
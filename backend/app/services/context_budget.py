@@ -0,0 +1,166 @@
+"""Token budgeting for agent prompts.
+
+Two places make prompts grow without bound in deep or wide graphs:
+
+* parent -> child propagation: a child receives every parent's raw
+  `search_context` plus its `result`, which usually repeat the same text;
+* the ReAct loop history: every tool output stays in `messages` forever.
+
+`build_parent_context` deduplicates parent content block by block and fits it
+into a per-node token budget; `compact_messages` shrinks old tool outputs in
+the message history once it exceeds its budget. Both report token counts so
+the saving is visible in result events.
+"""
+import hashlib
+import re
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from app.services.utils import count_tokens, truncate_to_tokens
+
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+_WS_RE = re.compile(r"\s+")
+
+# Tool outputs older than the latest one are shrunk to this many tokens first.
+COMPACTED_TOOL_TOKENS = 64
+
+
+def _block_key(block: str) -> str:
+    norm = _WS_RE.sub(" ", block).strip().lower()
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+
+def split_blocks(text: str) -> List[str]:
+    """Split text into blank-line separated blocks (one search hit, one paragraph...)."""
+    return [b.strip() for b in _BLOCK_SPLIT_RE.split(text or "") if b.strip()]
+
+
+def dedupe_blocks(texts: Iterable[str], seen: set | None = None) -> Tuple[List[str], int]:
+    """Return the blocks of `texts` not seen before, plus the number dropped.
+
+    `seen` is updated in place so callers can dedupe across several calls.
+    """
+    seen = set() if seen is None else seen
+    kept: List[str] = []
+    dropped = 0
+    for text in texts:
+        for block in split_blocks(text):
+            key = _block_key(block)
+            if key in seen:
+                dropped += 1
+                continue
+            seen.add(key)
+            kept.append(block)
+    return kept, dropped
+
+
+def _parent_sections(p_res: Any) -> Tuple[str, str]:
+    """(summary, raw findings) for a parent result in the shape run_single_agent returns."""
+    if isinstance(p_res, dict):
+        summary = str(p_res["result"]) if p_res.get("result") else str(p_res)
+        return summary, str(p_res.get("search_context") or "")
+    return str(p_res), ""
+
+
+def build_parent_context(parent_results: Sequence[Tuple[str, Any]], budget_tokens: int) -> Tuple[str, Dict[str, Any]]:
+    """Merge parent outputs into one context string that fits `budget_tokens`.
+
+    Summaries are kept ahead of raw findings: each parent first spends its share
+    of the budget on its `result`, and what is left goes to raw findings blocks
+    that no other parent (or its own summary) already contributed. Unused share
+    rolls over to the next parent.
+    """
+    seen: set = set()
+    input_tokens = 0
+    dropped = 0
+    prepared: List[Tuple[List[str], List[str]]] = []
+    for _pid, p_res in parent_results:
+        if p_res is None:
+            # parent was skipped or produced nothing
+            continue
+        summary, raw = _parent_sections(p_res)
+        input_tokens += count_tokens(summary) + count_tokens(raw)
+        summary_blocks, d1 = dedupe_blocks([summary], seen)
+        raw_blocks, d2 = dedupe_blocks([raw], seen)
+        dropped += d1 + d2
+        prepared.append((summary_blocks, raw_blocks))
+
+    parts: List[str] = []
+    remaining = max(budget_tokens, 0)
+    truncated = False
+    for i, (summary_blocks, raw_blocks) in enumerate(prepared):
+        share = remaining // (len(prepared) - i)
+        spent = 0
+        sections = [("", summary_blocks), ("Previous Step Raw Findings:\n", raw_blocks)]
+        for header, blocks in sections:
+            if not blocks:
+                continue
+            text = header + "\n\n".join(blocks)
+            allowance = share - spent
+            if allowance <= 0:
+                truncated = True
+                continue
+            tokens = count_tokens(text)
+            if tokens > allowance:
+                text = truncate_to_tokens(text, allowance)
+                tokens = allowance
+                truncated = True
+            parts.append(text)
+            spent += tokens
+        remaining -= spent
+
+    context = "\n---\n".join(parts)
+    stats = {
+        "parents": len(parent_results),
+        "budget_tokens": budget_tokens,
+        "input_tokens": input_tokens,
+        "output_tokens": count_tokens(context),
+        "deduplicated_blocks": dropped,
+        "truncated": truncated,
+    }
+    return context, stats
+
+
+def _message_text(m: Any) -> str:
+    content = getattr(m, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+def _set_message_text(m: Any, text: str) -> None:
+    try:
+        m.content = text
+    except Exception:
+        pass
+
+
+def messages_tokens(messages: Sequence[Any]) -> int:
+    return sum(count_tokens(_message_text(m)) for m in messages)
+
+
+def compact_messages(messages: List[Any], budget_tokens: int, protected: int = 2) -> Dict[str, int]:
+    """Shrink the ReAct history in place until it fits `budget_tokens`.
+
+    The first `protected` messages (system prompt + goal) and the most recent
+    message are never touched. Older tool / alert messages are truncated to
+    COMPACTED_TOOL_TOKENS, oldest first, and then dropped to a stub if that is
+    still not enough. Returns before/after token counts.
+    """
+    before = messages_tokens(messages)
+    total = before
+    compacted = 0
+    candidates = [i for i in range(protected, len(messages) - 1) if not getattr(messages[i], "tool_calls", None)]
+
+    for limit in (COMPACTED_TOOL_TOKENS, 0):
+        for i in candidates:
+            if total <= budget_tokens:
+                break
+            m = messages[i]
+            text = _message_text(m)
+            old = count_tokens(text)
+            if old <= limit:
+                continue
+            new_text = truncate_to_tokens(text, limit) if limit else "[compacted]"
+            _set_message_text(m, new_text)
+            total += count_tokens(new_text) - old
+            compacted += 1
+
+    return {"before_tokens": before, "after_tokens": total, "compacted_messages": compacted}
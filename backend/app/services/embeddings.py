@@ -1,7 +1,18 @@
 import shutil
 import subprocess
-from typing import List
+import time
+from typing import List, Sequence, Tuple
 import numpy as np
+from sqlalchemy import select
+
+from app.config import settings
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import metrics, mock_providers
+from app.services.cassette import KIND_EMBEDDING, cassette
+from app.services.executors import POOL_CPU, POOL_DISK, POOL_LLM, run_in
+from app.services.hashed_embeddings import hashed_embedder
+from app.services.llm_governor import llm_governor
 
 _HAS_OLLAMA = shutil.which("ollama") is not None
 
@@ -11,43 +22,161 @@ try:
 except Exception:
     _HF_MODEL = None
 
+# EMBEDDING_BACKEND values. "auto" tries Ollama, then sentence-transformers, then
+# the hashed n-gram embedder; "histogram" is the old 128-bin character histogram,
+# kept for databases whose vectors were stored with it.
+BACKEND_AUTO = "auto"
+BACKEND_HASHED = "hashed"
+BACKEND_HISTOGRAM = "histogram"
+HISTOGRAM_DIM = 128
+
+# Dimension of the stored chunk embeddings, read once when "auto" falls back to an
+# in-process backend and set by the first ingest into an empty corpus
+_corpus_dim: int | None = None
+_corpus_checked = False
+
+
+def _auto_is_local() -> bool:
+    backend = (settings.EMBEDDING_BACKEND or BACKEND_AUTO).lower()
+    if backend in (BACKEND_HASHED, BACKEND_HISTOGRAM):
+        return False
+    return not (mock_providers.embeddings_enabled() or _HAS_OLLAMA or _HF_MODEL is not None)
+
 
-async def generate_embedding(text: str) -> List[float]:
+async def _check_corpus_dim() -> None:
+    global _corpus_dim, _corpus_checked
+    if _corpus_checked or not _auto_is_local():
+        return
+    _corpus_checked = True
+    async with AsyncSessionLocal() as session:
+        emb = (await session.execute(select(models.DocumentChunk.embedding).limit(1))).scalar()
+    if emb:
+        _corpus_dim = len(emb)
+    if _corpus_dim == HISTOGRAM_DIM and hashed_embedder.dim != HISTOGRAM_DIM:
+        print(
+            f"⚠️ Stored chunks use {HISTOGRAM_DIM}-d histogram embeddings; EMBEDDING_BACKEND=auto keeps using "
+            f"the histogram backend. Re-ingest with EMBEDDING_BACKEND=hashed to switch to hashed n-grams."
+        )
+
+
+def _local_backend() -> str | None:
+    """The in-process backend that will serve embeddings, or None when a model backend will."""
+    backend = (settings.EMBEDDING_BACKEND or BACKEND_AUTO).lower()
+    if backend in (BACKEND_HASHED, BACKEND_HISTOGRAM):
+        return backend
+    if not _auto_is_local():
+        return None
+    # a corpus stored by the old histogram embedder stays searchable until it is re-ingested
+    if _corpus_dim == HISTOGRAM_DIM and hashed_embedder.dim != HISTOGRAM_DIM:
+        return BACKEND_HISTOGRAM
+    return BACKEND_HASHED
+
+
+async def generate_embedding(text: str, query: bool = False) -> List[float]:
     """Generate a dense embedding for the input text.
 
-    Prefer Ollama if available; otherwise use sentence-transformers.
+    Prefer Ollama if available; otherwise use sentence-transformers, and the
+    hashed n-gram embedder when neither exists. `query` marks search queries
+    (the hashed backend weights them by IDF). Recorded or replayed through
+    the cassette (see app/services/cassette.py).
     """
-    text = text or ""
+    await _check_corpus_dim()
+    local = _local_backend()
+    backend = local or ("mock" if mock_providers.embeddings_enabled() else "model")
+    request = {"backend": backend, "text": text or "", "query": query}
+    return await cassette.call(KIND_EMBEDDING, request, lambda: _generate_embedding_live(text, local, query))
+
+
+async def _generate_embedding_live(text: str, local: str | None, query: bool) -> List[float]:
+    if local is not None:
+        # in-process backends do not touch the model server; no governor slot needed
+        t0 = time.perf_counter()
+        vec, backend = (await _embed_local([text or ""], local, query=query))[0], local
+    else:
+        async with llm_governor.slot("embedding"):
+            t0 = time.perf_counter()
+            vec, backend = await _embed(text or "")
+    metrics.record("embedding_seconds", time.perf_counter() - t0, breakdown="embedding", backend=backend)
+    return vec
+
+
+async def generate_embeddings(texts: Sequence[str]) -> List[List[float]]:
+    """Embed a batch of document chunks (ingest).
+
+    In-process backends encode the batch in one call, and the hashed backend
+    adds it to its TF-IDF statistics (persisted by `save_embedding_stats`);
+    model backends embed text by text.
+    """
+    global _corpus_dim
+    await _check_corpus_dim()
+    local = _local_backend()
+    if local is None:
+        return [await generate_embedding(t) for t in texts]
+    texts = [t or "" for t in texts]
+    vecs = await cassette.call(KIND_EMBEDDING, {"backend": local, "texts": texts, "fit": True}, lambda: _embed_batch_live(texts, local))
+    if _corpus_dim is None and vecs:
+        _corpus_dim = len(vecs[0])
+    return vecs
+
+
+async def save_embedding_stats() -> None:
+    """Write the hashed backend's TF-IDF statistics after an ingest (no-op when unchanged)."""
+    if hashed_embedder.dirty:
+        await run_in(POOL_DISK, hashed_embedder.save)
+
+
+async def _embed_batch_live(texts: List[str], local: str) -> List[List[float]]:
+    t0 = time.perf_counter()
+    vecs = await _embed_local(texts, local, fit=True)
+    metrics.record("embedding_seconds", time.perf_counter() - t0, breakdown="embedding", backend=local)
+    return vecs
+
+
+async def _embed_local(texts: List[str], backend: str, query: bool = False, fit: bool = False) -> List[List[float]]:
+    if backend == BACKEND_HISTOGRAM:
+        return [_char_histogram(t) for t in texts]
+    return (await run_in(POOL_CPU, hashed_embedder.encode, texts, query=query, fit=fit)).tolist()
+
+
+def _char_histogram(text: str) -> List[float]:
+    """Tiny deterministic embedding using character-level counts."""
+    arr = np.zeros(128, dtype=float)
+    for i, ch in enumerate(text[:4096]):
+        arr[ord(ch) % 128] += 1
+    # normalize
+    norm = np.linalg.norm(arr)
+    if norm > 0:
+        arr = arr / norm
+    return arr.tolist()
+
+
+async def _embed(text: str) -> Tuple[List[float], str]:
+    if mock_providers.embeddings_enabled():
+        return await mock_providers.mock_embedding(text), "mock"
     if _HAS_OLLAMA:
         try:
             # Try calling ollama embed CLI; capture JSON array
-            proc = subprocess.run(["ollama", "embed", "nomic/embedding-3-small", text], capture_output=True, text=True)
+            proc = await run_in(POOL_LLM, subprocess.run, ["ollama", "embed", "nomic/embedding-3-small", text], capture_output=True, text=True)
             if proc.returncode == 0 and proc.stdout:
                 # Ollama embed outputs a JSON list or whitespace-separated numbers; try to parse
                 import json
                 try:
                     emb = json.loads(proc.stdout)
-                    return emb
+                    return emb, "ollama"
                 except Exception:
                     # fallback parsing: split floats
                     parts = proc.stdout.strip().split()
-                    return [float(x) for x in parts]
+                    return [float(x) for x in parts], "ollama"
         except Exception:
             pass
 
     if _HF_MODEL is not None:
-        vec = _HF_MODEL.encode([text])[0]
-        return vec.tolist()
+        vec = (await run_in(POOL_CPU, _HF_MODEL.encode, [text]))[0]
+        return vec.tolist(), "sentence-transformers"
 
-    # Last-resort: tiny deterministic embedding using character-level counts
-    arr = np.zeros(128, dtype=float)
-    for i, ch in enumerate(text[:4096]):
-        arr[ord(ch) % 128] += 1
-    # normalize
-    norm = np.linalg.norm(arr)
-    if norm > 0:
-        arr = arr / norm
-    return arr.tolist()
+    # Last resort (e.g. the Ollama CLI failed): offline hashed n-gram embedding
+    vec = await run_in(POOL_CPU, hashed_embedder.encode, [text])
+    return vec[0].tolist(), BACKEND_HASHED
 from typing import List
 
 
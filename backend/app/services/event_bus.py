@@ -0,0 +1,144 @@
+"""In-process pub/sub of execution events.
+
+The engines publish every event of a run to the run's channel; any number of
+clients (the NDJSON response that started the run, SSE and WebSocket viewers)
+subscribe to it.
+
+* Each channel keeps the last EVENT_REPLAY_SIZE events so late joiners (or a
+  reconnecting EventSource with Last-Event-ID) catch up first.
+* Publishing never waits: every subscriber has a bounded queue, and a slow
+  subscriber loses its oldest undelivered events instead of holding the
+  engine back. It then receives a `{"type": "dropped", "count": n}` event
+  before the next one.
+* Finished channels stay subscribable (replay only) for the most recent
+  EVENT_BUS_RETAINED runs.
+
+Everything runs on the event loop; no locking is needed.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Set
+
+from app.config import settings
+from app.services import metrics
+
+_published = metrics.registry.counter("event_bus_published_total", "Events published to execution channels")
+_dropped = metrics.registry.counter("event_bus_dropped_total", "Events dropped for slow subscribers")
+_subscribers = metrics.registry.gauge("event_bus_subscribers", "Live execution-event subscribers")
+
+_CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(maxsize, 1))
+        self.dropped = 0
+
+    def offer(self, item: Any) -> None:
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+                _dropped.inc()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(item)
+
+
+class Channel:
+    def __init__(self, execution_id: str):
+        self.execution_id = execution_id
+        self.replay: Deque[Dict[str, Any]] = deque(maxlen=settings.EVENT_REPLAY_SIZE)
+        self.subscribers: Set[Subscription] = set()
+        self.seq = 0
+        self.closed = False
+
+    def publish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.seq += 1
+        event = {**event, "seq": self.seq}
+        self.replay.append(event)
+        for sub in self.subscribers:
+            sub.offer(event)
+        _published.inc()
+        return event
+
+    def close(self) -> None:
+        self.closed = True
+        for sub in self.subscribers:
+            # only wakes subscribers that are waiting; a full queue is drained first
+            if not sub.queue.full():
+                sub.queue.put_nowait(_CLOSED)
+
+
+class EventBus:
+    def __init__(self):
+        self._channels: Dict[str, Channel] = {}
+        self._aliases: Dict[str, str] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+    def _resolve(self, execution_id: str) -> Channel | None:
+        key = str(execution_id)
+        return self._channels.get(self._aliases.get(key, key))
+
+    def open(self, execution_id: str) -> Channel:
+        key = str(execution_id)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = Channel(key)
+        return channel
+
+    def alias(self, alias: str, execution_id: str) -> None:
+        """Make the channel of `execution_id` reachable under `alias` too (e.g. a DB execution id)."""
+        self._aliases[str(alias)] = str(execution_id)
+
+    def exists(self, execution_id: str) -> bool:
+        return self._resolve(execution_id) is not None
+
+    def publish(self, execution_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        return self.open(execution_id).publish(event)
+
+    def close(self, execution_id: str) -> None:
+        channel = self._resolve(execution_id)
+        if channel is None or channel.closed:
+            return
+        channel.close()
+        self._finished[channel.execution_id] = None
+        while len(self._finished) > settings.EVENT_BUS_RETAINED:
+            old, _ = self._finished.popitem(last=False)
+            self._channels.pop(old, None)
+            for alias in [a for a, target in self._aliases.items() if target == old]:
+                del self._aliases[alias]
+
+    async def subscribe(self, execution_id: str, after_seq: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Replay buffered events newer than `after_seq`, then follow the live run until it ends."""
+        channel = self._resolve(execution_id)
+        if channel is None:
+            return
+        sub = Subscription(settings.EVENT_SUBSCRIBER_QUEUE)
+        backlog = [e for e in channel.replay if e["seq"] > after_seq]
+        if not channel.closed:
+            channel.subscribers.add(sub)
+            _subscribers.inc()
+        try:
+            last = after_seq
+            for event in backlog:
+                last = event["seq"]
+                yield event
+            while not (channel.closed and sub.queue.empty()):
+                item = await sub.queue.get()
+                if item is _CLOSED:
+                    break
+                if item["seq"] <= last:
+                    continue  # already delivered from the backlog
+                if sub.dropped:
+                    yield {"type": "dropped", "count": sub.dropped}
+                    sub.dropped = 0
+                last = item["seq"]
+                yield item
+        finally:
+            if sub in channel.subscribers:
+                channel.subscribers.discard(sub)
+                _subscribers.dec()
+
+
+event_bus = EventBus()
@@ -0,0 +1,139 @@
+"""Compact encoding of the NDJSON run stream.
+
+The engines yield plain event dicts; `encode_stream` turns them into NDJSON
+bytes for StreamingResponse:
+
+* serialization uses orjson when it is installed (stdlib json otherwise);
+* strings of STREAM_BLOB_MIN_CHARS or more (search context, long results) are
+  sent once as a `{"type": "blob", "id": ..., "data": ...}` event and replaced
+  by `{"$ref": id}` wherever they occur, so the same search context repeated by
+  several nodes crosses the wire once;
+* `verbosity` trims result payloads: "full" (everything), "summary" (status,
+  result and counters) or "minimal" (status only);
+* `compress` ("gzip" or "deflate") compresses the stream, flushing after every
+  event so the client still sees events as they happen.
+"""
+import hashlib
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Set
+
+from app.config import settings
+from app.services import metrics
+
+try:
+    import orjson
+    _HAS_ORJSON = True
+except Exception:
+    orjson = None
+    _HAS_ORJSON = False
+
+VERBOSITY_FULL = "full"
+VERBOSITY_SUMMARY = "summary"
+VERBOSITY_MINIMAL = "minimal"
+VERBOSITIES = (VERBOSITY_FULL, VERBOSITY_SUMMARY, VERBOSITY_MINIMAL)
+
+COMPRESSIONS = {"gzip": 31, "deflate": 15}  # zlib wbits: gzip container / zlib ("deflate" in HTTP)
+
+# Result fields kept at "summary" verbosity
+SUMMARY_FIELDS = ("status", "result", "detail", "error", "reason", "counters")
+
+_stream_bytes = metrics.registry.counter("stream_bytes_total", "Run stream bytes before (raw) and after (wire) compression")
+
+
+def dumps(obj: Any) -> bytes:
+    if _HAS_ORJSON:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def normalize_verbosity(value: str | None) -> str:
+    return value if value in VERBOSITIES else VERBOSITY_FULL
+
+
+def _trim_result(result: Any, verbosity: str) -> Any:
+    if verbosity == VERBOSITY_FULL or not isinstance(result, dict):
+        return result
+    fields = ("status",) if verbosity == VERBOSITY_MINIMAL else SUMMARY_FIELDS
+    return {k: result[k] for k in fields if k in result}
+
+
+def trim_event(event: Dict[str, Any], verbosity: str) -> Dict[str, Any]:
+    if verbosity == VERBOSITY_FULL:
+        return event
+    trimmed = {k: v for k, v in event.items() if k not in ("context", "timing")}
+    if "result" in trimmed:
+        trimmed["result"] = _trim_result(trimmed["result"], verbosity)
+    if event.get("type") == "progress" and verbosity == VERBOSITY_MINIMAL:
+        trimmed = {k: event[k] for k in ("type", "node_id", "index", "status", "done", "total") if k in event}
+    return trimmed
+
+
+class EventEncoder:
+    """Encodes events for one stream, remembering which blobs the client already has."""
+
+    def __init__(self, verbosity: str = VERBOSITY_FULL, blob_min_chars: int | None = None):
+        self.verbosity = normalize_verbosity(verbosity)
+        self.blob_min_chars = settings.STREAM_BLOB_MIN_CHARS if blob_min_chars is None else blob_min_chars
+        self._sent: Set[str] = set()
+
+    def _extract_blobs(self, value: Any, out: List[Dict[str, Any]]) -> Any:
+        if isinstance(value, str):
+            if self.blob_min_chars <= 0 or len(value) < self.blob_min_chars:
+                return value
+            blob_id = hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+            if blob_id not in self._sent:
+                self._sent.add(blob_id)
+                out.append({"type": "blob", "id": blob_id, "data": value})
+            return {"$ref": blob_id}
+        if isinstance(value, dict):
+            return {k: self._extract_blobs(v, out) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._extract_blobs(v, out) for v in value]
+        return value
+
+    def encode_parts(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """`event` trimmed and with long strings replaced by refs, preceded by any new blob events."""
+        event = trim_event(event, self.verbosity)
+        blobs: List[Dict[str, Any]] = []
+        body = {k: (v if k in ("type", "node_id", "seq") else self._extract_blobs(v, blobs)) for k, v in event.items()}
+        return [*blobs, body]
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        """NDJSON bytes for `event`, preceded by any blob events it introduces."""
+        return b"".join(dumps(e) + b"\n" for e in self.encode_parts(event))
+
+
+class StreamCompressor:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._z = zlib.compressobj(6, zlib.DEFLATED, COMPRESSIONS[kind])
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush(zlib.Z_FINISH)
+
+
+async def encode_stream(events: AsyncIterator[Dict[str, Any]], verbosity: str = VERBOSITY_FULL, compress: str | None = None) -> AsyncIterator[bytes]:
+    encoder = EventEncoder(verbosity)
+    compressor = StreamCompressor(compress) if compress in COMPRESSIONS else None
+    raw = wire = 0
+    try:
+        async for event in events:
+            data = encoder.encode(event)
+            raw += len(data)
+            if compressor is not None:
+                data = compressor.compress(data)
+            wire += len(data)
+            yield data
+        if compressor is not None:
+            tail = compressor.finish()
+            wire += len(tail)
+            yield tail
+    finally:
+        # close the engine generator too, so its cleanup runs when the client goes away
+        await events.aclose()
+        _stream_bytes.inc(raw, kind="raw")
+        _stream_bytes.inc(wire, kind="wire")
@@ -0,0 +1,46 @@
+"""Per-execution context shared by services that need to know which run they serve.
+
+The engines wrap node work in `scope(...)`; services deeper in the call stack
+(LLM governor, metrics, tracing) read the current values without having them
+threaded through every signature. ContextVars follow asyncio tasks and are
+copied into executor threads (see executors.run_in).
+"""
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+_execution_id: ContextVar[str | None] = ContextVar("execution_id", default=None)
+_priority: ContextVar[str] = ContextVar("execution_priority", default=PRIORITY_INTERACTIVE)
+
+
+def new_execution_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def current_execution_id() -> str | None:
+    return _execution_id.get()
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def normalize_priority(value: str | None) -> str:
+    return value if value in PRIORITIES else PRIORITY_INTERACTIVE
+
+
+@contextmanager
+def scope(execution_id: str | None, priority: str | None = None) -> Iterator[None]:
+    """Run the enclosed block as part of `execution_id` with the given priority class."""
+    t1 = _execution_id.set(execution_id)
+    t2 = _priority.set(normalize_priority(priority))
+    try:
+        yield
+    finally:
+        _priority.reset(t2)
+        _execution_id.reset(t1)
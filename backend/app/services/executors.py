@@ -0,0 +1,110 @@
+"""Dedicated, bounded thread pools per class of blocking work.
+
+`asyncio.to_thread` puts everything on the loop's default executor, so a burst
+of slow web searches can occupy every worker and stall LLM calls and file
+writes of other executions. Each class of work gets its own pool instead:
+
+    llm       blocking model client calls (ChatOllama.invoke, CLI, local generator)
+    network   network-bound tools (web search providers)
+    disk      file output
+    cpu       parsing / chunking / local embedding encode
+
+`run_in(pool, fn, ...)` behaves like `asyncio.to_thread` (ContextVars are
+copied), and when the awaiting task is cancelled the queued work item is
+cancelled too, so a disconnected client never leaves work waiting for a thread.
+Queue depth, active workers and queue wait are exported as metrics.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from app.config import settings
+from app.services import metrics
+
+POOL_LLM = "llm"
+POOL_NETWORK = "network"
+POOL_DISK = "disk"
+POOL_CPU = "cpu"
+
+T = TypeVar("T")
+
+_active_gauge = metrics.registry.gauge("executor_active_workers", "Threads currently running work, per pool")
+_queued_gauge = metrics.registry.gauge("executor_queued_tasks", "Work items waiting for a thread, per pool")
+_size_gauge = metrics.registry.gauge("executor_max_workers", "Configured pool size")
+_cancelled = metrics.registry.counter("executor_cancelled_total", "Queued work items cancelled before they started")
+metrics.registry.histogram("executor_queue_wait_seconds", "Time work items waited for a pool thread")
+
+
+class BoundedPool:
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(int(max_workers), 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"pool-{name}")
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        _size_gauge.set(self.max_workers, pool=name)
+
+    def _publish(self) -> None:
+        _active_gauge.set(self.active, pool=self.name)
+        _queued_gauge.set(self.queued, pool=self.name)
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        submitted = time.monotonic()
+
+        def work():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self._publish()
+            # recorded in the caller's context so the wait counts towards its node breakdown and trace
+            ctx.run(metrics.record, "executor_queue_wait_seconds", time.monotonic() - submitted, breakdown=f"pool_wait:{self.name}", pool=self.name)
+            try:
+                return call()
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self._publish()
+
+        with self._lock:
+            self.queued += 1
+            self._publish()
+        cf = self._executor.submit(work)
+        try:
+            return await asyncio.wrap_future(cf, loop=loop)
+        except asyncio.CancelledError:
+            # cancel() only succeeds for items that never started running
+            if cf.cancel():
+                with self._lock:
+                    self.queued -= 1
+                    self._publish()
+                _cancelled.inc(pool=self.name)
+            raise
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+pools: Dict[str, BoundedPool] = {
+    POOL_LLM: BoundedPool(POOL_LLM, settings.EXECUTOR_LLM_WORKERS),
+    POOL_NETWORK: BoundedPool(POOL_NETWORK, settings.EXECUTOR_NETWORK_WORKERS),
+    POOL_DISK: BoundedPool(POOL_DISK, settings.EXECUTOR_DISK_WORKERS),
+    POOL_CPU: BoundedPool(POOL_CPU, settings.EXECUTOR_CPU_WORKERS),
+}
+
+
+async def run_in(pool: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking `fn` on the named pool and await its result."""
+    return await pools[pool].run(fn, *args, **kwargs)
+
+
+def shutdown_all() -> None:
+    for p in pools.values():
+        p.shutdown()
@@ -0,0 +1,153 @@
+"""File output for agent tools: everything lands under backend/data/.
+
+Writes go to a temp file in the target directory and are moved into place
+with os.replace, so readers and crashes never see a truncated file. Writes to
+the same path are serialized by a lock picked from a fixed set by path, and
+with skip_identical a file whose content would not change is left untouched.
+
+    write_text("report.txt", text)             atomic replace
+    write_stream("big.txt", chunks)            atomic replace from an iterable of str
+    append_text("log.txt", line)               append under the path lock
+    await write_async("report.txt", text)      write_text on the disk executor pool
+"""
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
+from app.config import settings
+from app.services import metrics
+from app.services.executors import POOL_DISK, run_in
+
+_WRITE_BUFFER = 1 << 20  # small chunks are coalesced into ~1MB writes
+_skipped = metrics.registry.counter("file_writes_skipped_total", "Writes skipped because the file already had the same content")
+
+
+@dataclass
+class FileWrite:
+    path: Path
+    bytes: int
+    skipped: bool = False
+
+
+@lru_cache(maxsize=1)
+def data_dir() -> Path:
+    path = Path(settings.DATA_DIR) if settings.DATA_DIR else Path(__file__).resolve().parents[2] / "data"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def resolve_path(filename: str) -> Path:
+    """Path of `filename` inside the data directory; refuses paths that escape it."""
+    base = data_dir()
+    path = (base / str(filename).lstrip("/\\")).resolve()
+    if path != base and base not in path.parents:
+        raise PermissionError(f"Refusing to write outside the data directory: {filename}")
+    if path == base:
+        raise IsADirectoryError(f"Not a file name: {filename!r}")
+    return path
+
+
+# Writes to one path are serialized by one of a fixed set of locks (two paths may share one)
+_LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+
+def _lock_for(path: Path) -> threading.Lock:
+    return _locks[hash(path) % _LOCK_STRIPES]
+
+
+def _match_existing(path: Path, chunks: Iterator[str]) -> Tuple[int, bytes, bool]:
+    """Consume `chunks` while they repeat the file at `path`.
+
+    Returns (bytes matched, first chunk that differs, identical); nothing is written.
+    """
+    try:
+        fh = open(path, "rb")
+    except (FileNotFoundError, IsADirectoryError):
+        return 0, b"", False
+    with fh:
+        matched = 0
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            if fh.read(len(data)) != data:
+                return matched, data, False
+            matched += len(data)
+        return matched, b"", fh.read(1) == b""
+
+
+def _copy_prefix(src: Path, dst, length: int) -> None:
+    with open(src, "rb") as fh:
+        while length > 0:
+            block = fh.read(min(_WRITE_BUFFER, length))
+            if not block:
+                raise IOError(f"{src} changed while being rewritten")
+            dst.write(block)
+            length -= len(block)
+
+
+def write_stream(filename: str, chunks: Iterable[str], skip_identical: bool | None = None) -> FileWrite:
+    """Atomically replace `filename` with the concatenated chunks.
+
+    With skip_identical the chunks are first compared against the current file, so
+    an unchanged file costs a read and no write or fsync; at the first difference the
+    matched prefix is copied from the old file and the rest streamed after it.
+    """
+    if skip_identical is None:
+        skip_identical = settings.FILE_WRITE_SKIP_IDENTICAL
+    path = resolve_path(filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunks = iter(chunks)
+    with _lock_for(path):
+        matched, pending = 0, b""
+        if skip_identical:
+            matched, pending, identical = _match_existing(path, chunks)
+            if identical:
+                _skipped.inc()
+                return FileWrite(path, matched, skipped=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            size = matched + len(pending)
+            with os.fdopen(fd, "wb", buffering=_WRITE_BUFFER) as fh:
+                if matched:
+                    _copy_prefix(path, fh, matched)
+                fh.write(pending)
+                for chunk in chunks:
+                    data = chunk.encode("utf-8")
+                    size += len(data)
+                    fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+    return FileWrite(path, size)
+
+
+def write_text(filename: str, content: str, skip_identical: bool | None = None) -> FileWrite:
+    return write_stream(filename, (content,), skip_identical)
+
+
+def append_text(filename: str, content: str) -> FileWrite:
+    path = resolve_path(filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = content.encode("utf-8")
+    with _lock_for(path):
+        with open(path, "ab") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+    return FileWrite(path, len(data))
+
+
+async def write_async(filename: str, content: str, append: bool = False) -> FileWrite:
+    if append:
+        return await run_in(POOL_DISK, append_text, filename, content)
+    return await run_in(POOL_DISK, write_text, filename, content)
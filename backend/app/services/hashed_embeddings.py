@@ -0,0 +1,186 @@
+"""Offline embedding backend: feature hashing of word and character n-grams.
+
+Needs nothing but NumPy, so air-gapped installs without Ollama or
+sentence-transformers still get usable retrieval. For each text:
+
+* the text is lower-cased and reduced to its words, joined by single spaces;
+* character n-grams (CHAR_NGRAMS) and word n-grams (WORD_NGRAMS) are hashed
+  with a polynomial rolling hash computed over the whole code-point array at
+  once (no per-character Python loop);
+* every feature lands in one of HASH_EMBED_DIM buckets with a hash-derived
+  sign, counts are damped with log1p and the vector is L2-normalised.
+
+With HASH_EMBED_TFIDF, document frequencies per bucket are accumulated at
+ingest (`encode(..., fit=True)`) and written to data/hash_idf.npz by `save()`,
+once per ingested document. IDF is applied to the query only, squared: the dot
+product (q * idf**2) . d equals (q * idf) . (d * idf), the TF-IDF score on
+both sides, while stored chunk vectors never go stale when the statistics
+change. Only each document's norm ignores IDF.
+"""
+import re
+import threading
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.file_output import data_dir
+
+CHAR_NGRAMS = (3, 4, 5)
+WORD_NGRAMS = (1, 2)
+WORD_WEIGHT = 2.0  # a whole-word match counts more than one of its character n-grams
+
+_WORD_RE = re.compile(r"\w+")
+_MASK = (1 << 64) - 1
+_BASE = 0x100000001B3  # odd, so it is invertible modulo 2**64
+_BASE_INV = pow(_BASE, -1, 1 << 64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SPACE = 32
+
+
+def _salt(kind: int, n: int) -> np.uint64:
+    return np.uint64(((kind * 0x632BE59BD9B4E019) ^ (n * 0x8CB92BA72F3D8DD7)) & _MASK)
+
+
+def _powers(base: int, n: int) -> np.ndarray:
+    """base**0 .. base**(n-1) modulo 2**64."""
+    out = np.empty(max(n, 1), dtype=np.uint64)
+    out[0] = 1
+    if n > 1:
+        out[1:] = base
+        out = np.cumprod(out, dtype=np.uint64)
+    return out[:n]
+
+
+def _features(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashes and weights of every n-gram feature of `text`."""
+    words = _WORD_RE.findall((text or "").lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.float64)
+    s = " " + " ".join(words) + " "
+    cp = np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    length = len(cp)
+    hashes, weights = [], []
+
+    # character n-grams over all windows at once; the n-gram hashes extend the (n-1)-gram ones:
+    # h_n[i] = h_(n-1)[i] * BASE + cp[i + n - 1]
+    h = cp
+    for n in range(2, max(CHAR_NGRAMS) + 1):
+        if length < n:
+            break
+        h = h[:-1] * np.uint64(_BASE) + cp[n - 1:]
+        if n in CHAR_NGRAMS:
+            hashes.append(h ^ _salt(1, n))
+            weights.append(np.ones(len(h)))
+
+    # word n-grams are substrings between spaces; hash any substring from prefix sums:
+    # hash(s[a:b]) = BASE**(b-1) * (G[b] - G[a]) with G[k] = sum(cp[t] * BASE**-t, t < k)
+    pw = _powers(_BASE, length + 1)
+    prefix = np.zeros(length + 1, dtype=np.uint64)
+    prefix[1:] = np.cumsum(cp * _powers(_BASE_INV, length), dtype=np.uint64)
+    spaces = np.flatnonzero(cp == _SPACE)
+    for n in WORD_NGRAMS:
+        if len(spaces) <= n:
+            continue
+        start, end = spaces[:-n] + 1, spaces[n:]
+        h = pw[end - 1] * (prefix[end] - prefix[start])
+        hashes.append(h ^ _salt(2, n))
+        weights.append(np.full(len(h), WORD_WEIGHT))
+    return np.concatenate(hashes), np.concatenate(weights)
+
+
+class HashedEmbedder:
+    def __init__(self, dim: int = 1024, tfidf: bool = True, idf_path: Path | Callable[[], Path] | None = None):
+        self.dim = max(int(dim), 8)
+        self.tfidf = tfidf
+        self._idf_path = idf_path  # a callable is resolved on first load, not at import
+        self.doc_freq = np.zeros(self.dim, dtype=np.float64)
+        self.n_docs = 0
+        self._lock = threading.Lock()
+        self._loaded = idf_path is None
+        self.dirty = False  # statistics changed since the last save()
+
+    def _buckets(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        mixed = hashes * _MIX
+        # multiply-shift range reduction of the high 32 bits (no modulo)
+        index = (((mixed >> np.uint64(32)) * np.uint64(self.dim)) >> np.uint64(32)).astype(np.int64)
+        sign = np.where(mixed >> np.uint64(63), -1.0, 1.0)
+        return index, sign
+
+    def _raw(self, texts: Sequence[str]) -> np.ndarray:
+        """Damped, signed bucket counts, one row per text."""
+        counts = np.zeros((len(texts), self.dim), dtype=np.float64)
+        for row, text in enumerate(texts):
+            hashes, weights = _features(text)
+            if len(hashes):
+                index, sign = self._buckets(hashes)
+                counts[row] = np.bincount(index, weights=weights * sign, minlength=self.dim)
+        return np.sign(counts) * np.log1p(np.abs(counts))
+
+    @staticmethod
+    def _unit(x: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (x / norms).astype(np.float32)
+
+    @property
+    def idf_path(self) -> Path | None:
+        if callable(self._idf_path):
+            self._idf_path = self._idf_path()
+        return self._idf_path
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                data = np.load(self.idf_path)
+                if data["doc_freq"].shape == (self.dim,):
+                    self.doc_freq, self.n_docs = data["doc_freq"].astype(np.float64), int(data["n_docs"])
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable IDF statistics {self.idf_path}: {e}")
+
+    def idf(self) -> np.ndarray:
+        self._ensure_loaded()
+        return np.log((1.0 + self.n_docs) / (1.0 + self.doc_freq)) + 1.0
+
+    def _fit_raw(self, raw: np.ndarray) -> None:
+        self._ensure_loaded()
+        present = (raw != 0).sum(axis=0)
+        with self._lock:
+            self.doc_freq += present
+            self.n_docs += len(raw)
+            self.dirty = True
+
+    def save(self) -> None:
+        """Persist the document frequencies if they changed."""
+        with self._lock:
+            if not self.dirty or self.idf_path is None:
+                return
+            tmp = self.idf_path.with_suffix(".tmp.npz")
+            np.savez(tmp, doc_freq=self.doc_freq, n_docs=self.n_docs)
+            tmp.replace(self.idf_path)
+            self.dirty = False
+
+    def encode(self, texts: Sequence[str], query: bool = False, fit: bool = False) -> np.ndarray:
+        """(len(texts), dim) float32 unit vectors.
+
+        `fit` adds the texts (ingested chunks) to the document frequencies
+        (in memory until `save()`); `query` weights by IDF squared. Both only
+        matter with TF-IDF on.
+        """
+        x = self._raw(texts)
+        if self.tfidf and fit and len(texts):
+            self._fit_raw(x)
+        if self.tfidf and query:
+            x = x * self.idf() ** 2
+        return self._unit(x)
+
+
+hashed_embedder = HashedEmbedder(settings.HASH_EMBED_DIM, settings.HASH_EMBED_TFIDF, lambda: data_dir() / "hash_idf.npz")
@@ -0,0 +1,146 @@
+"""Incremental re-execution of stored workflows.
+
+Every node gets a Merkle-style fingerprint: a hash of its type, its
+behaviour-relevant data and its parents' fingerprints. Editing a node or
+rewiring an edge therefore changes the fingerprint of that node and of all of
+its descendants. When a graph run carries a `workflow_id`, every finished node
+is stored as a StepResult together with its fingerprint. The next run re-emits
+the stored output of a node whose fingerprint is unchanged and none of whose
+parents re-ran, and runs the rest (the dirty subgraph and its descendants).
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable
+
+from sqlalchemy import select
+
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import metrics
+from app.services.utils import to_json
+
+# Keys the editor writes back into node data after a run; they do not change what a node does.
+UI_ONLY_KEYS = frozenset({"status", "result", "label", "selected"})
+
+# How many recent executions of a workflow are searched for reusable steps.
+LOOKBACK_EXECUTIONS = 20
+
+
+def behaviour_data(data: Dict[str, Any] | None) -> Dict[str, Any]:
+    return {k: v for k, v in (data or {}).items() if k not in UI_ONLY_KEYS}
+
+
+def node_fingerprint(node_type: str | None, data: Dict[str, Any] | None, parent_fingerprints: Iterable[str]) -> str:
+    payload = {
+        "type": node_type,
+        "data": behaviour_data(data),
+        "parents": sorted(parent_fingerprints),
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def reusable(output: Any) -> bool:
+    """Only successful agent results are worth re-emitting."""
+    return isinstance(output, dict) and output.get("status") == "ok"
+
+
+class GraphRunStore:
+    """Persists one graph run as an Execution and looks up reusable steps.
+
+    Without a workflow_id (or for an unknown workflow) it is inert: nothing is
+    stored and nothing is reused.
+    """
+
+    def __init__(self, workflow_id: int | None):
+        self.workflow_id = workflow_id
+        self.execution_id: int | None = None
+        self._session = None
+        self._execution: models.Execution | None = None
+        self._previous: Dict[str, Any] = {}
+        # concurrently running nodes share one session
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._execution is not None
+
+    async def open(self) -> None:
+        if self.workflow_id is None:
+            return
+        self._session = AsyncSessionLocal()
+        wf = await self._session.get(models.Workflow, self.workflow_id)
+        if wf is None:
+            print(f"⚠️ Workflow {self.workflow_id} not found; running without incremental reuse")
+            await self._session.close()
+            self._session = None
+            return
+        await self._load_previous()
+        self._execution = models.Execution(workflow_id=self.workflow_id, status="running")
+        self._session.add(self._execution)
+        with metrics.timer("db_commit_seconds", breakdown="db", op="execution"):
+            await self._session.commit()
+        self.execution_id = self._execution.id
+
+    async def _load_previous(self) -> None:
+        recent = (
+            select(models.Execution.id)
+            .where(models.Execution.workflow_id == self.workflow_id)
+            .order_by(models.Execution.id.desc())
+            .limit(LOOKBACK_EXECUTIONS)
+        )
+        q = await self._session.execute(
+            select(models.StepResult.input, models.StepResult.output)
+            .where(models.StepResult.execution_id.in_(recent.scalar_subquery()))
+            .order_by(models.StepResult.id)
+        )
+        # later rows win, so each fingerprint maps to its most recent successful output
+        for step_input, output in q.all():
+            fp = (step_input or {}).get("fingerprint") if isinstance(step_input, dict) else None
+            if fp and reusable(output):
+                self._previous[fp] = output
+
+    def lookup(self, fingerprint: str) -> Any | None:
+        return self._previous.get(fingerprint)
+
+    async def record(
+        self,
+        node_id: str,
+        node_type: str,
+        fingerprint: str,
+        data: Dict[str, Any] | None,
+        output: Any,
+        cached: bool = False,
+        **extra: Any,
+    ) -> None:
+        """Store one node's outcome; `extra` (signature, duration_s...) goes into the step input."""
+        if not self.enabled:
+            return
+        step = models.StepResult(
+            execution_id=self.execution_id,
+            node_id=str(node_id),
+            node_type=str(node_type),
+            input=to_json({"fingerprint": fingerprint, "data": behaviour_data(data), "cached": cached, **extra}),
+            output=to_json(output),
+        )
+        async with self._lock:
+            self._session.add(step)
+            # commit per node so a cancelled run still leaves its finished nodes reusable
+            with metrics.timer("db_commit_seconds", breakdown="db", op="step"):
+                await self._session.commit()
+
+    async def close(self, status: str) -> None:
+        if self._session is None:
+            return
+        async with self._lock:
+            try:
+                if self._execution is not None:
+                    self._execution.status = status
+                    self._execution.finished_at = datetime.now(timezone.utc)
+                    with metrics.timer("db_commit_seconds", breakdown="db", op="execution"):
+                        await self._session.commit()
+            finally:
+                await self._session.close()
+                self._session = None
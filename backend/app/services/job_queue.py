@@ -0,0 +1,215 @@
+"""Durable queue of graph runs for worker processes.
+
+`POST /execution/enqueue` stores a graph run as an ExecutionJob ("queued");
+any number of `python -m app.worker` processes, on this host or others sharing
+the database, execute the queue with the same engine as `/workflow/run`:
+
+    queued -> running (claimed by one worker, leased) -> completed | failed | cancelled
+
+A worker claims the oldest job (interactive before batch) with a conditional
+UPDATE that only succeeds while the job is still claimable, so two workers
+never run the same job, and renews its lease every JOB_HEARTBEAT_S. When a
+worker dies its lease runs out after JOB_LEASE_S and the job is claimed again
+from the start, up to JOB_MAX_ATTEMPTS attempts. A cancelled job or a lost
+lease stops the run at the worker's next heartbeat.
+
+The engine's events are written as ExecutionEvent rows in batches and
+`GET /execution/jobs/{id}/events` streams them to clients from the database.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import and_, case, or_, select, update
+
+from app.config import settings
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import execution_context, metrics
+from app.services.utils import to_json
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+TERMINAL = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)
+
+# Other workers may win the race for the same job; try the next one a few times
+CLAIM_TRIES = 5
+
+_enqueued = metrics.registry.counter("jobs_enqueued_total", "Graph runs queued for worker processes")
+_claimed = metrics.registry.counter("jobs_claimed_total", "Queued graph runs claimed by a worker, per attempt number")
+_finished = metrics.registry.counter("jobs_finished_total", "Queued graph runs finished, per status")
+_expired = metrics.registry.counter("jobs_lease_expired_total", "Queued graph runs given up after JOB_MAX_ATTEMPTS expired leases")
+metrics.registry.histogram("job_queue_wait_seconds", "Time a queued graph run waited for a worker")
+
+
+def job_info(job: models.ExecutionJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "run_id": job.run_id,
+        "status": job.status,
+        "priority": job.priority,
+        "worker_id": job.worker_id,
+        "attempts": job.attempts,
+        "execution_id": job.execution_id,
+        "error": job.error,
+        "created_at": str(job.created_at) if job.created_at else None,
+        "finished_at": str(job.finished_at) if job.finished_at else None,
+    }
+
+
+def _claimable(now: float):
+    lease_expired = and_(models.ExecutionJob.status == STATUS_RUNNING, models.ExecutionJob.lease_expires_at < now)
+    return or_(models.ExecutionJob.status == STATUS_QUEUED, lease_expired)
+
+
+async def enqueue(payload: Dict[str, Any], priority: str) -> models.ExecutionJob:
+    job = models.ExecutionJob(
+        run_id=execution_context.new_execution_id(),
+        payload=to_json(payload),
+        priority=execution_context.normalize_priority(priority),
+        status=STATUS_QUEUED,
+    )
+    async with AsyncSessionLocal() as session:
+        session.add(job)
+        with metrics.timer("db_commit_seconds", breakdown="db", op="job"):
+            await session.commit()
+    _enqueued.inc(priority=job.priority)
+    return job
+
+
+async def get(job_id: int) -> models.ExecutionJob | None:
+    async with AsyncSessionLocal() as session:
+        return await session.get(models.ExecutionJob, job_id)
+
+
+async def _fail_exhausted(session, now: float) -> None:
+    """Jobs whose last allowed attempt lost its lease are failed instead of claimed again."""
+    result = await session.execute(
+        update(models.ExecutionJob)
+        .where(
+            models.ExecutionJob.status == STATUS_RUNNING,
+            models.ExecutionJob.lease_expires_at < now,
+            models.ExecutionJob.attempts >= max(settings.JOB_MAX_ATTEMPTS, 1),
+        )
+        .values(status=STATUS_FAILED, error="worker lease expired", finished_at=datetime.now(timezone.utc))
+    )
+    if result.rowcount:
+        _expired.inc(result.rowcount)
+        _finished.inc(result.rowcount, status=STATUS_FAILED)
+
+
+async def claim(worker_id: str) -> models.ExecutionJob | None:
+    """Lease the next runnable job to `worker_id`, or None when there is nothing to run."""
+    async with AsyncSessionLocal() as session:
+        now = time.time()
+        await _fail_exhausted(session, now)
+        await session.commit()
+        for _ in range(CLAIM_TRIES):
+            job_id = (
+                await session.execute(
+                    select(models.ExecutionJob.id)
+                    .where(_claimable(now))
+                    .order_by(case((models.ExecutionJob.priority == execution_context.PRIORITY_INTERACTIVE, 0), else_=1), models.ExecutionJob.id)
+                    .limit(1)
+                )
+            ).scalar()
+            if job_id is None:
+                return None
+            # only one worker's UPDATE still sees the job as claimable
+            result = await session.execute(
+                update(models.ExecutionJob)
+                .where(models.ExecutionJob.id == job_id, _claimable(now))
+                .values(
+                    status=STATUS_RUNNING,
+                    worker_id=worker_id,
+                    lease_expires_at=now + settings.JOB_LEASE_S,
+                    attempts=models.ExecutionJob.attempts + 1,
+                )
+            )
+            with metrics.timer("db_commit_seconds", breakdown="db", op="job"):
+                await session.commit()
+            if result.rowcount == 1:
+                job = await session.get(models.ExecutionJob, job_id)
+                _claimed.inc(attempt=job.attempts)
+                if job.attempts == 1 and job.created_at is not None:
+                    # SQLite hands back naive datetimes (UTC) for server-side defaults
+                    waited = datetime.now(timezone.utc).replace(tzinfo=None) - job.created_at.replace(tzinfo=None)
+                    metrics.record("job_queue_wait_seconds", max(waited.total_seconds(), 0.0), priority=job.priority)
+                return job
+            now = time.time()
+        return None
+
+
+async def heartbeat(job_id: int, worker_id: str) -> bool:
+    """Extend the lease; False when the job was cancelled or another worker took it over."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(models.ExecutionJob)
+            .where(
+                models.ExecutionJob.id == job_id,
+                models.ExecutionJob.worker_id == worker_id,
+                models.ExecutionJob.status == STATUS_RUNNING,
+            )
+            .values(lease_expires_at=time.time() + settings.JOB_LEASE_S)
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+
+async def finish(job_id: int, worker_id: str, status: str, execution_id: int | None = None, error: str | None = None) -> bool:
+    """Record the outcome, unless the job stopped being this worker's meanwhile."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(models.ExecutionJob)
+            .where(
+                models.ExecutionJob.id == job_id,
+                models.ExecutionJob.worker_id == worker_id,
+                models.ExecutionJob.status == STATUS_RUNNING,
+            )
+            .values(status=status, execution_id=execution_id, error=error, lease_expires_at=None, finished_at=datetime.now(timezone.utc))
+        )
+        with metrics.timer("db_commit_seconds", breakdown="db", op="job"):
+            await session.commit()
+    if result.rowcount == 1:
+        _finished.inc(status=status)
+        return True
+    return False
+
+
+async def cancel(job_id: int) -> bool:
+    """Cancel a queued or running job; its worker stops at the next heartbeat."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(models.ExecutionJob)
+            .where(models.ExecutionJob.id == job_id, models.ExecutionJob.status.in_((STATUS_QUEUED, STATUS_RUNNING)))
+            .values(status=STATUS_CANCELLED, lease_expires_at=None, finished_at=datetime.now(timezone.utc))
+        )
+        await session.commit()
+    if result.rowcount == 1:
+        _finished.inc(status=STATUS_CANCELLED)
+        return True
+    return False
+
+
+async def append_events(job_id: int, attempt: int, events: List[Dict[str, Any]]) -> None:
+    if not events:
+        return
+    async with AsyncSessionLocal() as session:
+        session.add_all(models.ExecutionEvent(job_id=job_id, attempt=attempt, event=to_json(e)) for e in events)
+        with metrics.timer("db_commit_seconds", breakdown="db", op="job_events"):
+            await session.commit()
+
+
+async def events_after(job_id: int, after: int, limit: int = 500) -> List[Tuple[int, int, Dict[str, Any]]]:
+    """(event id, attempt, event) of `job_id` with ids above `after`, oldest first."""
+    async with AsyncSessionLocal() as session:
+        q = await session.execute(
+            select(models.ExecutionEvent.id, models.ExecutionEvent.attempt, models.ExecutionEvent.event)
+            .where(models.ExecutionEvent.job_id == job_id, models.ExecutionEvent.id > after)
+            .order_by(models.ExecutionEvent.id)
+            .limit(limit)
+        )
+        return [(row.id, row.attempt, row.event) for row in q.all()]
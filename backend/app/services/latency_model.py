@@ -0,0 +1,93 @@
+"""Historical node latency, used to prioritise ready nodes and to explain runs.
+
+A node's signature is a hash of its type and behaviour-relevant data (not its
+parents), so the same agent step keeps its statistics across workflows and
+edits elsewhere in the graph. Durations come from the StepResult rows that
+graph runs store (`input.duration_s`) plus every node finished in this
+process. Estimates fall back from signature, to node type, to
+GRAPH_DEFAULT_NODE_S.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services.incremental import behaviour_data
+
+# Weight of the newest observation in the moving average.
+EWMA_ALPHA = 0.3
+
+# How many recent StepResult rows are read when the model is first used.
+HISTORY_ROWS = 5000
+
+SOURCE_SIGNATURE = "signature"
+SOURCE_TYPE = "type"
+SOURCE_DEFAULT = "default"
+
+
+def node_signature(node_type: str | None, data: Dict[str, Any] | None) -> str:
+    raw = json.dumps({"type": node_type, "data": behaviour_data(data)}, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class _Stat:
+    __slots__ = ("count", "mean")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.mean = seconds if self.count == 1 else (1 - EWMA_ALPHA) * self.mean + EWMA_ALPHA * seconds
+
+
+class LatencyModel:
+    def __init__(self):
+        self._by_signature: Dict[str, _Stat] = {}
+        self._by_type: Dict[str, _Stat] = {}
+        self._loaded = False
+
+    def observe(self, signature: str, node_type: str | None, seconds: float) -> None:
+        self._by_signature.setdefault(signature, _Stat()).add(seconds)
+        self._by_type.setdefault(str(node_type), _Stat()).add(seconds)
+
+    def estimate(self, signature: str, node_type: str | None) -> Tuple[float, str]:
+        """(seconds, source) where source is "signature", "type" or "default"."""
+        stat = self._by_signature.get(signature)
+        if stat is not None:
+            return stat.mean, SOURCE_SIGNATURE
+        stat = self._by_type.get(str(node_type))
+        if stat is not None:
+            return stat.mean, SOURCE_TYPE
+        return settings.GRAPH_DEFAULT_NODE_S, SOURCE_DEFAULT
+
+    async def ensure_loaded(self) -> None:
+        """Seed the model from stored step durations, once per process."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            async with AsyncSessionLocal() as session:
+                q = await session.execute(
+                    select(models.StepResult.node_type, models.StepResult.input)
+                    .order_by(models.StepResult.id.desc())
+                    .limit(HISTORY_ROWS)
+                )
+                rows = q.all()
+        except Exception as e:
+            print(f"⚠️ Could not load node latency history: {e}")
+            return
+        for node_type, step_input in reversed(rows):
+            if not isinstance(step_input, dict) or step_input.get("cached"):
+                continue
+            sig, seconds = step_input.get("signature"), step_input.get("duration_s")
+            if sig and isinstance(seconds, (int, float)):
+                self.observe(sig, node_type, float(seconds))
+
+
+latency_model = LatencyModel()
@@ -1,42 +1,209 @@
+import hashlib
 import shutil
 import subprocess
-from typing import List, Dict
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
 import json
 
+from app.config import settings
+from app.services import metrics, mock_providers
+from app.services.batching import MicroBatcher
+from app.services.cassette import KIND_LLM, cassette
+from app.services.executors import POOL_LLM, run_in
+from app.services.llm_governor import llm_governor
+
 _HAS_OLLAMA = shutil.which("ollama") is not None
 
+try:
+    import httpx
+except Exception:
+    httpx = None
+
 try:
     from transformers import pipeline
     _GENERATOR = pipeline("text-generation", model="distilgpt2")
+    # batched prompts are left-padded; distilgpt2 has no pad token of its own
+    _GENERATOR.tokenizer.pad_token = _GENERATOR.tokenizer.eos_token
+    _GENERATOR.tokenizer.padding_side = "left"
 except Exception:
     _GENERATOR = None
 
+# Tokens generated per prompt by the transformers fallback. (max_length would
+# also count the padding of the shorter prompts in a batch.)
+LOCAL_MAX_NEW_TOKENS = 64
 
-async def generate_response(messages: List[Dict]) -> str:
-    """Generate a text response for the given chat messages.
 
-    messages: list of {role: str, content: str}
+def _render_message(m: Dict) -> str:
+    return f"[{m.get('role', 'user')}] {m.get('content', '')}\n"
+
+
+def _prefix_key(parts: List[str]) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+    return h.hexdigest()
+
+
+class PrefixCache:
+    """LRU of Ollama `context` token arrays keyed by the conversation they encode.
+
+    After a call, the returned context covers prompt + reply. A later call whose
+    messages start with that same conversation only needs to send the new
+    messages together with the cached context, so Ollama skips re-processing
+    the shared prefix.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, rendered: List[str]) -> Tuple[int, list | None]:
+        """Return (number of leading messages covered, context) for the longest cached prefix."""
+        for k in range(len(rendered) - 1, 0, -1):
+            key = _prefix_key(rendered[:k])
+            ctx = self._entries.get(key)
+            if ctx is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return k, ctx
+        self.misses += 1
+        return 0, None
+
+    def store(self, rendered: List[str], context: list) -> None:
+        if not context or self.maxsize <= 0:
+            return
+        key = _prefix_key(rendered)
+        self._entries[key] = context
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+prefix_cache = PrefixCache(settings.LLM_PREFIX_CACHE_SIZE)
+
+
+async def _ollama_http(rendered: List[str]) -> Dict[str, Any] | None:
+    """Call Ollama's /api/generate, reusing a cached context for the longest known prefix."""
+    if httpx is None:
+        return None
+    reused, ctx = prefix_cache.lookup(rendered)
+    body: Dict[str, Any] = {
+        "model": settings.LLM_MODEL,
+        "prompt": "".join(rendered[reused:]),
+        "stream": False,
+        "keep_alive": settings.LLM_KEEP_ALIVE,
+        "options": {"num_ctx": settings.LLM_NUM_CTX},
+    }
+    if ctx:
+        body["context"] = ctx
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=2.0)) as client:
+            resp = await client.post(f"{settings.LLM_ENDPOINT.rstrip('/')}/api/generate", json=body)
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except Exception:
+        return None
+
+    text = (data.get("response") or "").strip()
+    prefix_cache.store(rendered + [_render_message({"role": "assistant", "content": text})], data.get("context") or [])
+    ns = 1e-6
+    return {
+        "text": text,
+        "source": "ollama",
+        "reused_prefix_messages": reused,
+        "prompt_tokens": data.get("prompt_eval_count"),
+        "prompt_eval_ms": round(data["prompt_eval_duration"] * ns, 2) if data.get("prompt_eval_duration") else None,
+        "eval_ms": round(data["eval_duration"] * ns, 2) if data.get("eval_duration") else None,
+    }
+
+
+def _generate_local_batch(prompts: List[str]) -> List[str]:
+    """Run the transformers generator once over a batch of prompts (blocking)."""
+    outs = _GENERATOR(prompts, max_new_tokens=LOCAL_MAX_NEW_TOKENS, do_sample=False, batch_size=len(prompts))
+    texts = []
+    for out in outs:
+        # a list input yields one list of candidates per prompt
+        first = out[0] if isinstance(out, list) and out else out
+        texts.append(first.get("generated_text", "") if isinstance(first, dict) else "")
+    return texts
+
+
+_local_batcher = MicroBatcher("llm_local", _generate_local_batch, settings.LLM_LOCAL_BATCH_SIZE, settings.LLM_LOCAL_BATCH_WAIT_S)
+
+
+async def generate(messages: List[Dict]) -> Dict[str, Any]:
+    """Generate a response and report where it came from and how long prompt processing took.
+
+    Recorded or replayed through the cassette (see app/services/cassette.py).
     """
+    model = "mock" if mock_providers.llm_enabled() else settings.LLM_MODEL
+    return await cassette.call(KIND_LLM, {"model": model, "messages": messages}, lambda: _generate_live(messages))
+
+
+async def _generate_live(messages: List[Dict]) -> Dict[str, Any]:
+    """The live call: holds an LLM governor slot while the model server (or mock) is called. The
+    in-process transformers fallback is not governed per call: concurrent calls
+    are micro-batched and the batches run one at a time on the llm pool.
+    """
+    rendered = [_render_message(m) for m in messages]
     # Build a simple prompt from messages
-    prompt = ""
-    for m in messages:
-        role = m.get("role", "user")
-        content = m.get("content", "")
-        prompt += f"[{role}] {content}\n"
+    prompt = "".join(rendered)
+    t0 = time.perf_counter()
+    async with llm_governor.slot("llm"):
+        out = await _generate(rendered, prompt, t0)
+    if out is not None:
+        return out
+
+    text = None
+    source = "echo"
+    if _GENERATOR is not None:
+        text, source = await _local_batcher.submit(prompt), "transformers"
+
+    if text is None:
+        # fallback simple echo
+        text = prompt.splitlines()[-1] if prompt else ""
+
+    elapsed = time.perf_counter() - t0
+    metrics.record("llm_request_seconds", elapsed, breakdown="llm", source=source)
+    return {"text": text, "source": source, "reused_prefix_messages": 0, "wall_ms": round(elapsed * 1000, 2)}
+
+
+async def _generate(rendered: List[str], prompt: str, t0: float) -> Dict[str, Any] | None:
+    """Mock, Ollama HTTP or Ollama CLI; None when none of them produced a response."""
+    if mock_providers.llm_enabled():
+        text = await mock_providers.mock_generate(prompt)
+        elapsed = time.perf_counter() - t0
+        metrics.record("llm_request_seconds", elapsed, breakdown="llm", source="mock")
+        return {"text": text, "source": "mock", "reused_prefix_messages": 0, "wall_ms": round(elapsed * 1000, 2)}
+
+    out = await _ollama_http(rendered)
+    if out is not None:
+        elapsed = time.perf_counter() - t0
+        metrics.record("llm_request_seconds", elapsed, breakdown="llm", source="ollama")
+        out["wall_ms"] = round(elapsed * 1000, 2)
+        return out
 
     if _HAS_OLLAMA:
         try:
             # Use Ollama CLI to run a chat model (if configured locally)
-            proc = subprocess.run(["ollama", "chat", "llama3", "--stdin"], input=prompt, capture_output=True, text=True)
+            proc = await run_in(POOL_LLM, subprocess.run, ["ollama", "run", settings.LLM_MODEL], input=prompt, capture_output=True, text=True)
             if proc.returncode == 0:
-                return proc.stdout.strip()
+                elapsed = time.perf_counter() - t0
+                metrics.record("llm_request_seconds", elapsed, breakdown="llm", source="ollama-cli")
+                return {"text": proc.stdout.strip(), "source": "ollama-cli", "reused_prefix_messages": 0, "wall_ms": round(elapsed * 1000, 2)}
         except Exception:
             pass
+    return None
 
-    if _GENERATOR is not None:
-        out = _GENERATOR(prompt, max_length=200, do_sample=False)
-        if out and isinstance(out, list):
-            return out[0].get("generated_text", "")
 
-    # fallback simple echo
-    return prompt.splitlines()[-1] if prompt else ""
+async def generate_response(messages: List[Dict]) -> str:
+    """Generate a text response for the given chat messages.
+
+    messages: list of {role: str, content: str}
+    """
+    out = await generate(messages)
+    return out["text"]
@@ -0,0 +1,183 @@
+"""Admission control in front of the local model server.
+
+Every LLM and embedding call takes a slot from one process-wide governor
+before it reaches Ollama, so concurrent workflow streams cannot oversubscribe
+the model server. Waiters are grouped by priority class (interactive before
+batch) and, within a class, served round-robin by execution, so one wide graph
+cannot starve another run. A batch waiter older than LLM_BATCH_STARVATION_S is
+served ahead of interactive traffic so batch work always makes progress.
+
+    async with llm_governor.slot("llm"):
+        ...call the model...
+
+    # a blocking client call that may be abandoned (deadline, disconnect)
+    reply = await llm_governor.run_blocking("llm", POOL_LLM, client.invoke, messages)
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, TypeVar
+
+from app.config import settings
+from app.services import execution_context, metrics
+from app.services.execution_context import PRIORITIES, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.executors import run_in
+
+T = TypeVar("T")
+
+metrics.registry.histogram("llm_queue_wait_seconds", "Time spent waiting for an LLM/embedding slot")
+_slots_in_use = metrics.registry.gauge("llm_slots_in_use", "LLM/embedding slots currently held")
+_queue_depth = metrics.registry.gauge("llm_queue_depth", "Calls waiting for an LLM/embedding slot")
+
+
+class _Waiter:
+    __slots__ = ("future", "enqueued")
+
+    def __init__(self, future: asyncio.Future, enqueued: float):
+        self.future = future
+        self.enqueued = enqueued
+
+
+class LLMGovernor:
+    def __init__(self, limit: int, batch_starvation_s: float = 30.0):
+        self.limit = max(int(limit), 1)
+        self.batch_starvation_s = batch_starvation_s
+        self._active = 0
+        # priority -> execution key -> FIFO of waiters; dict order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def waiting(self, priority: str | None = None) -> int:
+        prios = [priority] if priority else list(self._queues)
+        return sum(len(q) for p in prios for q in self._queues[p].values())
+
+    def _update_gauges(self) -> None:
+        _slots_in_use.set(self._active)
+        for p in PRIORITIES:
+            _queue_depth.set(self.waiting(p), priority=p)
+
+    def _pop_from(self, priority: str) -> _Waiter | None:
+        queues = self._queues[priority]
+        while queues:
+            key, q = next(iter(queues.items()))
+            waiter = q.popleft()
+            if q:
+                queues.move_to_end(key)  # round-robin: this execution goes to the back
+            else:
+                del queues[key]
+            if not waiter.future.done():
+                return waiter
+        return None
+
+    def _oldest_batch_age(self) -> float:
+        queues = self._queues[PRIORITY_BATCH]
+        if not queues:
+            return 0.0
+        oldest = min(q[0].enqueued for q in queues.values() if q)
+        return time.monotonic() - oldest
+
+    def _next_waiter(self) -> _Waiter | None:
+        if self._queues[PRIORITY_BATCH] and self._oldest_batch_age() >= self.batch_starvation_s:
+            waiter = self._pop_from(PRIORITY_BATCH)
+            if waiter:
+                return waiter
+        for p in (PRIORITY_INTERACTIVE, PRIORITY_BATCH):
+            waiter = self._pop_from(p)
+            if waiter:
+                return waiter
+        return None
+
+    def _remove(self, priority: str, key: str, waiter: _Waiter) -> None:
+        q = self._queues[priority].get(key)
+        if q is None:
+            return
+        try:
+            q.remove(waiter)
+        except ValueError:
+            pass
+        if not q:
+            del self._queues[priority][key]
+
+    def _release(self) -> None:
+        waiter = self._next_waiter()
+        if waiter is not None:
+            # hand the slot straight to the next waiter; _active is unchanged
+            waiter.future.set_result(None)
+        else:
+            self._active -= 1
+        self._update_gauges()
+
+    async def acquire(self, kind: str = "llm") -> None:
+        priority = execution_context.current_priority()
+        key = execution_context.current_execution_id() or f"task-{id(asyncio.current_task())}"
+        t0 = time.monotonic()
+        if self._active < self.limit and self.waiting() == 0:
+            self._active += 1
+        else:
+            waiter = _Waiter(asyncio.get_running_loop().create_future(), t0)
+            self._queues[priority].setdefault(key, deque()).append(waiter)
+            self._update_gauges()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # the slot was handed over just before we were cancelled
+                    self._release()
+                else:
+                    self._remove(priority, key, waiter)
+                    self._update_gauges()
+                raise
+        metrics.record("llm_queue_wait_seconds", time.monotonic() - t0, breakdown="llm_queue", priority=priority, kind=kind)
+        self._update_gauges()
+
+    async def run_blocking(self, kind: str, pool: str, fn: Callable[..., T], *args: Any) -> T:
+        """Run blocking `fn` on executor `pool`, holding a slot until `fn` has really returned.
+
+        Cancelling the caller (an agent deadline, a client disconnect) drops a call that
+        has not started; one already running on its thread keeps the slot until it ends,
+        so abandoned generations still count against the limit.
+        """
+        await self.acquire(kind)
+        loop = asyncio.get_running_loop()
+        lock = threading.Lock()
+        state = {"phase": "queued"}
+
+        def call():
+            with lock:
+                if state["phase"] == "abandoned":
+                    return None
+                state["phase"] = "running"
+            try:
+                return fn(*args)
+            finally:
+                try:
+                    loop.call_soon_threadsafe(self._release)
+                except RuntimeError:  # loop already closed
+                    pass
+
+        try:
+            return await run_in(pool, call)
+        except BaseException:
+            with lock:
+                never_ran = state["phase"] == "queued"
+                if never_ran:
+                    state["phase"] = "abandoned"
+            if never_ran:
+                self._release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, kind: str = "llm") -> AsyncIterator[None]:
+        await self.acquire(kind)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+llm_governor = LLMGovernor(settings.LLM_MAX_CONCURRENCY, settings.LLM_BATCH_STARVATION_S)
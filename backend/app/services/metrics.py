@@ -0,0 +1,220 @@
+"""Lightweight in-process metrics with Prometheus text exposition.
+
+Usage:
+    with metrics.timer("tool_call_seconds", breakdown="tool:web_search_tool", tool="web_search_tool"):
+        ...
+
+Every timer observes a histogram and, when the code runs inside
+`node_breakdown()`, also adds its duration to that node's per-category
+breakdown. The breakdown lives in a ContextVar, which the executor pools copy
+into worker threads, so tool and LLM calls made off the loop are attributed to
+the right node.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_num(v: float) -> str:
+    v = float(v)
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(key)} {_fmt_num(v)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> (bucket counts, sum, count)
+        self._series: Dict[LabelKey, List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def total_count(self) -> int:
+        """Observations across every label set."""
+        with self._lock:
+            return sum(series[2] for series in self._series.values())
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        series = self._series.get(_label_key(labels))
+        if series is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": series[2], "sum": series[1]}
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                cumulative = 0
+                for b, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, [('le', _fmt_num(b))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, [('le', '+Inf')])} {n}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_num(total)}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, help, **kwargs)
+            return m
+
+    def histogram(self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help or name, buckets=buckets)
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help or name)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, help or name)
+
+    def get(self, name: str) -> _Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Metrics recorded across the app; declared here so /metrics lists them with help text.
+registry.histogram("llm_request_seconds", "Latency of LLM invocations")
+registry.histogram("tool_call_seconds", "Latency of agent tool calls")
+registry.histogram("embedding_seconds", "Latency of embedding generation")
+registry.histogram("rag_search_seconds", "Latency of RAG similarity search")
+registry.histogram("db_commit_seconds", "Latency of database commits")
+registry.histogram("node_duration_seconds", "End-to-end latency of workflow nodes")
+
+_breakdown: ContextVar[Dict[str, Dict[str, float]] | None] = ContextVar("metrics_breakdown", default=None)
+_breakdown_lock = threading.Lock()
+
+# Called with (name, seconds, breakdown, labels) for every recorded timing (see tracing.py)
+_observers: List[Callable[[str, float, str | None, Dict[str, object]], None]] = []
+
+
+def add_observer(fn: Callable[[str, float, str | None, Dict[str, object]], None]) -> None:
+    if fn not in _observers:
+        _observers.append(fn)
+
+
+def record(name: str, seconds: float, breakdown: str | None = None, **labels) -> None:
+    """Observe `seconds` on histogram `name` and the active node breakdown."""
+    registry.histogram(name).observe(seconds, **labels)
+    bd = _breakdown.get()
+    if bd is not None and breakdown:
+        with _breakdown_lock:
+            entry = bd.setdefault(breakdown, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + seconds * 1000, 3)
+    for fn in _observers:
+        fn(name, seconds, breakdown, labels)
+
+
+@contextmanager
+def timer(name: str, breakdown: str | None = None, **labels) -> Iterator[None]:
+    """Time the enclosed block into histogram `name` (works around awaits too)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0, breakdown, **labels)
+
+
+@contextmanager
+def node_breakdown() -> Iterator[Dict[str, Dict[str, float]]]:
+    """Collect the timers fired inside the block into a per-category dict."""
+    bd: Dict[str, Dict[str, float]] = {}
+    token = _breakdown.set(bd)
+    try:
+        yield bd
+    finally:
+        _breakdown.reset(token)
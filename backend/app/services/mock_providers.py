@@ -0,0 +1,110 @@
+"""Deterministic stand-ins for the LLM, web search and embedding backends.
+
+Enabled per backend through environment variables so benchmarks and smoke
+tests can run without Ollama, network access or model downloads:
+
+    MOCK_LLM=1                 agent + llm_adapter use the scripted mock model
+    MOCK_SEARCH=1              web_search / web_search_raw return canned results
+    MOCK_EMBEDDINGS=1          generate_embedding returns hashed vectors
+
+Artificial latency (milliseconds, read on every call so a harness can change
+it between runs):
+
+    MOCK_LLM_LATENCY_MS, MOCK_SEARCH_LATENCY_MS, MOCK_EMBED_LATENCY_MS
+    MOCK_LATENCY_JITTER        fraction of +/- uniform jitter, e.g. 0.2
+"""
+import asyncio
+import hashlib
+import os
+import random
+import time
+from types import SimpleNamespace
+from typing import List
+
+MOCK_EMBED_DIM = 64
+
+
+def _flag(name: str) -> bool:
+    return os.getenv(name) == "1"
+
+
+def llm_enabled() -> bool:
+    return _flag("MOCK_LLM")
+
+
+def search_enabled() -> bool:
+    return _flag("MOCK_SEARCH")
+
+
+def embeddings_enabled() -> bool:
+    return _flag("MOCK_EMBEDDINGS")
+
+
+def latency_s(name: str) -> float:
+    """Configured latency for one mock call, with optional jitter."""
+    try:
+        base = float(os.getenv(name, "0") or 0) / 1000.0
+        jitter = float(os.getenv("MOCK_LATENCY_JITTER", "0") or 0)
+    except ValueError:
+        return 0.0
+    if base <= 0:
+        return 0.0
+    if jitter > 0:
+        base *= 1.0 + random.uniform(-jitter, jitter)
+    return max(base, 0.0)
+
+
+class MockBound:
+    """Scripted tool-calling model: 1) web_search_tool, 2) file_writer (no content), 3) stop."""
+
+    def __init__(self, tools):
+        self.tools = tools
+        self._step = 0
+
+    def invoke(self, messages):
+        # Return a simple object with `tool_calls` and `content` attributes.
+        delay = latency_s("MOCK_LLM_LATENCY_MS")
+        if delay:
+            time.sleep(delay)
+        self._step += 1
+        meta = {"prompt_eval_count": len(messages), "prompt_eval_duration": int(delay * 0.3e9), "eval_duration": int(delay * 0.7e9)}
+        if self._step == 1:
+            return SimpleNamespace(tool_calls=[{"name": "web_search_tool", "args": {"query": "hotels in paris"}, "id": "1"}], content="", response_metadata=meta)
+        elif self._step == 2:
+            return SimpleNamespace(tool_calls=[{"name": "file_writer", "args": {"filename": "hotels.txt"}, "id": "2"}], content="", response_metadata=meta)
+        else:
+            return SimpleNamespace(tool_calls=[], content="Done", response_metadata=meta)
+
+
+class MockLLM:
+    def __init__(self, model=None, temperature=0):
+        self.model = model
+
+    def bind_tools(self, tools):
+        return MockBound(tools)
+
+
+async def mock_generate(prompt: str) -> str:
+    delay = latency_s("MOCK_LLM_LATENCY_MS")
+    if delay:
+        await asyncio.sleep(delay)
+    last = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    return f"Mock response to: {last[:200]}"
+
+
+def mock_web_search(query: str) -> str:
+    delay = latency_s("MOCK_SEARCH_LATENCY_MS")
+    if delay:
+        time.sleep(delay)
+    return "\n".join(
+        f"Title: Result {i} for {query}\nSnippet: Mock snippet {i} about {query}.\n" for i in range(1, 4)
+    )
+
+
+async def mock_embedding(text: str) -> List[float]:
+    delay = latency_s("MOCK_EMBED_LATENCY_MS")
+    if delay:
+        await asyncio.sleep(delay)
+    digest = hashlib.sha256((text or "").encode("utf-8")).digest()
+    raw = (digest * (MOCK_EMBED_DIM // len(digest) + 1))[:MOCK_EMBED_DIM]
+    return [(b - 127.5) / 127.5 for b in raw]
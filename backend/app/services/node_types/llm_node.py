@@ -3,5 +3,6 @@ from app.services import llm_adapter
 
 async def execute(node_data: dict):
     messages = node_data.get("messages") or [{"role": "user", "content": node_data.get("prompt", "")}]
-    resp = await llm_adapter.generate_response(messages)
-    return {"response": resp}
+    out = await llm_adapter.generate(messages)
+    timing = {k: v for k, v in out.items() if k != "text"}
+    return {"response": out["text"], "llm_timing": timing}
@@ -0,0 +1,142 @@
+"""`map` node: run one agent (or LLM) template over a list of items.
+
+Node data:
+    goal / prompt    template; "{item}" and "{index}" are substituted, otherwise
+                     the item is appended to it
+    template         "agent" (default) or "llm"
+    items            list (or newline-separated string); when missing, the list
+                     is taken from the first parent result that has one
+    concurrency      items in flight at once (default MAP_CONCURRENCY)
+    max_items        cap on the number of items
+
+Items run with bounded parallelism; results are gathered in input order and a
+failed item does not fail the others. `on_item(event)` is called as each item
+finishes so the engine can stream progress.
+"""
+import asyncio
+import json
+import re
+from typing import Any, Callable, Dict, List, Sequence
+
+from app.config import settings
+from app.services import llm_adapter, tracing
+from app.services.agent_service import run_single_agent
+
+TEMPLATE_AGENT = "agent"
+TEMPLATE_LLM = "llm"
+
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+
+def _split_items(text: str) -> List[Any]:
+    text = (text or "").strip()
+    if text.startswith("["):
+        try:
+            parsed = json.loads(text)
+            if isinstance(parsed, list):
+                return parsed
+        except ValueError:
+            pass
+    return [_LIST_MARKER_RE.sub("", line).strip() for line in text.splitlines() if line.strip()]
+
+
+def _as_items(value: Any) -> List[Any] | None:
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str) and value.strip():
+        return _split_items(value)
+    return None
+
+
+def resolve_items(node_data: Dict[str, Any], parent_results: Sequence[Any] = ()) -> List[Any]:
+    """Items from node data, else from the first parent result that carries a list."""
+    items = _as_items(node_data.get("items"))
+    if items is None:
+        for res in parent_results:
+            if isinstance(res, dict):
+                # a parent map node: use its per-item results
+                if isinstance(res.get("items"), list):
+                    items = [it.get("result") for it in res["items"] if isinstance(it, dict) and it.get("status") == "ok"]
+                else:
+                    items = _as_items(res.get("result"))
+            else:
+                items = _as_items(res)
+            if items:
+                break
+    items = items or []
+    try:
+        cap = int(node_data.get("max_items") or 0)
+    except (TypeError, ValueError):
+        cap = 0
+    return items[:cap] if cap > 0 else items
+
+
+def render(template: str, item: Any, index: int) -> str:
+    text = item if isinstance(item, str) else json.dumps(item, default=str)
+    if "{item}" in template or "{index}" in template:
+        return template.replace("{item}", text).replace("{index}", str(index))
+    return f"{template}\n\nItem: {text}"
+
+
+def _item_summary(res: Any) -> str:
+    if isinstance(res, dict):
+        return str(res.get("result") or res.get("response") or "")
+    return str(res)
+
+
+async def execute(
+    node_data: dict,
+    parent_results: Sequence[Any] = (),
+    context: str = "",
+    agent_budget: Dict[str, Any] | None = None,
+    on_item: Callable[[Dict[str, Any]], None] | None = None,
+):
+    template = node_data.get("goal") or node_data.get("prompt") or ""
+    kind = node_data.get("template") or TEMPLATE_AGENT
+    items = resolve_items(node_data, parent_results)
+    try:
+        concurrency = max(int(node_data.get("concurrency") or settings.MAP_CONCURRENCY), 1)
+    except (TypeError, ValueError):
+        concurrency = settings.MAP_CONCURRENCY
+    sem = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def run_item(index: int, item: Any) -> Dict[str, Any]:
+        nonlocal done
+        prompt = render(template, item, index)
+        async with sem:
+            try:
+                with tracing.sublane(f"item {index}"), tracing.span(f"item {index}", "map_item"):
+                    if kind == TEMPLATE_LLM:
+                        content = f"{context}\n\n{prompt}" if context else prompt
+                        out = await llm_adapter.generate([{"role": "user", "content": content}])
+                        res: Any = {"status": "ok", "result": out["text"]}
+                    else:
+                        res = await run_single_agent(prompt, context=context, **(agent_budget or {}))
+                    ok = not (isinstance(res, dict) and res.get("status") == "error")
+                    entry = {"index": index, "item": item, "status": "ok" if ok else "error", "result": _item_summary(res)}
+                    if not ok:
+                        entry["error"] = res.get("error") or res.get("detail") or "failed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                entry = {"index": index, "item": item, "status": "error", "result": "", "error": str(e)}
+        done += 1
+        if on_item:
+            on_item({**entry, "done": done, "total": len(items)})
+        return entry
+
+    if not items:
+        return {"status": "error", "detail": "map node has no items", "result": "", "items": [], "counters": {"total": 0, "ok": 0, "failed": 0}}
+    results = await asyncio.gather(*(run_item(i, item) for i, item in enumerate(items)))
+    ok_count = sum(1 for r in results if r["status"] == "ok")
+    summary = "\n\n".join(
+        f"[{r['index']}] {r['item'] if isinstance(r['item'], str) else json.dumps(r['item'], default=str)}: {r['result']}"
+        for r in results if r["status"] == "ok"
+    )
+    return {
+        "status": "ok" if ok_count else "error",
+        "result": summary,
+        "items": results,
+        "counters": {"total": len(items), "ok": ok_count, "failed": len(items) - ok_count, "concurrency": concurrency},
+    }
@@ -0,0 +1,266 @@
+"""On-demand profiling of single live requests.
+
+An admin opts one request in with the `X-Profile` header (or `?profile=`)
+set to a mode, plus `X-Admin-Token: <ADMIN_TOKEN>`:
+
+    sample    a background thread snapshots every thread's Python stack each
+              PROFILE_SAMPLE_INTERVAL_S; idle threads are skipped. Output is
+              collapsed stacks ("thread;outer;...;inner count", one per line)
+              for flamegraph.pl, speedscope or Perfetto.
+    cprofile  deterministic cProfile of the event-loop thread (work handed to
+              the executor pools shows up as the awaits that wait for it).
+              Output is a pstats file for `python -m pstats` or snakeviz.
+
+Both run for the whole request, including a streamed response body, and stop
+after PROFILE_MAX_S at the latest. The loop is shared, so other requests
+running at the same time appear in the profile too; only one profile runs at
+a time. Profiles are saved as data/profiles/{id}.collapsed or .prof, where id
+is returned in the `X-Profile-Id` response header; a workflow run also saves
+its profile under its run id and stored execution id (`attach`), served by
+GET /execution/{id}/profile. Without ADMIN_TOKEN profiling is off, and a
+request that does not ask for it only costs a scan of its headers.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.services import metrics
+from app.services.executors import POOL_DISK, run_in
+from app.services.file_output import data_dir, write_text
+
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+MODES = (MODE_SAMPLE, MODE_CPROFILE)
+SUFFIXES = {MODE_SAMPLE: ".collapsed", MODE_CPROFILE: ".prof"}
+
+PROFILE_DIR = "profiles"
+
+# Top frames of threads that are waiting for work rather than doing it
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+_profiles = metrics.registry.counter("profiles_total", "Requests profiled on demand, per mode")
+_busy = threading.Lock()  # one profile at a time
+
+
+def _safe(name: str) -> str:
+    return "".join(c for c in str(name) if c.isalnum() or c in "-_")
+
+
+def profile_path(name: str, mode: str) -> Path:
+    return data_dir() / PROFILE_DIR / f"{_safe(name)}{SUFFIXES[mode]}"
+
+
+def find_profile(name: str) -> Tuple[Path, str] | None:
+    """(path, mode) of a stored profile, or None."""
+    for mode in MODES:
+        path = profile_path(name, mode)
+        if path.exists():
+            return path, mode
+    return None
+
+
+def authorized(token: str | None) -> bool:
+    return bool(settings.ADMIN_TOKEN) and hmac.compare_digest(str(token or ""), settings.ADMIN_TOKEN)
+
+
+class _Sampler:
+    """Collapsed-stack sampler running on its own thread."""
+
+    def __init__(self, interval_s: float, max_s: float):
+        self.interval_s = max(float(interval_s), 0.001)
+        self.max_s = max_s
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.max_s
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval_s) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if any(tid not in names for tid in frames):
+                names = {t.ident: re.sub(r"_\d+$", "", t.name) for t in threading.enumerate()}
+            for tid, frame in frames.items():
+                code = frame.f_code
+                if tid == me or (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+class ProfileSession:
+    def __init__(self, mode: str):
+        self.id = f"req-{uuid.uuid4().hex[:12]}"
+        self.mode = mode
+        self.names: List[str] = [self.id]
+        self.started = time.monotonic()
+        self._sampler: _Sampler | None = None
+        self._cprofile: cProfile.Profile | None = None
+        self._cap: asyncio.TimerHandle | None = None
+
+    def start(self) -> None:
+        """Start collecting; call it on the event loop thread."""
+        if self.mode == MODE_SAMPLE:
+            self._sampler = _Sampler(settings.PROFILE_SAMPLE_INTERVAL_S, settings.PROFILE_MAX_S)
+            self._sampler.start()
+        else:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            # the cap runs on the loop thread too, where the profiler was enabled
+            self._cap = asyncio.get_running_loop().call_later(settings.PROFILE_MAX_S, self._cprofile.disable)
+        _profiles.inc(mode=self.mode)
+
+    def _save(self) -> None:
+        profile_path(self.id, self.mode).parent.mkdir(parents=True, exist_ok=True)
+        if self._sampler is not None:
+            text = self._sampler.collapsed()
+            for name in self.names:
+                write_text(f"{PROFILE_DIR}/{_safe(name)}{SUFFIXES[self.mode]}", text)
+        elif self._cprofile is not None:
+            for name in self.names:
+                self._cprofile.dump_stats(str(profile_path(name, self.mode)))
+        _prune(settings.PROFILES_RETAINED)
+
+    async def stop(self) -> None:
+        """Stop collecting and write the profile under every attached name."""
+        if self._cap is not None:
+            self._cap.cancel()
+        if self._cprofile is not None:
+            self._cprofile.disable()  # must happen on the thread that enabled it
+        if self._sampler is not None:
+            await run_in(POOL_DISK, self._sampler.stop)
+        try:
+            await run_in(POOL_DISK, self._save)
+            print(f"🔬 Saved {self.mode} profile {', '.join(self.names)} ({time.monotonic() - self.started:.2f}s)")
+        except Exception as e:
+            print(f"⚠️ Could not save profile {self.id}: {e}")
+
+
+def _prune(keep: int) -> None:
+    """Delete the oldest profile files beyond `keep`."""
+    directory = data_dir() / PROFILE_DIR
+    files = sorted((p for p in directory.iterdir() if p.suffix in SUFFIXES.values()), key=lambda p: p.stat().st_mtime)
+    for p in files[: max(len(files) - max(keep, 1), 0)]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+_session: ContextVar[ProfileSession | None] = ContextVar("profile_session", default=None)
+
+
+def attach(name) -> None:
+    """Also save the active request's profile (if any) as `name`, e.g. an execution id."""
+    session = _session.get()
+    if session is not None and name is not None and str(name) not in session.names:
+        session.names.append(str(name))
+
+
+def render_text(path: Path, limit: int = 60) -> str:
+    """Human-readable summary of a pstats file, sorted by cumulative time."""
+    out = io.StringIO()
+    pstats.Stats(str(path), stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def _requested_mode(scope) -> str | None:
+    for key, value in scope.get("headers") or ():
+        if key == b"x-profile":
+            return value.decode("latin-1").strip().lower()
+    qs = scope.get("query_string") or b""
+    if b"profile=" in qs:
+        values = parse_qs(qs.decode("latin-1")).get("profile")
+        if values:
+            return values[0].strip().lower()
+    return None
+
+
+def _header(scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware starting a ProfileSession for requests that ask for one."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode = _requested_mode(scope)
+        if not mode:
+            return await self.app(scope, receive, send)
+        if not authorized(_header(scope, b"x-admin-token")):
+            return await JSONResponse({"detail": "Profiling needs a valid X-Admin-Token"}, status_code=403)(scope, receive, send)
+        if mode not in MODES:
+            return await JSONResponse({"detail": f"Unknown profile mode {mode!r}; use one of {list(MODES)}"}, status_code=400)(scope, receive, send)
+        if not _busy.acquire(blocking=False):
+            return await JSONResponse({"detail": "Another request is being profiled"}, status_code=409)(scope, receive, send)
+
+        session = ProfileSession(mode)
+        token = _session.set(session)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", session.id.encode())]}
+            await send(message)
+
+        try:
+            session.start()
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _session.reset(token)
+            try:
+                await session.stop()
+            finally:
+                _busy.release()
@@ -1,77 +1,281 @@
 import os
-from typing import List, Dict
-from app.services.embeddings import generate_embedding
+from typing import Dict, Iterator, List
+from app.config import settings
+from app.services.chunking import iter_chunks
+from app.services import metrics
+from app.services.embeddings import generate_embedding, generate_embeddings, save_embedding_stats
+from app.services.executors import POOL_CPU, run_in
+from app.services.vector_index import chunk_index
 from app.db import models
-from app.db.database import AsyncSessionLocal
+from app.db.database import AsyncSessionLocal, engine
+from sqlalchemy import delete, func, select, text
 import asyncio
+import itertools
+import time
 import math
 import json
 from PyPDF2 import PdfReader
 
 
+_READ_BLOCK = 64 * 1024
+_EMBED_BATCH = 32  # chunks embedded per call at ingest
+
+
+def _take(items: Iterator[str], n: int) -> List[str]:
+    return list(itertools.islice(items, n))
+
+
+def _iter_document_text(file_path: str, filename: str) -> Iterator[str]:
+    """Yield a document's text piece by piece (PDF pages or file blocks)."""
+    if filename.lower().endswith(".pdf"):
+        try:
+            reader = PdfReader(file_path)
+            pages = [p.extract_text() or "" for p in reader.pages]
+        except Exception:
+            pages = None
+        if pages is not None:
+            yield from pages
+            return
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as fh:
+        while True:
+            block = fh.read(_READ_BLOCK)
+            if not block:
+                break
+            yield block
+
+
+def _live_chunks(table):
+    """WHERE clause hiding tombstoned chunks."""
+    return table.c.id.not_in(select(models.ChunkTombstone.chunk_id))
+
+
 class RAGService:
     def __init__(self):
         # ensure uploads dir
         os.makedirs("backend/data/uploads", exist_ok=True)
+        self._compact_lock = asyncio.Lock()
+        self._compaction: asyncio.Task | None = None
 
     async def process_document(self, file_path: str, filename: str = None):
-        """Process a file on disk: extract text, chunk, embed and store in DB."""
+        """Process a file on disk: extract text, chunk, embed and store in DB.
+
+        Text is streamed through the configured chunker, so chunks are embedded
+        in small batches as they are produced instead of being collected up front.
+        """
         filename = filename or os.path.basename(file_path)
-        text = ""
-        if filename.lower().endswith(".pdf"):
-            try:
-                reader = PdfReader(file_path)
-                for p in reader.pages:
-                    text += p.extract_text() or ""
-            except Exception:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as fh:
-                    text = fh.read()
-        else:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as fh:
-                text = fh.read()
-
-        # chunk text into ~500 char chunks with overlap
-        chunks = []
-        chunk_size = 800
-        overlap = 200
-        i = 0
-        while i < len(text):
-            chunk = text[i:i+chunk_size]
-            if chunk.strip():
-                chunks.append(chunk.strip())
-            i += chunk_size - overlap
+        pieces = _iter_document_text(file_path, filename)
+        chunks = iter_chunks(
+            pieces,
+            strategy=settings.CHUNK_STRATEGY,
+            chunk_size=settings.CHUNK_SIZE,
+            overlap=settings.CHUNK_OVERLAP,
+        )
 
+        n_chunks = 0
+        stored: List[models.DocumentChunk] = []
         async with AsyncSessionLocal() as session:
             doc = models.Document(filename=filename)
             session.add(doc)
             await session.flush()
-            for c in chunks:
-                emb = await generate_embedding(c)
-                chunk_model = models.DocumentChunk(document_id=doc.id, content=c, embedding=emb)
-                session.add(chunk_model)
-            await session.commit()
-        return {"document": filename, "chunks": len(chunks)}
+            while True:
+                # parsing and chunking advance on the cpu pool, one embedding batch per hop
+                batch = await run_in(POOL_CPU, _take, chunks, _EMBED_BATCH)
+                if not batch:
+                    break
+                for content, emb in zip(batch, await generate_embeddings(batch)):
+                    chunk_model = models.DocumentChunk(document_id=doc.id, content=content, embedding=emb)
+                    session.add(chunk_model)
+                    stored.append(chunk_model)
+                    n_chunks += 1
+            with metrics.timer("db_commit_seconds", breakdown="db", op="ingest"):
+                await session.commit()
+        await save_embedding_stats()
+        chunk_index.add([c.id for c in stored], [c.embedding for c in stored])
+        return {"document": filename, "document_id": doc.id, "chunks": n_chunks}
 
     async def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        q_emb = await generate_embedding(query)
-        # load all chunks
+        with metrics.timer("rag_search_seconds", breakdown="rag_search"):
+            return await self._search(query, top_k)
+
+    async def _search(self, query: str, top_k: int) -> List[Dict]:
+        q_emb = await generate_embedding(query, query=True)
+        table = models.DocumentChunk.__table__
+        # with EMBEDDING_QUANTIZATION, compressed codes pick a shortlist and only it is loaded
+        candidates = await chunk_index.candidates(q_emb, top_k)
         async with AsyncSessionLocal() as session:
-            res = await session.execute(models.DocumentChunk.__table__.select())
+            if candidates is None:
+                # load all live chunks
+                res = await session.execute(table.select().where(_live_chunks(table)))
+            else:
+                res = await session.execute(table.select().where(table.c.id.in_(candidates), _live_chunks(table)))
             rows = res.fetchall()
-            scored = []
-            import numpy as np
-            qv = np.array(q_emb, dtype=float)
-            for r in rows:
-                emb = r.embedding
-                if not emb:
-                    continue
-                ev = np.array(emb, dtype=float)
-                # cosine similarity
-                denom = (np.linalg.norm(qv) * np.linalg.norm(ev))
-                score = float(np.dot(qv, ev) / denom) if denom > 0 else 0.0
-                scored.append({"id": r.id, "content": r.content, "score": score})
-            scored.sort(key=lambda x: x["score"], reverse=True)
-            return scored[:top_k]
+        return _rank_exact(q_emb, rows, top_k)
+
+
+    async def list_documents(self) -> List[Dict]:
+        async with AsyncSessionLocal() as session:
+            q = await session.execute(
+                select(models.Document.id, models.Document.filename, models.Document.created_at, func.count(models.DocumentChunk.id))
+                .outerjoin(models.DocumentChunk, models.DocumentChunk.document_id == models.Document.id)
+                .where(models.Document.id.not_in(select(models.ChunkTombstone.document_id)))
+                .group_by(models.Document.id)
+                .order_by(models.Document.id)
+            )
+            return [{"id": i, "filename": f, "created_at": str(c), "chunks": n} for i, f, c, n in q.all()]
+
+    async def delete_document(self, document_id: int) -> Dict | None:
+        """Tombstone a document's chunks at once; compaction removes the rows later.
+
+        Returns None when the document does not exist (or is already deleted).
+        """
+        async with AsyncSessionLocal() as session:
+            doc = await session.get(models.Document, document_id)
+            tombstoned = await session.execute(select(models.ChunkTombstone.chunk_id).where(models.ChunkTombstone.document_id == document_id).limit(1))
+            if doc is None or tombstoned.first() is not None:
+                return None
+            q = await session.execute(select(models.DocumentChunk.id).where(models.DocumentChunk.document_id == document_id))
+            chunk_ids = [r[0] for r in q.all()]
+            if chunk_ids:
+                session.add_all([models.ChunkTombstone(chunk_id=cid, document_id=document_id) for cid in chunk_ids])
+            else:
+                await session.delete(doc)  # nothing to compact
+            with metrics.timer("db_commit_seconds", breakdown="db", op="delete_document"):
+                await session.commit()
+        chunk_index.remove(chunk_ids)
+        self.schedule_compaction()
+        return {"document_id": document_id, "chunks": len(chunk_ids)}
+
+    async def replace_document(self, document_id: int, file_path: str, filename: str = None) -> Dict | None:
+        """Ingest the new file, then tombstone the old one, so the document never drops out of search."""
+        async with AsyncSessionLocal() as session:
+            if await session.get(models.Document, document_id) is None:
+                return None
+        new = await self.process_document(file_path, filename)
+        old = await self.delete_document(document_id)
+        return {**new, "replaced": old}
+
+    async def tombstone_ratio(self) -> float:
+        async with AsyncSessionLocal() as session:
+            dead = (await session.execute(select(func.count()).select_from(models.ChunkTombstone))).scalar() or 0
+            total = (await session.execute(select(func.count()).select_from(models.DocumentChunk))).scalar() or 0
+        return dead / total if total else 0.0
+
+    def schedule_compaction(self) -> None:
+        """Start a background compaction once COMPACTION_TOMBSTONE_RATIO of the chunks are tombstoned."""
+        if self._compaction is not None and not self._compaction.done():
+            return
+
+        async def run():
+            try:
+                if await self.tombstone_ratio() >= settings.COMPACTION_TOMBSTONE_RATIO:
+                    await self.compact()
+            except Exception as e:
+                print(f"⚠️ Background compaction failed: {e}")
+
+        self._compaction = asyncio.create_task(run())
+
+    async def compact(self) -> Dict:
+        """Delete tombstoned chunks and their documents, rebuild indexes and VACUUM the database."""
+        async with self._compact_lock:
+            t0 = time.perf_counter()
+            size_before = _db_file_size()
+            chunks_removed = docs_removed = 0
+            async with AsyncSessionLocal() as session:
+                # only the tombstones seen here are compacted; ones committed meanwhile wait for the next run
+                dead = (await session.execute(select(models.ChunkTombstone.chunk_id, models.ChunkTombstone.document_id))).all()
+                dead_chunks = [chunk_id for chunk_id, _ in dead]
+                dead_docs = sorted({document_id for _, document_id in dead})
+                # tombstones first: they reference the chunks and documents (FKs are enforced outside SQLite)
+                for batch in _batches(dead_chunks):
+                    await session.execute(delete(models.ChunkTombstone).where(models.ChunkTombstone.chunk_id.in_(batch)))
+                for batch in _batches(dead_chunks):
+                    chunks_removed += (await session.execute(delete(models.DocumentChunk).where(models.DocumentChunk.id.in_(batch)))).rowcount
+                for batch in _batches(dead_docs):
+                    docs_removed += (await session.execute(delete(models.Document).where(models.Document.id.in_(batch)))).rowcount
+                with metrics.timer("db_commit_seconds", breakdown="db", op="compact"):
+                    await session.commit()
+
+            # secondary indexes: databases created before an index was declared get it now
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda c: [ix.create(c, checkfirst=True) for ix in models.DocumentChunk.__table__.indexes])
+            chunk_index.invalidate()
+
+            if engine.dialect.name == "sqlite":
+                # VACUUM cannot run inside a transaction
+                async with engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await conn.execute(text("VACUUM"))
+                    # in WAL mode the vacuumed pages sit in the -wal file until a checkpoint
+                    await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            out = {
+                "chunks_removed": chunks_removed,
+                "documents_removed": docs_removed,
+                "db_bytes_before": size_before,
+                "db_bytes_after": _db_file_size(),
+                "seconds": round(time.perf_counter() - t0, 3),
+            }
+            print(f"🧹 Compacted document store: {out}")
+            return out
+
+
+def _batches(ids: List[int], size: int = 500):
+    """Slices of `ids` small enough for one IN (...) clause on every backend."""
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _db_file_size() -> int | None:
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    if not path:
+        return None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    try:
+        size += os.path.getsize(path + "-wal")  # WAL mode (app/db/database.py)
+    except OSError:
+        pass
+    return size
+
+
+_warned_dims: set = set()
+
+
+def _warn_dim_mismatch(query_dim: int, skipped: Dict[int, int]) -> None:
+    for dim, n in skipped.items():
+        if (query_dim, dim) in _warned_dims:
+            continue
+        _warned_dims.add((query_dim, dim))
+        print(
+            f"⚠️ {n} stored chunks have {dim}-d embeddings but the current backend makes {query_dim}-d ones; "
+            f"search skips them. Re-ingest those documents, or set EMBEDDING_BACKEND to the backend "
+            f"they were stored with (histogram for 128-d)."
+        )
+
+
+def _rank_exact(q_emb: List[float], rows, top_k: int) -> List[Dict]:
+    """Cosine similarity of the query against each row's full embedding."""
+    import numpy as np
+    qv = np.array(q_emb, dtype=float)
+    scored = []
+    skipped: Dict[int, int] = {}
+    for r in rows:
+        emb = r.embedding
+        if not emb:
+            continue
+        if len(emb) != len(qv):
+            skipped[len(emb)] = skipped.get(len(emb), 0) + 1
+            continue
+        ev = np.array(emb, dtype=float)
+        # cosine similarity
+        denom = (np.linalg.norm(qv) * np.linalg.norm(ev))
+        score = float(np.dot(qv, ev) / denom) if denom > 0 else 0.0
+        scored.append({"id": r.id, "content": r.content, "score": score})
+    if skipped:
+        _warn_dim_mismatch(len(qv), skipped)
+    scored.sort(key=lambda x: x["score"], reverse=True)
+    return scored[:top_k]
 
 
 
@@ -0,0 +1,108 @@
+"""Token buckets and single-flight call coalescing for async callers.
+
+Used by the web search layer (app/services/tools.py), which waits for tokens
+and coalesces searches on the event loop and only then hands the blocking
+provider call to the network executor pool:
+
+    bucket = TokenBucket(rate_per_s=5, burst=10)
+    if await bucket.acquire(max_wait_s=2.0):     # waits up to 2s for a token
+        ...call the provider...
+
+    flight = SingleFlight()
+    result, shared = await flight.do(key, fn)    # concurrent callers with the same key share one fn() call
+
+A bucket with a rate of 0 never limits. `acquire` reserves its token up front
+and sleeps for it with asyncio.sleep, so waiters are served in arrival order
+without holding a pool thread; a caller that would wait longer than
+`max_wait_s` takes nothing and gets False, leaving the tokens for later
+callers. Code already running on an executor thread uses `acquire_blocking`.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: float):
+        self.rate = max(float(rate_per_s), 0.0)
+        self.capacity = max(float(burst), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait_s: float) -> float | None:
+        """Take a token now or in the future: seconds to wait for it, or None if that exceeds `max_wait_s`."""
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # tokens may go negative: each reservation queues behind the earlier ones
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > max_wait_s:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def _give_back(self) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    async def acquire(self, max_wait_s: float = 0.0) -> bool:
+        wait = self.reserve(max_wait_s)
+        if wait is None:
+            return False
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._give_back()  # the caller left before using its token
+                raise
+        return True
+
+    def acquire_blocking(self, max_wait_s: float = 0.0) -> bool:
+        """`acquire` for blocking code on an executor thread: sleeps the thread for its token."""
+        wait = self.reserve(max_wait_s)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution (on one event loop)."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved: nobody may be left awaiting it
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, shared): await `fn()` unless a call for `key` is already running, then share its outcome.
+
+        The call runs as its own task, so a caller that is cancelled does not
+        cancel it for the others.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+        task = self._calls[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), False
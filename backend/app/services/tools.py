@@ -3,10 +3,19 @@ from dotenv import load_dotenv
 load_dotenv()
 import shutil
 import subprocess
+import threading
+import time
 import traceback
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
 from langchain_core.tools import tool
 
+from app.config import settings
+from app.services import file_output, metrics, mock_providers
+from app.services.cassette import KIND_WEB_SEARCH, cassette
+from app.services.executors import POOL_NETWORK, run_in
+from app.services.rate_limit import SingleFlight, TokenBucket
+
 # 1. Try importing Tavily (python package)
 try:
     from tavily import TavilyClient
@@ -34,198 +43,357 @@ except Exception:
     wikipedia = None
     has_wiki = False
 
-def web_search_raw(query: str) -> str:
+# Returned by web_search_raw when every provider failed.
+SEARCH_FAILED_MESSAGE = "System Error: Search failed on all providers. Please check your internet or API keys."
+
+# Effects a tool call can produce; agents declare which ones a goal requires.
+EFFECT_SEARCHED = "searched"
+EFFECT_FILE_WRITTEN = "file_written"
+
+# Search providers, as named in SEARCH_RATE_LIMITS
+PROVIDER_TAVILY = "tavily"
+PROVIDER_DDG = "duckduckgo"
+PROVIDER_WIKIPEDIA = "wikipedia"
+PROVIDER_MOCK = "mock"
+
+_search_calls = metrics.registry.counter("search_provider_calls_total", "Outbound web search calls, per provider")
+_search_skipped = metrics.registry.counter("search_rate_limited_total", "Provider attempts skipped because its rate limit would wait too long")
+_search_coalesced = metrics.registry.counter("search_coalesced_total", "Searches served by an identical search already in flight")
+metrics.registry.histogram("search_rate_wait_seconds", "Time searches waited for a provider's rate-limit token")
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """"provider:rate_per_s:burst,..." -> {provider: (rate, burst)}; malformed entries are ignored."""
+    limits = {}
+    for part in (spec or "").split(","):
+        fields = part.strip().split(":")
+        try:
+            limits[fields[0].strip().lower()] = (float(fields[1]), float(fields[2]) if len(fields) > 2 else 1.0)
+        except (IndexError, ValueError):
+            continue
+    return limits
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_spec: str | None = None
+_buckets_lock = threading.Lock()
+_search_flight = SingleFlight()
+
+
+def _bucket(provider: str) -> TokenBucket:
+    global _buckets, _buckets_spec
+    with _buckets_lock:
+        if _buckets_spec != settings.SEARCH_RATE_LIMITS:
+            _buckets_spec = settings.SEARCH_RATE_LIMITS
+            _buckets = {p: TokenBucket(rate, burst) for p, (rate, burst) in parse_rate_limits(_buckets_spec).items()}
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            bucket = _buckets[provider] = TokenBucket(0, 1)  # not configured: unlimited
+        return bucket
+
+
+def _skip_provider(provider: str) -> bool:
+    print(f"   ⏳ {provider} rate limit reached; skipping it")
+    _search_skipped.inc(provider=provider)
+    return False
+
+
+def _use_provider(provider: str, t0: float) -> bool:
+    metrics.record("search_rate_wait_seconds", time.monotonic() - t0, breakdown="search_rate_wait", provider=provider)
+    _search_calls.inc(provider=provider)
+    return True
+
+
+async def _provider_slot(provider: str) -> bool:
+    """Wait (on the event loop) for a rate-limit token of `provider`; False when that would exceed SEARCH_RATE_MAX_WAIT_S."""
+    t0 = time.monotonic()
+    if not await _bucket(provider).acquire(settings.SEARCH_RATE_MAX_WAIT_S):
+        return _skip_provider(provider)
+    return _use_provider(provider, t0)
+
+
+def _provider_slot_blocking(provider: str) -> bool:
+    """`_provider_slot` for the blocking search path, which already runs on an executor thread."""
+    t0 = time.monotonic()
+    if not _bucket(provider).acquire_blocking(settings.SEARCH_RATE_MAX_WAIT_S):
+        return _skip_provider(provider)
+    return _use_provider(provider, t0)
+
+
+@dataclass
+class ToolResult:
+    """Structured outcome of a tool call.
+
+    `output` is what goes back to the model; `ok` and `effects` are what the
+    agent loop uses to decide whether the goal's work is done.
+    """
+    tool: str
+    ok: bool
+    output: str
+    effects: Tuple[str, ...] = field(default_factory=tuple)
+    path: Optional[str] = None
+
+    def __str__(self) -> str:
+        return self.output
+
+
+async def web_search(query: str) -> str:
     """
     Robust searcher: Tavily -> DuckDuckGo -> Wikipedia -> Error
+    (recorded or replayed through the cassette, see app/services/cassette.py)
     """
-    print(f"🔎 Searching for: '{query}'")
-    print(f"DEBUG: Tavily Key Loaded? {bool(os.getenv('TAVILY_API_KEY'))}")
-    print(f"DEBUG: Tavily python package present? {has_tavily_pkg}, Tavily CLI present? {has_tavily_cli}")
-    results = []
+    provider = "mock" if mock_providers.search_enabled() else "live"
 
-    # STRATEGY A: TAVILY (Best for Agents) - try hard first
+    async def search() -> str:
+        return await cassette.call(KIND_WEB_SEARCH, {"provider": provider, "query": query}, lambda: _web_search_live(query))
+
+    if not settings.SEARCH_COALESCE:
+        return await search()
+    # identical searches already running (other agents, same moment) share that one's result;
+    # keyed on the exact query, since providers may rank differently on case or spacing
+    result, shared = await _search_flight.do((provider, query), search)
+    if shared:
+        _search_coalesced.inc()
+    return result
+
+
+def web_search_raw(query: str) -> str:
+    """Blocking `web_search` for the LangChain tool wrapper (no coalescing); waits for tokens on its thread."""
+    provider = "mock" if mock_providers.search_enabled() else "live"
+    return cassette.call_sync(KIND_WEB_SEARCH, {"provider": provider, "query": query}, lambda: _web_search_live_sync(query))
+
+
+def _search_tavily(query: str) -> str | None:
     tavily_key = os.getenv("TAVILY_API_KEY")
-    if tavily_key:
-        # Try Python package client first
-        if has_tavily_pkg:
-            try:
-                print("   -> Trying Tavily (python client)...")
-                client = TavilyClient(api_key=tavily_key)
-                # prefer a search() method if present
-                if hasattr(client, "search"):
-                    response = client.search(query=query, max_results=3)
-                elif hasattr(client, "text"):
-                    response = client.text(query, max_results=3)
-                else:
-                    response = None
-
-                # Parse possible response shapes
-                if isinstance(response, dict) and response.get("results"):
-                    for r in response.get("results", [])[:10]:
-                        title = r.get("title") or r.get("headline") or ""
-                        content = r.get("content") or r.get("snippet") or ""
-                        results.append(f"Title: {title}\nContent: {content}\n")
-                    # Save raw response for debugging
+    results = []
+    # Try Python package client first
+    if has_tavily_pkg:
+        try:
+            print("   -> Trying Tavily (python client)...")
+            client = TavilyClient(api_key=tavily_key)
+            # prefer a search() method if present
+            if hasattr(client, "search"):
+                response = client.search(query=query, max_results=3)
+            elif hasattr(client, "text"):
+                response = client.text(query, max_results=3)
+            else:
+                response = None
+
+            # Parse possible response shapes
+            if isinstance(response, dict) and response.get("results"):
+                for r in response.get("results", [])[:10]:
+                    title = r.get("title") or r.get("headline") or ""
+                    content = r.get("content") or r.get("snippet") or ""
+                    results.append(f"Title: {title}\nContent: {content}\n")
+                # Save raw response for debugging
+                try:
+                    with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
+                        dbg.write('TAVILY_CLIENT_RESPONSE:\n')
+                        dbg.write(str(response) + '\n---\n')
+                except Exception:
+                    pass
+                return "\n".join(results)
+            if hasattr(response, "__iter__") and not isinstance(response, (str, bytes)):
+                for r in response:
+                    if isinstance(r, dict):
+                        title = r.get("title") or r.get("heading") or "No Title"
+                        body = r.get("body") or r.get("content") or ""
+                    else:
+                        title = getattr(r, "title", "No Title")
+                        body = getattr(r, "body", "")
+                    results.append(f"Title: {title}\nSnippet: {body}\n")
+                if results:
                     try:
                         with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
-                            dbg.write('TAVILY_CLIENT_RESPONSE:\n')
-                            dbg.write(str(response) + '\n---\n')
+                            dbg.write('TAVILY_CLIENT_ITERABLE_RESPONSE:\n')
+                            dbg.write(str(list(response)) + '\n---\n')
                     except Exception:
                         pass
                     return "\n".join(results)
-                if hasattr(response, "__iter__") and not isinstance(response, (str, bytes)):
-                    for r in response:
-                        if isinstance(r, dict):
-                            title = r.get("title") or r.get("heading") or "No Title"
-                            body = r.get("body") or r.get("content") or ""
-                        else:
-                            title = getattr(r, "title", "No Title")
-                            body = getattr(r, "body", "")
-                        results.append(f"Title: {title}\nSnippet: {body}\n")
+        except Exception:
+            print("   ❌ Tavily (python client) failed — full traceback:")
+            traceback.print_exc()
+
+    # Try Tavily CLI if python package unavailable or failed
+    if has_tavily_cli:
+        try:
+            print("   -> Trying Tavily (CLI)...")
+            env = os.environ.copy()
+            env["TAVILY_API_KEY"] = tavily_key
+            proc = subprocess.run(["tavily", "search", query, "--json"], capture_output=True, text=True, env=env, timeout=30)
+            if proc.returncode == 0 and proc.stdout:
+                try:
+                    import json as _json
+                    payload = _json.loads(proc.stdout)
+                    for r in payload.get("results", [])[:10]:
+                        title = r.get("title") or r.get("headline") or ""
+                        snippet = r.get("snippet") or r.get("summary") or ""
+                        results.append(f"Title: {title}\nSnippet: {snippet}\n")
                     if results:
+                        # Save CLI raw stdout for debugging
                         try:
                             with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
-                                dbg.write('TAVILY_CLIENT_ITERABLE_RESPONSE:\n')
-                                dbg.write(str(list(response)) + '\n---\n')
+                                dbg.write('TAVILY_CLI_STDOUT:\n')
+                                dbg.write(proc.stdout + '\n---\n')
                         except Exception:
                             pass
                         return "\n".join(results)
-            except Exception:
-                print("   ❌ Tavily (python client) failed — full traceback:")
-                traceback.print_exc()
+                except Exception:
+                    # If output isn't JSON, return raw stdout truncated
+                    out = proc.stdout.strip()
+                    if out:
+                        try:
+                            with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
+                                dbg.write('TAVILY_CLI_RAW_OUT:\n')
+                                dbg.write(out + '\n---\n')
+                        except Exception:
+                            pass
+                        return out[:8000]
+        except Exception:
+            print("   ❌ Tavily (CLI) failed — full traceback:")
+            traceback.print_exc()
+    return None
 
-        # Try Tavily CLI if python package unavailable or failed
-        if has_tavily_cli:
+
+def _search_duckduckgo(query: str) -> str | None:
+    results = []
+    try:
+        print("   -> Trying DuckDuckGo...")
+        # Use the text method directly
+        ddg_results = DDGS().text(query, max_results=3)
+        if ddg_results:
             try:
-                print("   -> Trying Tavily (CLI)...")
-                env = os.environ.copy()
-                env["TAVILY_API_KEY"] = tavily_key
-                proc = subprocess.run(["tavily", "search", query, "--json"], capture_output=True, text=True, env=env, timeout=30)
-                if proc.returncode == 0 and proc.stdout:
-                    try:
-                        import json as _json
-                        payload = _json.loads(proc.stdout)
-                        for r in payload.get("results", [])[:10]:
-                            title = r.get("title") or r.get("headline") or ""
-                            snippet = r.get("snippet") or r.get("summary") or ""
-                            results.append(f"Title: {title}\nSnippet: {snippet}\n")
-                        if results:
-                            # Save CLI raw stdout for debugging
-                            try:
-                                with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
-                                    dbg.write('TAVILY_CLI_STDOUT:\n')
-                                    dbg.write(proc.stdout + '\n---\n')
-                            except Exception:
-                                pass
-                            return "\n".join(results)
-                    except Exception:
-                        # If output isn't JSON, return raw stdout truncated
-                        out = proc.stdout.strip()
-                        if out:
-                            try:
-                                with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
-                                    dbg.write('TAVILY_CLI_RAW_OUT:\n')
-                                    dbg.write(out + '\n---\n')
-                            except Exception:
-                                pass
-                            return out[:8000]
+                with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
+                    dbg.write('DDG_RAW_RESULTS:\n')
+                    dbg.write(str(ddg_results) + '\n---\n')
             except Exception:
-                print("   ❌ Tavily (CLI) failed — full traceback:")
-                traceback.print_exc()
+                pass
+            for r in ddg_results:
+                # DDG keys vary, handle safely
+                title = r.get('title', 'No Title')
+                body = r.get('body', r.get('content', ''))
+                results.append(f"Title: {title}\nSnippet: {body}\n")
+            return "\n".join(results)
+    except Exception as e:
+        print(f"   ❌ DuckDuckGo failed: {e}")
+    return None
 
+
+def _search_wikipedia(query: str) -> str | None:
+    try:
+        print("   -> Trying Wikipedia...")
+        wiki_res = wikipedia.summary(query, sentences=3)
+        return f"Wikipedia Summary: {wiki_res}"
+    except Exception as e:
+         print(f"   ❌ Wikipedia failed: {e}")
+    return None
+
+
+def _providers(query: str) -> List[Tuple[str, Callable[[], str | None]]]:
+    """The providers a search tries in order (Tavily -> DuckDuckGo -> Wikipedia), with their blocking calls."""
+    if mock_providers.search_enabled():
+        return [(PROVIDER_MOCK, lambda: mock_providers.mock_web_search(query))]
+    print(f"🔎 Searching for: '{query}'")
+    print(f"DEBUG: Tavily Key Loaded? {bool(os.getenv('TAVILY_API_KEY'))}")
+    print(f"DEBUG: Tavily python package present? {has_tavily_pkg}, Tavily CLI present? {has_tavily_cli}")
+    chain = []
+    # STRATEGY A: TAVILY (Best for Agents) - try hard first
+    if os.getenv("TAVILY_API_KEY"):
+        chain.append((PROVIDER_TAVILY, lambda: _search_tavily(query)))
     # STRATEGY B: DUCKDUCKGO (Free backup)
     if has_ddg:
-        try:
-            print("   -> Trying DuckDuckGo...")
-            # Use the text method directly
-            ddg_results = DDGS().text(query, max_results=3)
-            if ddg_results:
-                try:
-                    with open('/tmp/web_search_debug.log', 'a', encoding='utf-8') as dbg:
-                        dbg.write('DDG_RAW_RESULTS:\n')
-                        dbg.write(str(ddg_results) + '\n---\n')
-                except Exception:
-                    pass
-                for r in ddg_results:
-                    # DDG keys vary, handle safely
-                    title = r.get('title', 'No Title')
-                    body = r.get('body', r.get('content', ''))
-                    results.append(f"Title: {title}\nSnippet: {body}\n")
-                return "\n".join(results)
-        except Exception as e:
-            print(f"   ❌ DuckDuckGo failed: {e}")
-
+        chain.append((PROVIDER_DDG, lambda: _search_duckduckgo(query)))
     # STRATEGY C: WIKIPEDIA (Last Resort)
     if has_wiki:
-        try:
-            print("   -> Trying Wikipedia...")
-            wiki_res = wikipedia.summary(query, sentences=3)
-            return f"Wikipedia Summary: {wiki_res}"
-        except Exception as e:
-             print(f"   ❌ Wikipedia failed: {e}")
+        chain.append((PROVIDER_WIKIPEDIA, lambda: _search_wikipedia(query)))
+    return chain
 
-    return "System Error: Search failed on all providers. Please check your internet or API keys."
 
+async def _web_search_live(query: str) -> str:
+    """One search through the providers; tokens are awaited here, provider calls run on the network pool."""
+    for provider, call in _providers(query):
+        if await _provider_slot(provider):
+            out = await run_in(POOL_NETWORK, call)
+            if out:
+                return out
+    return SEARCH_FAILED_MESSAGE
 
-def file_writer_raw(*args, **kwargs) -> str:
-    """Writes content to backend/data/filename.
 
-    Robust argument parsing: supports positional args and many keyword names.
-    Ensures path safety by forcing writes into `backend/data/` directory.
+def _web_search_live_sync(query: str) -> str:
+    """`_web_search_live` for blocking callers on an executor thread."""
+    for provider, call in _providers(query):
+        if _provider_slot_blocking(provider):
+            out = call()
+            if out:
+                return out
+    return SEARCH_FAILED_MESSAGE
+
+
+def _resolve_write_args(args: tuple, kwargs: dict) -> Tuple[str, str]:
+    """Resolve (filename, content) from positional args and the many aliases models use.
+
     Raises ValueError when no content can be determined.
     """
-    try:
-        # Path management using pathlib for safety
-        from pathlib import Path
+    filename = None
+    content = None
+    if len(args) > 0:
+        filename = args[0]
+    if len(args) > 1:
+        content = args[1]
+
+    # Resolve from kwargs with multiple alias support
+    if filename is None:
+        filename = kwargs.get('filename') or kwargs.get('file') or kwargs.get('path') or 'output.txt'
 
-        BASE_DIR = Path(__file__).resolve().parents[2]
-        DATA_DIR = BASE_DIR / "data"
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if content is None:
+        content = (
+            kwargs.get('content')
+            or kwargs.get('data')
+            or kwargs.get('text')
+            or kwargs.get('body')
+            or None
+        )
 
-        # Debug: show received args/kwargs
+    # If still no content, raise so caller can attempt to auto-fill
+    if content is None or (isinstance(content, str) and content.strip() == ''):
+        raise ValueError("No content provided")
+
+    # Ensure content is string
+    if not isinstance(content, str):
         try:
-            print(f"DEBUG: file_writer received args: {args}, kwargs: {list(kwargs.keys())}")
+            content = str(content)
         except Exception:
-            pass
-
-        # Resolve filename and content from args first
-        filename = None
-        content = None
-        if len(args) > 0:
-            filename = args[0]
-        if len(args) > 1:
-            content = args[1]
-
-        # Resolve from kwargs with multiple alias support
-        if filename is None:
-            filename = kwargs.get('filename') or kwargs.get('file') or kwargs.get('path') or 'output.txt'
-
-        if content is None:
-            content = (
-                kwargs.get('content')
-                or kwargs.get('data')
-                or kwargs.get('text')
-                or kwargs.get('body')
-                or None
-            )
-
-        # If still no content, raise so caller can attempt to auto-fill
-        if content is None or (isinstance(content, str) and content.strip() == ''):
-            raise ValueError("No content provided")
-
-        # Ensure content is string
-        if not isinstance(content, str):
-            try:
-                content = str(content)
-            except Exception:
-                content = ''
+            content = ''
+    return str(filename), content
+
 
-        filepath = DATA_DIR / str(filename)
+def _write_file(*args, **kwargs):
+    """Write the resolved content under backend/data/ and return the path written.
 
-        # Write file
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+    `mode="append"` (or `append=True`) appends instead of atomically replacing the file.
+    """
+    # Debug: show received args/kwargs
+    try:
+        print(f"DEBUG: file_writer received args: {args}, kwargs: {list(kwargs.keys())}")
+    except Exception:
+        pass
+
+    filename, content = _resolve_write_args(args, kwargs)
+    if kwargs.get("append") is True or str(kwargs.get("mode", "")).lower() in ("a", "append"):
+        return file_output.append_text(filename, content).path
+    return file_output.write_text(filename, content).path
+
+
+def file_writer_raw(*args, **kwargs) -> str:
+    """Writes content to backend/data/filename.
 
+    Robust argument parsing: supports positional args and many keyword names.
+    Ensures path safety by forcing writes into `backend/data/` directory
+    (see app/services/file_output.py).
+    Raises ValueError when no content can be determined.
+    """
+    try:
+        filepath = _write_file(*args, **kwargs)
         return f"Successfully wrote to {str(filepath)}"
     except ValueError:
         # propagate ValueError so callers can handle auto-fill
@@ -233,6 +401,41 @@ def file_writer_raw(*args, **kwargs) -> str:
     except Exception as e:
         return f"Error writing file: {str(e)}"
 
+
+def run_file_writer(**kwargs) -> ToolResult:
+    """file_writer for the agent runtime: never raises, reports the write as an effect."""
+    try:
+        filepath = _write_file(**kwargs)
+    except ValueError:
+        return ToolResult("file_writer", False, "Error: No content provided for file_writer")
+    except Exception as e:
+        return ToolResult("file_writer", False, f"Error writing file: {str(e)}")
+    return ToolResult("file_writer", True, f"Successfully wrote to {str(filepath)}", (EFFECT_FILE_WRITTEN,), str(filepath))
+
+
+async def run_web_search(query: str = "", **kwargs) -> ToolResult:
+    """web_search for the agent runtime: a failed search is reported as not ok."""
+    query = query or kwargs.get("q") or kwargs.get("input") or ""
+    if not str(query).strip():
+        return ToolResult("web_search_tool", False, "Error: web_search_tool needs a 'query'.")
+    out = await web_search(str(query))
+    if out == SEARCH_FAILED_MESSAGE:
+        return ToolResult("web_search_tool", False, out)
+    return ToolResult("web_search_tool", True, out, (EFFECT_SEARCHED,))
+
+
+# Structured runners used by the agent loop, keyed by the tool names the model sees;
+# async runners are awaited directly and dispatch their own blocking work.
+TOOL_RUNNERS = {
+    "web_search_tool": run_web_search,
+    "file_writer": run_file_writer,
+}
+
+# Executor pool each blocking tool runs on (app/services/executors.py); unknown tools use "network".
+TOOL_POOLS = {
+    "file_writer": "disk",
+}
+
 # Create LangChain Tool Wrappers
 @tool("web_search_tool")
 def web_search_tool(query: str) -> str:
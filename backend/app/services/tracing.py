@@ -0,0 +1,228 @@
+"""Per-execution timeline traces in Chrome Trace Event format.
+
+The engines start a Trace per run and give every node its own lane (a "thread"
+in the viewer), so overlapping nodes show up side by side:
+
+    trace = tracing.start(run_id)
+    with tracing.activate(trace, lane=f"node {nid}"), tracing.span(f"node {nid}", "node"):
+        ...
+    await tracing.finish(trace)
+
+Inside an active trace, `span(...)` records a nested complete ("X") event, and
+every `metrics.record` / `metrics.timer` observation (LLM calls, tool calls,
+executor and LLM-queue waits, embeddings, DB commits) becomes a span ending
+when it was recorded. The active trace and lane live in ContextVars, which the
+executor pools copy into worker threads, so blocking work run off the loop
+lands on its node's lane.
+
+`get(id)` returns the trace as JSON that chrome://tracing, Perfetto or
+speedscope open directly. The most recent TRACE_RETAINED traces stay in
+memory; finished ones are also written to data/traces/{id}.json.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List
+
+from app.config import settings
+from app.services import metrics
+from app.services.file_output import resolve_path, write_async
+
+PID = 1
+MAIN_LANE = "run"
+TRACE_DIR = "traces"
+
+# The engines open an explicit span per node; their node timer would duplicate it.
+_UNTRACED_METRICS = ("node_duration_seconds",)
+
+_dropped = metrics.registry.counter("trace_events_dropped_total", "Trace events dropped because a trace hit TRACE_MAX_EVENTS")
+
+
+class Trace:
+    def __init__(self, trace_id: str, max_events: int):
+        self.id = str(trace_id)
+        self.max_events = max(int(max_events), 1)
+        self.aliases: List[str] = []
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.t0 = time.perf_counter()
+        self.events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": PID, "tid": 0, "args": {"name": f"execution {self.id}"}},
+        ]
+        self.dropped = 0
+        self.finished = False
+        self._lanes: Dict[str, int] = {}
+        self._lane_names: List[str] = []
+        self._lock = threading.Lock()
+        self.lane(MAIN_LANE)
+
+    def _us(self, t: float) -> float:
+        return round((t - self.t0) * 1e6, 1)
+
+    def lane(self, name: str) -> int:
+        """Thread id of lane `name`, announcing it to the viewer on first use."""
+        with self._lock:
+            tid = self._lanes.get(name)
+            if tid is None:
+                tid = self._lanes[name] = len(self._lane_names)
+                self._lane_names.append(name)
+                self.events.append({"name": "thread_name", "ph": "M", "pid": PID, "tid": tid, "args": {"name": name}})
+                self.events.append({"name": "thread_sort_index", "ph": "M", "pid": PID, "tid": tid, "args": {"sort_index": tid}})
+            return tid
+
+    def lane_name(self, tid: int) -> str:
+        return self._lane_names[tid] if 0 <= tid < len(self._lane_names) else MAIN_LANE
+
+    def complete(self, name: str, cat: str, start: float, end: float, tid: int = 0, args: Dict[str, Any] | None = None) -> None:
+        """Add a complete event for perf_counter() times `start`..`end`."""
+        event = {"name": name, "cat": cat, "ph": "X", "pid": PID, "tid": tid, "ts": self._us(start), "dur": round(max(end - start, 0.0) * 1e6, 1)}
+        if args:
+            event["args"] = {k: v if isinstance(v, (int, float, bool)) or v is None else str(v) for k, v in args.items()}
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                _dropped.inc()
+                return
+            self.events.append(event)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "execution_id": self.id,
+                "aliases": list(self.aliases),
+                "started_at": self.started_at,
+                "finished": self.finished,
+                "dropped_events": self.dropped,
+            },
+        }
+
+
+_current: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_current_lane: ContextVar[int] = ContextVar("trace_lane", default=0)
+
+_traces: "OrderedDict[str, Trace]" = OrderedDict()
+_aliases: Dict[str, str] = {}
+_registry_lock = threading.Lock()
+
+
+def start(trace_id: str) -> Trace | None:
+    """A new trace for execution `trace_id`, or None with TRACING_ENABLED off."""
+    if not settings.TRACING_ENABLED:
+        return None
+    trace = Trace(trace_id, settings.TRACE_MAX_EVENTS)
+    with _registry_lock:
+        _traces[trace.id] = trace
+        while len(_traces) > max(settings.TRACE_RETAINED, 1):
+            _, old = _traces.popitem(last=False)
+            for a in old.aliases:
+                _aliases.pop(a, None)
+    return trace
+
+
+def alias(trace: Trace | None, name: str) -> None:
+    """Make `trace` retrievable under `name` too (e.g. the stored execution id)."""
+    if trace is None or name is None:
+        return
+    with _registry_lock:
+        trace.aliases.append(str(name))
+        _aliases[str(name)] = trace.id
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def activate(trace: Trace | None, lane: str | None = None) -> Iterator[None]:
+    """Make `trace` (and its lane `lane`) the target of spans recorded in this block."""
+    if trace is None:
+        yield
+        return
+    t1 = _current.set(trace)
+    t2 = _current_lane.set(trace.lane(lane) if lane else 0)
+    try:
+        yield
+    finally:
+        _current_lane.reset(t2)
+        _current.reset(t1)
+
+
+@contextmanager
+def sublane(name: str) -> Iterator[None]:
+    """Give the block its own lane under the current one (concurrent work inside one node)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with activate(trace, f"{trace.lane_name(_current_lane.get())} / {name}"):
+        yield
+
+
+@contextmanager
+def span(name: str, cat: str = "app", **args) -> Iterator[None]:
+    """Record the enclosed block (sync or spanning awaits) as a nested span of the active trace."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    tid = _current_lane.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        trace.complete(name, cat, t0, time.perf_counter(), tid, args)
+
+
+def _on_record(name: str, seconds: float, breakdown: str | None, labels: Dict[str, Any]) -> None:
+    trace = _current.get()
+    if trace is None or name in _UNTRACED_METRICS:
+        return
+    end = time.perf_counter()
+    stem = name[: -len("_seconds")] if name.endswith("_seconds") else name
+    trace.complete(breakdown or stem, stem, end - seconds, end, _current_lane.get(), labels)
+
+
+metrics.add_observer(_on_record)
+
+
+def _path(trace_id: str) -> str:
+    safe = "".join(c for c in str(trace_id) if c.isalnum() or c in "-_")
+    return f"{TRACE_DIR}/{safe}.json"
+
+
+async def finish(trace: Trace | None) -> None:
+    """Close the run's trace and write it (under its id and aliases) to data/traces/."""
+    if trace is None or trace.finished:
+        return
+    trace.complete("run", "execution", trace.t0, time.perf_counter(), 0)
+    trace.finished = True
+    text = json.dumps(trace.to_chrome(), separators=(",", ":"))
+    for name in [trace.id, *trace.aliases]:
+        try:
+            await write_async(_path(name), text)
+        except Exception as e:
+            print(f"⚠️ Could not persist trace {name}: {e}")
+
+
+def get(trace_id: str) -> Dict[str, Any] | None:
+    """Chrome Trace Event JSON of an execution (run id or stored execution id), or None."""
+    key = str(trace_id)
+    with _registry_lock:
+        trace = _traces.get(_aliases.get(key, key))
+    if trace is not None:
+        return trace.to_chrome()
+    try:
+        with open(resolve_path(_path(key)), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError, OSError):
+        return None
@@ -1,5 +1,31 @@
 import json
+import re
 
 
 def to_json(obj):
     return json.loads(json.dumps(obj, default=str))
+
+
+# Rough BPE-style token approximation: words and individual punctuation marks.
+# Good enough for budgeting without shipping a tokenizer with the backend.
+TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in `text`."""
+    if not text:
+        return 0
+    return len(TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = "\n[... truncated {n} tokens ...]") -> str:
+    """Cut `text` after roughly `max_tokens` tokens, appending a marker with the dropped count."""
+    if max_tokens <= 0:
+        return ""
+    if not text:
+        return text
+    matches = list(TOKEN_RE.finditer(text))
+    if len(matches) <= max_tokens:
+        return text
+    cut = matches[max_tokens - 1].end()
+    return text[:cut] + marker.format(n=len(matches) - max_tokens)
@@ -0,0 +1,285 @@
+"""Compressed in-memory index of chunk embeddings for a first scoring pass.
+
+With EMBEDDING_QUANTIZATION set, `RAGService.search` scores the query against
+compressed codes held in RAM and only loads a shortlist of
+EMBEDDING_RESCORE_CANDIDATES chunks from `document_chunks` to rescore them with
+their full vectors. Modes:
+
+    none   exact cosine over every stored vector (no index)
+    int8   per-vector scaled int8 codes: d bytes + 4 per chunk (~4x smaller than float32)
+    pq     product quantization: one byte per EMBEDDING_PQ_SUBVECTOR_DIM dims
+           (~16x smaller at the default of 4), scored with per-query lookup tables
+
+Vectors are L2-normalised before encoding, so code scores approximate cosine
+similarity. The index is built from the table on first use, extended as
+documents are ingested, shrunk as they are deleted and rebuilt when it goes
+stale (PQ codebooks trained on far fewer vectors than the index holds, or
+compaction rewrote the table). Chunks added or removed while a build reads the
+table are replayed onto the new index.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.config import settings
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import metrics
+from app.services.executors import POOL_CPU, run_in
+
+QUANT_NONE = "none"
+QUANT_INT8 = "int8"
+QUANT_PQ = "pq"
+QUANTIZATIONS = (QUANT_NONE, QUANT_INT8, QUANT_PQ)
+
+PQ_CENTROIDS = 256  # codes are uint8
+PQ_TRAIN_ITERS = 10
+PQ_TRAIN_SAMPLE = 8192
+SCORE_BLOCK = 8192  # rows decoded at once, so scoring never materialises a full float matrix
+
+_index_bytes = metrics.registry.gauge("vector_index_bytes", "Memory held by the compressed chunk-embedding index")
+
+
+def normalize_quantization(value: str | None) -> str:
+    value = (value or QUANT_NONE).lower()
+    return value if value in QUANTIZATIONS else QUANT_NONE
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = (-2.0 * x @ centroids.T + (centroids * centroids).sum(1)[None, :]).argmin(1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack([np.bincount(assign, weights=x[:, j], minlength=k) for j in range(x.shape[1])], axis=1)
+        filled = counts > 0  # empty clusters keep their previous centroid
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+@dataclass(frozen=True)
+class _Codes:
+    ids: np.ndarray  # int64 chunk ids
+    codes: np.ndarray  # int8 (n, d) or uint8 (n, m)
+    scales: np.ndarray | None = None  # int8: per-vector dequantisation scale
+
+
+class VectorIndex:
+    def __init__(self, mode: str, subvector_dim: int = 4, seed: int = 0):
+        self.mode = normalize_quantization(mode)
+        if self.mode == QUANT_NONE:
+            raise ValueError("VectorIndex needs a quantization mode (int8 or pq)")
+        self.subvector_dim = max(int(subvector_dim), 1)
+        self.seed = seed
+        self.dim: int | None = None
+        self.codebooks: np.ndarray | None = None  # pq: (m, k, subvector_dim)
+        self.trained_on = 0
+        self.stale = False
+        self._codes = _Codes(np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.int8))
+
+    @property
+    def size(self) -> int:
+        return len(self._codes.ids)
+
+    def memory_bytes(self) -> int:
+        c = self._codes
+        total = c.ids.nbytes + c.codes.nbytes + (c.scales.nbytes if c.scales is not None else 0)
+        return total + (self.codebooks.nbytes if self.codebooks is not None else 0)
+
+    def _matrix(self, ids: Sequence[int], vectors: Sequence[Sequence[float]]):
+        keep = [(i, v) for i, v in zip(ids, vectors) if v is not None and len(v) == self.dim]
+        if not keep:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.array([i for i, _ in keep], dtype=np.int64), _normalize(np.array([v for _, v in keep], dtype=np.float32))
+
+    def _padded(self, x: np.ndarray) -> np.ndarray:
+        m = -(-self.dim // self.subvector_dim)
+        pad = m * self.subvector_dim - self.dim
+        if pad:
+            x = np.pad(x, ((0, 0), (0, pad)))
+        return x.reshape(len(x), m, self.subvector_dim)
+
+    def _train(self, x: np.ndarray) -> None:
+        rng = np.random.default_rng(self.seed)
+        if len(x) > PQ_TRAIN_SAMPLE:
+            x = x[rng.choice(len(x), size=PQ_TRAIN_SAMPLE, replace=False)]
+        sub = self._padded(x)
+        k = min(PQ_CENTROIDS, len(x))
+        self.codebooks = np.stack([_kmeans(sub[:, j, :], k, PQ_TRAIN_ITERS, rng) for j in range(sub.shape[1])]).astype(np.float32)
+        self.trained_on = len(x)
+
+    def _encode(self, ids: np.ndarray, x: np.ndarray) -> _Codes:
+        if self.mode == QUANT_INT8:
+            scales = np.abs(x).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8)
+            return _Codes(ids, codes, scales.astype(np.float32))
+        sub = self._padded(x)
+        codes = np.empty((len(x), sub.shape[1]), dtype=np.uint8)
+        for j in range(sub.shape[1]):
+            cb = self.codebooks[j]
+            dist = -2.0 * sub[:, j, :] @ cb.T + (cb * cb).sum(1)[None, :]
+            codes[:, j] = dist.argmin(1)
+        return _Codes(ids, codes)
+
+    def build(self, ids: Sequence[int], vectors: Sequence[Sequence[float]]) -> None:
+        """(Re)build from scratch; the dimension is taken from the first vector."""
+        self.dim = next((len(v) for v in vectors if v is not None and len(v)), None)
+        self.codebooks, self.trained_on, self.stale = None, 0, False
+        ids_arr, x = self._matrix(ids, vectors)
+        if not len(x):
+            self._codes = _Codes(ids_arr, np.zeros((0, 0), dtype=np.int8))
+            return
+        if self.mode == QUANT_PQ:
+            self._train(x)
+        self._codes = self._encode(ids_arr, x)
+        _index_bytes.set(self.memory_bytes(), mode=self.mode)
+
+    def add(self, ids: Sequence[int], vectors: Sequence[Sequence[float]]) -> None:
+        if not self.size:
+            self.build(ids, vectors)
+            return
+        cur = self._codes
+        ids_arr, x = self._matrix(ids, vectors)
+        fresh = ~np.isin(ids_arr, cur.ids)  # a chunk is indexed once, however often it is reported
+        ids_arr, x = ids_arr[fresh], x[fresh]
+        if not len(x):
+            return
+        enc = self._encode(ids_arr, x)
+        self._codes = _Codes(
+            np.concatenate([cur.ids, enc.ids]),
+            np.concatenate([cur.codes, enc.codes]),
+            np.concatenate([cur.scales, enc.scales]) if cur.scales is not None else None,
+        )
+        if self.mode == QUANT_PQ and self.size > 2 * self.trained_on and self.trained_on < PQ_TRAIN_SAMPLE:
+            self.stale = True
+        _index_bytes.set(self.memory_bytes(), mode=self.mode)
+
+    def remove(self, ids: Sequence[int]) -> None:
+        """Drop chunks (deleted documents) from the index; no re-encoding needed."""
+        cur = self._codes
+        keep = ~np.isin(cur.ids, np.asarray(list(ids), dtype=np.int64))
+        if keep.all():
+            return
+        self._codes = _Codes(cur.ids[keep], cur.codes[keep], cur.scales[keep] if cur.scales is not None else None)
+        _index_bytes.set(self.memory_bytes(), mode=self.mode)
+
+    def scores(self, query: Sequence[float], c: _Codes | None = None) -> np.ndarray:
+        """Approximate cosine similarity of `query` to every indexed vector."""
+        c = c or self._codes
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))
+        out = np.empty(len(c.ids), dtype=np.float32)
+        if self.mode == QUANT_INT8:
+            for start in range(0, len(out), SCORE_BLOCK):
+                block = slice(start, start + SCORE_BLOCK)
+                out[block] = (c.codes[block].astype(np.float32) @ q[0]) * c.scales[block]
+            return out
+        # asymmetric distance: per-subspace table of query . centroid, summed per code
+        table = np.einsum("mkd,md->mk", self.codebooks, self._padded(q)[0]).ravel()
+        offsets = (np.arange(c.codes.shape[1]) * self.codebooks.shape[1])[None, :]
+        for start in range(0, len(out), SCORE_BLOCK):
+            block = slice(start, start + SCORE_BLOCK)
+            out[block] = np.take(table, c.codes[block] + offsets).sum(axis=1)
+        return out
+
+    def shortlist(self, query: Sequence[float], n: int) -> List[int]:
+        """Ids of the `n` best-scoring vectors, best first."""
+        c = self._codes  # add() swaps in a new snapshot; score one consistently
+        if not len(c.ids) or self.dim is None or len(query) != self.dim:
+            return []
+        scores = self.scores(query, c)
+        n = min(max(int(n), 1), len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return c.ids[top].tolist()
+
+
+class ChunkIndex:
+    """The VectorIndex over `document_chunks`, loaded lazily from the database."""
+
+    def __init__(self):
+        self.index: VectorIndex | None = None
+        self._lock = asyncio.Lock()
+        self._invalidations = 0
+        # adds/removes that arrive while a build reads the table, replayed onto the new index
+        self._pending: List[Tuple[str, Sequence[int], Sequence[Sequence[float]] | None]] | None = None
+
+    @property
+    def mode(self) -> str:
+        return normalize_quantization(settings.EMBEDDING_QUANTIZATION)
+
+    def _current(self) -> VectorIndex | None:
+        index = self.index
+        if index is None or index.mode != self.mode or index.stale:
+            return None
+        return index
+
+    async def ensure_loaded(self) -> VectorIndex | None:
+        if self.mode == QUANT_NONE:
+            return None
+        index = self._current()
+        if index is not None:
+            return index
+        async with self._lock:
+            index = self._current()
+            if index is not None:
+                return index
+            invalidations = self._invalidations
+            self._pending = []
+            try:
+                async with AsyncSessionLocal() as session:
+                    res = await session.execute(select(models.DocumentChunk.id, models.DocumentChunk.embedding))
+                    rows = res.all()
+                index = VectorIndex(self.mode, settings.EMBEDDING_PQ_SUBVECTOR_DIM)
+                await run_in(POOL_CPU, index.build, [r[0] for r in rows], [r[1] for r in rows])
+                # chunks written while the table was being read may or may not be in it
+                for op, ids, vectors in self._pending:
+                    if op == "add":
+                        index.add(ids, vectors)
+                    else:
+                        index.remove(ids)
+            finally:
+                self._pending = None
+            # a compaction during the build rewrote the table under it
+            index.stale = index.stale or invalidations != self._invalidations
+            self.index = index
+            print(f"🗜️ Built {index.mode} chunk index: {index.size} vectors, {index.memory_bytes()} bytes")
+            return index
+
+    def add(self, ids: Sequence[int], vectors: Sequence[Sequence[float]]) -> None:
+        """Index newly stored chunks (no-op until the index is first built)."""
+        if self._pending is not None:
+            self._pending.append(("add", list(ids), list(vectors)))
+        elif self.index is not None:
+            self.index.add(ids, vectors)
+
+    def remove(self, ids: Sequence[int]) -> None:
+        if self._pending is not None:
+            self._pending.append(("remove", list(ids), None))
+        elif self.index is not None:
+            self.index.remove(ids)
+
+    def invalidate(self) -> None:
+        """Rebuild from the table on next use (after compaction rewrote it)."""
+        self._invalidations += 1
+        if self.index is not None:
+            self.index.stale = True
+
+    async def candidates(self, query: Sequence[float], top_k: int) -> List[int] | None:
+        """Shortlisted chunk ids for `query`, or None when search should stay exact."""
+        index = await self.ensure_loaded()
+        if index is None or index.dim != len(query):
+            return None
+        n = max(settings.EMBEDDING_RESCORE_CANDIDATES, top_k)
+        return await run_in(POOL_CPU, index.shortlist, query, n)
+
+
+chunk_index = ChunkIndex()
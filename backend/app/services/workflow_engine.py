@@ -1,13 +1,15 @@
 from typing import Any, Dict
 from app.db import models
 from app.db.database import AsyncSessionLocal
-from app.services import llm_adapter, rag_service
+from app.services import execution_context, llm_adapter, metrics, profiling, rag_service, tracing
+from app.services.event_bus import event_bus
+from app.services.graph import GraphCycleError, compile_graph
 import asyncio
 from sqlalchemy import insert
 import json
 
 
-async def run_workflow(workflow_id: int):
+async def run_workflow(workflow_id: int, priority: str = execution_context.PRIORITY_INTERACTIVE):
     """Run a workflow stored in DB (synchronously for MVP)."""
     async with AsyncSessionLocal() as session:
         wf = await session.get(models.Workflow, workflow_id)
@@ -17,14 +19,43 @@ async def run_workflow(workflow_id: int):
         execution = models.Execution(workflow_id=workflow_id, status="running")
         session.add(execution)
         await session.flush()
+        event_bus.publish(str(execution.id), {"type": "run", "run_id": str(execution.id), "execution_id": execution.id})
+        trace = tracing.start(str(execution.id))
+        profiling.attach(execution.id)
+        try:
+            with execution_context.scope(str(execution.id), priority), tracing.activate(trace):
+                result = await _run_nodes(session, wf, execution)
+            event_bus.publish(str(execution.id), {"type": "end", **result})
+            return result
+        finally:
+            event_bus.close(str(execution.id))
+            await tracing.finish(trace)
 
-        # nodes expected in wf.graph_json["nodes"]
-        nodes = wf.graph_json.get("nodes", [])
-        for node in nodes:
-            node_id = node.get("id")
-            ntype = node.get("type") or node.get("data", {}).get("nodeType", "llm_node")
-            input_obj = node.get("data", {})
-            output_obj = {}
+
+async def _run_nodes(session, wf: models.Workflow, execution: models.Execution):
+    """Execute the workflow's nodes in dependency order, persisting one StepResult per node."""
+    # nodes expected in wf.graph_json["nodes"], edges (source/target) in wf.graph_json["edges"]
+    nodes = wf.graph_json.get("nodes", [])
+    edges = wf.graph_json.get("edges", [])
+    by_id = {node.get("id"): node for node in nodes}
+    try:
+        graph = compile_graph(list(by_id), [(e.get("source"), e.get("target")) for e in edges])
+    except GraphCycleError as e:
+        print(f"⚠️ Workflow {wf.id} has a cycle through {e.nodes}; not running")
+        execution.status = "failed"
+        with metrics.timer("db_commit_seconds", breakdown="db", op="execution"):
+            await session.commit()
+        return {"execution_id": execution.id, "status": "failed", "error": str(e)}
+
+    for node_id in graph.order:
+        node = by_id[node_id]
+        ntype = node.get("type") or node.get("data", {}).get("nodeType", "llm_node")
+        input_obj = node.get("data", {})
+        output_obj = {}
+        channel = str(execution.id)
+        event_bus.publish(channel, {"type": "start", "node_id": node_id})
+        # nodes run one after another, so they share the run's trace lane
+        with tracing.span(f"node {node_id}", "node", type=ntype):
             try:
                 if ntype == "rag_node":
                     query = input_obj.get("query") or input_obj.get("prompt") or ""
@@ -46,8 +77,11 @@ async def run_workflow(workflow_id: int):
                     output=output_obj,
                 )
                 session.add(step)
-                await session.flush()
+                with metrics.timer("db_commit_seconds", breakdown="db", op="step_flush"):
+                    await session.flush()
+                event_bus.publish(channel, {"type": "result", "node_id": node_id, "result": output_obj})
             except Exception as e:
+                event_bus.publish(channel, {"type": "error", "node_id": node_id, "error": str(e)})
                 step = models.StepResult(
                     execution_id=execution.id,
                     node_id=str(node_id),
@@ -57,10 +91,12 @@ async def run_workflow(workflow_id: int):
                 )
                 session.add(step)
                 execution.status = "failed"
-                await session.commit()
+                with metrics.timer("db_commit_seconds", breakdown="db", op="execution"):
+                    await session.commit()
                 return {"execution_id": execution.id, "status": "failed"}
 
-        execution.status = "completed"
+    execution.status = "completed"
+    with metrics.timer("db_commit_seconds", breakdown="db", op="execution"):
         await session.commit()
-        return {"execution_id": execution.id, "status": "completed"}
+    return {"execution_id": execution.id, "status": "completed"}
 
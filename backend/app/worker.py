@@ -0,0 +1,174 @@
+"""Worker process executing queued graph runs (see app/services/job_queue.py).
+
+Start as many as the machine (or several machines sharing DATABASE_URL) can
+take; each runs up to --concurrency jobs at once with the same engine as
+POST /workflow/run, in its own process with its own executor pools:
+
+    python -m app.worker
+    python -m app.worker --concurrency 4 --worker-id gpu-box-1
+    python -m app.worker --exit-when-idle      # drain the queue, then exit
+
+SIGINT/SIGTERM stop claiming new jobs and let running ones finish; a second
+signal cancels them (their leases then run out and other workers retry them).
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.config import settings  # noqa: E402
+from app.db import models  # noqa: E402
+from app.db.database import init_db  # noqa: E402
+from app.routes.execution import WorkflowRequest, graph_events  # noqa: E402
+from app.services import job_queue  # noqa: E402
+from app.services.executors import shutdown_all as shutdown_executors  # noqa: E402
+
+
+class EventWriter:
+    """Buffers a job's events and writes them in batches (JOB_EVENT_BATCH, every JOB_EVENT_FLUSH_S)."""
+
+    def __init__(self, job_id: int, attempt: int):
+        self.job_id = job_id
+        self.attempt = attempt
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        self._flusher = asyncio.ensure_future(self._flush_periodically())
+
+    async def add(self, event: Dict[str, Any]) -> None:
+        self._buffer.append(event)
+        if len(self._buffer) >= max(settings.JOB_EVENT_BATCH, 1):
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            events, self._buffer = self._buffer, []
+            await job_queue.append_events(self.job_id, self.attempt, events)
+
+    async def _flush_periodically(self) -> None:
+        # an engine waiting on a long node yields nothing; its last events still reach followers
+        while True:
+            await asyncio.sleep(settings.JOB_EVENT_FLUSH_S)
+            if self._buffer:
+                await self.flush()
+
+    async def close(self) -> None:
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+
+
+async def run_job(job: models.ExecutionJob, worker_id: str) -> None:
+    print(f"👷 Worker {worker_id} running job {job.id} (run {job.run_id}, attempt {job.attempts})")
+    lost = asyncio.Event()
+
+    async def heartbeat() -> None:
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_S)
+            try:
+                alive = await job_queue.heartbeat(job.id, worker_id)
+            except Exception as e:
+                print(f"⚠️ Heartbeat of job {job.id} failed: {e}")
+                continue
+            if not alive:
+                lost.set()
+                return
+
+    async def should_stop() -> bool:
+        return lost.is_set()
+
+    beats = asyncio.ensure_future(heartbeat())
+    writer = EventWriter(job.id, job.attempts)
+    status, execution_id, error = job_queue.STATUS_FAILED, None, None
+    try:
+        payload = WorkflowRequest(**job.payload)
+        async for event in graph_events(payload, job.run_id, job.priority, should_stop, source="worker"):
+            await writer.add(event)
+            if event.get("type") == "end":
+                status, execution_id = job_queue.STATUS_COMPLETED, event.get("execution_id")
+            elif event.get("type") == "error" and event.get("node_id") is None:
+                error = str(event.get("error"))
+    except Exception as e:
+        error = str(e)
+        await writer.add({"type": "error", "node_id": None, "error": error})
+    finally:
+        beats.cancel()
+        await writer.close()
+    if lost.is_set():
+        print(f"🔌 Job {job.id} was cancelled or taken over; stopped")
+        return
+    if status != job_queue.STATUS_COMPLETED and error is None:
+        error = "run stopped"
+    await job_queue.finish(job.id, worker_id, status, execution_id, error)
+    print(f"✅ Job {job.id} {status}")
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY, help="jobs run at once")
+    ap.add_argument("--worker-id", default=None, help="defaults to host-pid")
+    ap.add_argument("--exit-when-idle", action="store_true", help="exit once the queue is empty and nothing runs")
+    args = ap.parse_args()
+
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    await init_db()
+    stopping = asyncio.Event()
+    running: set = set()
+
+    def on_signal() -> None:
+        if stopping.is_set():
+            for task in running:
+                task.cancel()
+        stopping.set()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, on_signal)
+        except NotImplementedError:  # Windows
+            pass
+
+    print(f"👷 Worker {worker_id} polling for jobs (concurrency {args.concurrency})")
+    t0 = time.monotonic()
+    done_jobs = 0
+    while not stopping.is_set():
+        while len(running) < max(args.concurrency, 1):
+            try:
+                job = await job_queue.claim(worker_id)
+            except Exception as e:
+                print(f"⚠️ Could not claim a job: {e}")
+                job = None
+            if job is None:
+                break
+            running.add(asyncio.ensure_future(run_job(job, worker_id)))
+        if not running and args.exit_when_idle:
+            break
+        waits = {*running, asyncio.ensure_future(stopping.wait())}
+        done, _ = await asyncio.wait(waits, timeout=settings.JOB_POLL_S, return_when=asyncio.FIRST_COMPLETED)
+        for task in waits - running:
+            task.cancel()
+        for task in done & running:
+            running.discard(task)
+            done_jobs += 1
+            if not task.cancelled() and task.exception() is not None:
+                print(f"⚠️ Job task failed: {task.exception()}")
+
+    if running:
+        print(f"🛑 Worker {worker_id} stopping; waiting for {len(running)} running job(s)")
+        await asyncio.gather(*running, return_exceptions=True)
+        done_jobs += len(running)
+    shutdown_executors()
+    print(f"👷 Worker {worker_id} ran {done_jobs} job(s) in {time.monotonic() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+"""Compare chunking strategies on a local corpus.
+
+Reports, per strategy: index size (chunks, stored chars, duplicated chars,
+embedding bytes), ingest time (chunk + embed) and retrieval quality
+(hit@k / MRR for query -> answer pairs).
+
+Usage (from backend/):
+    python -m tests.bench_chunking
+    python -m tests.bench_chunking --corpus ./my_docs --queries ./my_docs/queries.jsonl
+
+`--queries` is JSONL with {"query": ..., "answer": ...}; a hit means a retrieved
+chunk contains the answer text. Without --corpus a deterministic synthetic
+corpus with planted facts is generated.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.chunking import STRATEGIES, iter_chunks
+from app.services.embeddings import generate_embedding
+
+_WORDS = (
+    "system data model agent workflow result search context node graph "
+    "latency memory vector index query document chunk token budget cache "
+    "stream event server client request response local network storage"
+).split()
+
+
+def synthetic_corpus(n_docs: int = 20, seed: int = 7) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    rng = random.Random(seed)
+    docs: Dict[str, str] = {}
+    queries: List[Dict[str, str]] = []
+    for d in range(n_docs):
+        paragraphs = []
+        for p in range(8):
+            sentences = []
+            for _ in range(rng.randint(3, 7)):
+                words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+                sentences.append(" ".join(words).capitalize() + ".")
+            if p == 4:
+                code = f"{rng.choice(_WORDS)}{rng.randint(100, 999)}"
+                fact = f"The release codename of project {d} is {code}."
+                sentences.insert(rng.randint(0, len(sentences)), fact)
+                queries.append({"query": f"What is the release codename of project {d}?", "answer": fact})
+            paragraphs.append(" ".join(sentences))
+        docs[f"doc_{d}.txt"] = "\n\n".join(paragraphs)
+    return docs, queries
+
+
+def load_corpus(corpus: Path, queries_path: Path | None) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    docs = {p.name: p.read_text(encoding="utf-8", errors="ignore") for p in sorted(corpus.glob("**/*")) if p.suffix in (".txt", ".md")}
+    queries: List[Dict[str, str]] = []
+    if queries_path:
+        with open(queries_path, encoding="utf-8") as fh:
+            queries = [json.loads(line) for line in fh if line.strip()]
+    return docs, queries
+
+
+async def bench_strategy(strategy: str, docs: Dict[str, str], queries: List[Dict[str, str]], top_k: int) -> Dict:
+    source_chars = sum(len(t) for t in docs.values())
+    chunks: List[str] = []
+    vectors: List[np.ndarray] = []
+
+    t0 = time.perf_counter()
+    for text in docs.values():
+        for c in iter_chunks(text, strategy=strategy):
+            chunks.append(c)
+            vectors.append(np.asarray(await generate_embedding(c), dtype=np.float32))
+    ingest_s = time.perf_counter() - t0
+
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 1), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms[:, None]
+
+    hits = 0
+    rr = 0.0
+    t1 = time.perf_counter()
+    for q in queries:
+        qv = np.asarray(await generate_embedding(q["query"]), dtype=np.float32)
+        qn = np.linalg.norm(qv) or 1.0
+        scores = matrix @ (qv / qn)
+        order = np.argsort(-scores)[:top_k]
+        for rank, idx in enumerate(order, start=1):
+            if q["answer"] in chunks[idx]:
+                hits += 1
+                rr += 1.0 / rank
+                break
+    query_s = time.perf_counter() - t1
+
+    stored_chars = sum(len(c) for c in chunks)
+    return {
+        "strategy": strategy,
+        "chunks": len(chunks),
+        "stored_chars": stored_chars,
+        "duplicated_chars_pct": round(100.0 * max(stored_chars - source_chars, 0) / max(source_chars, 1), 2),
+        "embedding_bytes": int(matrix.size * 4),
+        "ingest_s": round(ingest_s, 4),
+        "query_s": round(query_s, 4),
+        f"hit@{top_k}": round(hits / len(queries), 4) if queries else None,
+        "mrr": round(rr / len(queries), 4) if queries else None,
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", type=Path, default=None)
+    ap.add_argument("--queries", type=Path, default=None)
+    ap.add_argument("--strategies", default=",".join(STRATEGIES))
+    ap.add_argument("--top-k", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.corpus:
+        docs, queries = load_corpus(args.corpus, args.queries)
+    else:
+        docs, queries = synthetic_corpus()
+
+    report = []
+    for strategy in args.strategies.split(","):
+        report.append(await bench_strategy(strategy.strip(), docs, queries, args.top_k))
+    print(json.dumps({"documents": len(docs), "queries": len(queries), "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Offline embedding backends: throughput and retrieval quality.
+
+Compares the old 128-bin character histogram with the hashed n-gram embedder
+(raw term frequencies and query-side TF-IDF) on a chunked corpus:
+
+    texts_per_s          chunk embedding throughput, one text per call
+    batch_texts_per_s    the same chunks in batches of --batch (hashed only)
+    hit@k / mrr          query -> answer retrieval, as in bench_chunking
+
+Usage (from backend/):
+    python -m tests.bench_embeddings
+    python -m tests.bench_embeddings --corpus ./my_docs --queries ./my_docs/queries.jsonl --dim 2048
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from app.services.chunking import iter_chunks
+from app.services.embeddings import _char_histogram
+from app.services.hashed_embeddings import HashedEmbedder
+from tests.bench_chunking import load_corpus, synthetic_corpus
+
+
+def _retrieval(chunks: List[str], matrix: np.ndarray, queries: List[Dict[str, str]], embed_query: Callable[[str], np.ndarray], top_k: int) -> Dict[str, float]:
+    hits, rr = 0, 0.0
+    for q in queries:
+        qv = embed_query(q["query"])
+        order = np.argsort(-(matrix @ qv))[:top_k]
+        for rank, idx in enumerate(order, start=1):
+            if q["answer"] in chunks[idx]:
+                hits += 1
+                rr += 1.0 / rank
+                break
+    n = max(len(queries), 1)
+    return {f"hit@{top_k}": round(hits / n, 4), "mrr": round(rr / n, 4)}
+
+
+def bench_histogram(chunks: List[str], queries: List[Dict[str, str]], top_k: int) -> Dict:
+    t0 = time.perf_counter()
+    matrix = np.array([_char_histogram(c) for c in chunks], dtype=np.float32)
+    elapsed = time.perf_counter() - t0
+    return {
+        "backend": "histogram",
+        "dim": matrix.shape[1],
+        "texts_per_s": round(len(chunks) / elapsed, 1),
+        "batch_texts_per_s": None,
+        **_retrieval(chunks, matrix, queries, lambda q: np.array(_char_histogram(q), dtype=np.float32), top_k),
+    }
+
+
+def bench_hashed(chunks: List[str], queries: List[Dict[str, str]], top_k: int, dim: int, tfidf: bool, batch: int) -> Dict:
+    single = HashedEmbedder(dim, tfidf)
+    t0 = time.perf_counter()
+    for c in chunks:
+        single.encode([c])
+    single_s = time.perf_counter() - t0
+
+    embedder = HashedEmbedder(dim, tfidf)
+    t0 = time.perf_counter()
+    matrix = np.vstack([embedder.encode(chunks[i: i + batch], fit=True) for i in range(0, len(chunks), batch)])
+    batch_s = time.perf_counter() - t0
+    return {
+        "backend": "hashed+tfidf" if tfidf else "hashed",
+        "dim": dim,
+        "texts_per_s": round(len(chunks) / single_s, 1),
+        "batch_texts_per_s": round(len(chunks) / batch_s, 1),
+        **_retrieval(chunks, matrix, queries, lambda q: embedder.encode([q], query=True)[0], top_k),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=None)
+    ap.add_argument("--queries", default=None)
+    ap.add_argument("--docs", type=int, default=60, help="synthetic documents when --corpus is not given")
+    ap.add_argument("--strategy", default="sentence")
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    if args.corpus:
+        docs, queries = load_corpus(Path(args.corpus), Path(args.queries) if args.queries else None)
+    else:
+        docs, queries = synthetic_corpus(args.docs)
+    chunks = [c for text in docs.values() for c in iter_chunks(text, strategy=args.strategy)]
+
+    results = [bench_histogram(chunks, queries, args.top_k)]
+    for tfidf in (False, True):
+        results.append(bench_hashed(chunks, queries, args.top_k, args.dim, tfidf, args.batch))
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Throughput of the local generation fallback with and without micro-batching.
+
+Runs `--callers` concurrent coroutines (default 1, 8 and 32), each issuing
+`--requests` generations, once through a MicroBatcher with max batch 1 (one
+call at a time, the old behaviour) and once with the configured batch size
+and wait window. Reports requests/s, p50/p99 latency and mean batch size as
+JSON.
+
+The default "synthetic" model costs `--base-ms` per batch plus `--item-ms`
+per prompt, the shape of a batched forward pass. `--model transformers` uses
+the real distilgpt2 pipeline from app.services.llm_adapter (transformers must
+be installed).
+
+Usage (from backend/):
+    python -m tests.bench_generation
+    python -m tests.bench_generation --callers 1,8,32 --batch 8 --wait-ms 10 --base-ms 80 --item-ms 8
+    python -m tests.bench_generation --model transformers --requests 2
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from app.config import settings
+from app.services.batching import MicroBatcher
+
+
+def synthetic_model(base_ms: float, item_ms: float) -> Callable[[List[str]], List[str]]:
+    def run(prompts: List[str]) -> List[str]:
+        time.sleep((base_ms + item_ms * len(prompts)) / 1000.0)
+        return [p[::-1] for p in prompts]
+    return run
+
+
+def _pct(values: List[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+
+async def bench(run_batch: Callable[[List[str]], List[str]], callers: int, requests: int, max_batch: int, wait_s: float) -> Dict[str, Any]:
+    sizes: List[int] = []
+
+    def counted(prompts: List[str]) -> List[str]:
+        sizes.append(len(prompts))
+        return run_batch(prompts)
+
+    batcher = MicroBatcher(f"bench_{max_batch}", counted, max_batch, wait_s)
+    latencies: List[float] = []
+
+    async def caller(c: int) -> None:
+        for r in range(requests):
+            t0 = time.perf_counter()
+            await batcher.submit(f"caller {c} request {r}: summarize the findings")
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(caller(c) for c in range(callers)))
+    finally:
+        await batcher.close()
+    wall = time.perf_counter() - t0
+    return {
+        "max_batch": max_batch,
+        "requests": len(latencies),
+        "wall_s": round(wall, 4),
+        "throughput_req_per_s": round(len(latencies) / wall, 3) if wall else None,
+        "latency_ms": {"p50": _pct(latencies, 0.5), "p99": _pct(latencies, 0.99), "mean": round(statistics.mean(latencies) * 1000, 3)},
+        "batches": len(sizes),
+        "mean_batch_size": round(statistics.mean(sizes), 2) if sizes else None,
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--callers", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=4, help="generations per caller")
+    ap.add_argument("--batch", type=int, default=settings.LLM_LOCAL_BATCH_SIZE)
+    ap.add_argument("--wait-ms", type=float, default=settings.LLM_LOCAL_BATCH_WAIT_S * 1000)
+    ap.add_argument("--model", choices=("synthetic", "transformers"), default="synthetic")
+    ap.add_argument("--base-ms", type=float, default=80.0, help="synthetic cost per batch")
+    ap.add_argument("--item-ms", type=float, default=8.0, help="synthetic cost per prompt in a batch")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    if args.model == "transformers":
+        from app.services import llm_adapter
+        if llm_adapter._GENERATOR is None:
+            raise SystemExit("transformers generator is not available")
+        run_batch = llm_adapter._generate_local_batch
+    else:
+        run_batch = synthetic_model(args.base_ms, args.item_ms)
+
+    results = []
+    for callers in (int(c) for c in args.callers.split(",")):
+        unbatched = await bench(run_batch, callers, args.requests, 1, 0.0)
+        batched = await bench(run_batch, callers, args.requests, args.batch, args.wait_ms / 1000.0)
+        speedup = None
+        if unbatched["throughput_req_per_s"] and batched["throughput_req_per_s"]:
+            speedup = round(batched["throughput_req_per_s"] / unbatched["throughput_req_per_s"], 2)
+        results.append({"callers": callers, "unbatched": unbatched, "batched": batched, "speedup": speedup})
+
+    report = {"config": {k: v for k, v in vars(args).items() if k != "out"}, "results": results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
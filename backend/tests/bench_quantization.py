@@ -0,0 +1,109 @@
+"""Recall and memory of quantized chunk-embedding search against exact cosine.
+
+Builds a VectorIndex per mode over synthetic clustered embeddings (the shape
+real sentence embeddings have) and compares, for every query, the top-k of
+the exact cosine path with:
+
+    first_pass   top-k by compressed-code score alone
+    rescored     top-k after rescoring the shortlist of `--candidates` with
+                 the full vectors (what RAGService.search does)
+
+Also reports bytes per vector (codes only and including codebooks), the
+compression factor against float32, build time and query latency.
+
+Usage (from backend/):
+    python -m tests.bench_quantization
+    python -m tests.bench_quantization --n 50000 --dim 768 --k 5 --candidates 50,100,200
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.vector_index import QUANT_INT8, QUANT_PQ, VectorIndex
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    x = centers[rng.integers(0, clusters, size=n)] + 0.6 * rng.normal(size=(n, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _recall(found: List[int], truth: List[int]) -> float:
+    return len(set(found) & set(truth)) / len(truth) if truth else 1.0
+
+
+def bench_mode(mode: str, x: np.ndarray, queries: np.ndarray, truth: List[List[int]], k: int, candidates: List[int], subvector_dim: int) -> Dict[str, Any]:
+    ids = list(range(len(x)))
+    index = VectorIndex(mode, subvector_dim)
+    t0 = time.perf_counter()
+    index.build(ids, x)
+    build_s = time.perf_counter() - t0
+
+    first_pass, latencies = [], []
+    rescored: Dict[int, List[float]] = {c: [] for c in candidates}
+    for q, t in zip(queries, truth):
+        t0 = time.perf_counter()
+        short = index.shortlist(q, max(candidates))
+        latencies.append(time.perf_counter() - t0)
+        first_pass.append(_recall(short[:k], t))
+        for c in candidates:
+            cand = np.array(short[:c])
+            exact = x[cand] @ q
+            rescored[c].append(_recall(cand[np.argsort(-exact)[:k]].tolist(), t))
+
+    codes_bytes = index.memory_bytes() - (index.codebooks.nbytes if index.codebooks is not None else 0)
+    return {
+        "mode": mode,
+        "build_s": round(build_s, 3),
+        "bytes_per_vector": round(codes_bytes / len(x), 2),
+        "bytes_per_vector_with_codebooks": round(index.memory_bytes() / len(x), 2),
+        "compression_vs_float32": round(x.shape[1] * 4 / (codes_bytes / len(x)), 2),
+        "query_ms_p50": round(statistics.median(latencies) * 1000, 3),
+        f"recall@{k}_first_pass": round(statistics.mean(first_pass), 4),
+        f"recall@{k}_rescored": {str(c): round(statistics.mean(r), 4) for c, r in rescored.items()},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--clusters", type=int, default=64)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--candidates", default="20,50,100")
+    ap.add_argument("--modes", default=f"{QUANT_INT8},{QUANT_PQ}")
+    ap.add_argument("--subvector-dim", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=3)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    x = synthetic_embeddings(args.n, args.dim, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = x[rng.choice(args.n, size=args.queries, replace=False)] + 0.3 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    t0 = time.perf_counter()
+    truth = [np.argsort(-(x @ q))[: args.k].tolist() for q in queries]
+    exact_ms = (time.perf_counter() - t0) * 1000 / args.queries
+
+    candidates = [int(c) for c in args.candidates.split(",")]
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "exact": {"bytes_per_vector": args.dim * 4, "query_ms_mean": round(exact_ms, 3)},
+        "results": [bench_mode(m.strip(), x, queries, truth, args.k, candidates, args.subvector_dim) for m in args.modes.split(",")],
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Record a workflow run once, then replay it from the cassette.
+
+Runs a graph through the /workflow/run engine with CASSETTE_MODE=record, then
+`--runs` times with CASSETTE_MODE=replay (see app/services/cassette.py) and
+reports, as JSON:
+
+    record_wall_s        the live run
+    replay_wall_s        each replayed run (p50 / mean), and the speedup
+    identical_results    whether every replayed node produced the recorded
+                         status and result text
+    misses               replayed calls that were not in the cassette
+
+Without --graph a synthetic fan-out on the mock backends (with their latency
+flags) stands in for a production graph. A graph file is the JSON body of
+POST /workflow/run ({"nodes": [...], "edges": [...]}); it is recorded against
+whatever backends are configured, or replayed from an existing --cassette only
+(--replay-only, under the configuration it was recorded with).
+
+Usage (from backend/):
+    python -m tests.bench_replay
+    python -m tests.bench_replay --graph my_graph.json --cassette cassettes/my_graph.jsonl --runs 5
+    python -m tests.bench_replay --graph my_graph.json --cassette cassettes/my_graph.jsonl --replay-only --latency-scale 1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, Tuple
+
+
+async def run_once(nodes, edges) -> Tuple[float, Dict[str, Any]]:
+    """Stream one graph through the engine; returns (wall seconds, {node_id: (status, result)})."""
+    from app.routes.execution import WorkflowRequest, run_workflow_graph
+
+    t0 = time.perf_counter()
+    response = await run_workflow_graph(WorkflowRequest(nodes=nodes, edges=edges))
+    results: Dict[str, Any] = {}
+    async for line in response.body_iterator:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        for raw in line.splitlines():
+            if not raw.strip():
+                continue
+            ev = json.loads(raw)
+            if ev.get("type") == "result" and ev.get("node_id"):
+                res = ev.get("result")
+                results[ev["node_id"]] = (res.get("status"), res.get("result")) if isinstance(res, dict) else (None, res)
+            elif ev.get("type") == "error" and ev.get("node_id"):
+                results[ev["node_id"]] = ("error", ev.get("error"))
+    return time.perf_counter() - t0, results
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--graph", default=None, help="JSON body of POST /workflow/run")
+    ap.add_argument("--shape", default="fanout:4", help="synthetic graph (see bench_workflow) when --graph is not given")
+    ap.add_argument("--cassette", default=None, help="cassette path under data/ (default: a fresh one per invocation)")
+    ap.add_argument("--replay-only", action="store_true", help="replay an existing cassette without recording")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--latency-scale", type=float, default=0.0, help="replay delay as a fraction of the recorded latency")
+    ap.add_argument("--llm-ms", type=float, default=50.0)
+    ap.add_argument("--search-ms", type=float, default=30.0)
+    ap.add_argument("--verbose", action="store_true", help="keep the engine's own prints")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    if args.graph:
+        with open(args.graph, encoding="utf-8") as fh:
+            body = json.load(fh)
+        nodes, edges = body["nodes"], body.get("edges", [])
+    else:
+        # Mock backends must be selected before the app modules are imported.
+        for flag in ("MOCK_LLM", "MOCK_SEARCH", "MOCK_EMBEDDINGS"):
+            os.environ.setdefault(flag, "1")
+        os.environ["MOCK_LLM_LATENCY_MS"] = str(args.llm_ms)
+        os.environ["MOCK_SEARCH_LATENCY_MS"] = str(args.search_ms)
+        from tests.bench_workflow import build_shape
+
+        nodes, edges = build_shape(args.shape)
+
+    from app.config import settings
+    from app.services import cassette
+    from app.services.file_output import resolve_path
+    from app.services.metrics import registry
+
+    settings.CASSETTE_PATH = args.cassette or f"cassettes/bench-{os.getpid()}.jsonl"
+    settings.CASSETTE_LATENCY_SCALE = args.latency_scale
+    import app.routes.execution  # noqa: F401
+
+    report: Dict[str, Any] = {"config": {k: v for k, v in vars(args).items() if k != "out"}, "nodes": len(nodes), "cassette": settings.CASSETTE_PATH}
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+        recorded = None
+        if not args.replay_only:
+            settings.CASSETTE_MODE = cassette.MODE_RECORD
+            report["record_wall_s"], recorded = await run_once(nodes, edges)
+            report["record_wall_s"] = round(report["record_wall_s"], 4)
+
+        settings.CASSETTE_MODE = cassette.MODE_REPLAY
+        misses = registry.counter("cassette_misses_total")
+        walls, identical = [], True
+        for _ in range(args.runs):
+            wall, results = await run_once(nodes, edges)
+            walls.append(wall)
+            if recorded is not None and results != recorded:
+                identical = False
+
+    report["replay_wall_s"] = {"p50": round(statistics.median(walls), 4), "mean": round(statistics.mean(walls), 4)} if walls else None
+    if walls and report.get("record_wall_s"):
+        report["speedup"] = round(report["record_wall_s"] / statistics.median(walls), 1)
+    report["identical_results"] = identical if recorded is not None else None
+    report["misses"] = int(sum(misses.value(kind=k) for k in (cassette.KIND_LLM, cassette.KIND_AGENT_LLM, cassette.KIND_WEB_SEARCH, cassette.KIND_EMBEDDING)))
+    path = resolve_path(settings.CASSETTE_PATH)
+    report["cassette_bytes"] = path.stat().st_size if path.exists() else 0
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
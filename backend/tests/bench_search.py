@@ -0,0 +1,107 @@
+"""Outbound web search load with and without single-flight coalescing.
+
+`--callers` concurrent agents each run `--searches` web searches, drawn from
+`--distinct` queries, through the agents' search tool against the mock search
+backend (`--search-ms` per call on the network pool). Runs once with SEARCH_COALESCE off and once with it
+on, and reports as JSON per run: outbound provider calls, coalesced searches,
+p50/p99 search latency and wall time. `--rate` adds a token bucket
+("rate_per_s:burst") on the mock provider to show the limiter's pacing and
+skips (SEARCH_RATE_MAX_WAIT_S via `--max-wait-s`).
+
+Usage (from backend/):
+    python -m tests.bench_search
+    python -m tests.bench_search --callers 32 --distinct 4 --search-ms 200
+    python -m tests.bench_search --rate 20:5 --max-wait-s 1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+
+def _pct(values: List[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+
+async def bench(callers: int, searches: int, distinct: int, coalesce: bool, seed: int) -> Dict[str, Any]:
+    from app.config import settings
+    from app.services.metrics import registry
+    from app.services.tools import PROVIDER_MOCK, run_web_search
+
+    settings.SEARCH_COALESCE = coalesce
+    calls, coalesced, skipped = (registry.counter(n) for n in ("search_provider_calls_total", "search_coalesced_total", "search_rate_limited_total"))
+    before = (calls.value(provider=PROVIDER_MOCK), coalesced.value(), skipped.value(provider=PROVIDER_MOCK))
+    rng = random.Random(seed)
+    plan = [[f"query {rng.randrange(distinct)}" for _ in range(searches)] for _ in range(callers)]
+    latencies: List[float] = []
+    failed = 0
+
+    async def caller(queries: List[str]) -> None:
+        nonlocal failed
+        for q in queries:
+            t0 = time.perf_counter()
+            result = await run_web_search(q)
+            latencies.append(time.perf_counter() - t0)
+            failed += not result.ok
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(caller(queries) for queries in plan))
+    wall = time.perf_counter() - t0
+    return {
+        "coalesce": coalesce,
+        "searches": len(latencies),
+        "outbound_calls": int(calls.value(provider=PROVIDER_MOCK) - before[0]),
+        "coalesced": int(coalesced.value() - before[1]),
+        "rate_limited": int(skipped.value(provider=PROVIDER_MOCK) - before[2]),
+        "failed": failed,
+        "p50_ms": _pct(latencies, 0.5),
+        "p99_ms": _pct(latencies, 0.99),
+        "wall_s": round(wall, 4),
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--callers", type=int, default=16)
+    ap.add_argument("--searches", type=int, default=4, help="searches per caller")
+    ap.add_argument("--distinct", type=int, default=8, help="distinct queries shared by all callers")
+    ap.add_argument("--search-ms", type=float, default=100.0)
+    ap.add_argument("--rate", default="0:1", help="mock provider token bucket rate_per_s:burst (0 = unlimited)")
+    ap.add_argument("--max-wait-s", type=float, default=5.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--verbose", action="store_true", help="keep the search layer's own prints")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    # Mock search must be selected before the app modules are imported.
+    os.environ["MOCK_SEARCH"] = "1"
+    os.environ["MOCK_SEARCH_LATENCY_MS"] = str(args.search_ms)
+    from app.config import settings
+    from app.services import tools
+
+    settings.SEARCH_RATE_LIMITS = f"{tools.PROVIDER_MOCK}:{args.rate}"
+    settings.SEARCH_RATE_MAX_WAIT_S = args.max_wait_s
+
+    report: Dict[str, Any] = {"config": {k: v for k, v in vars(args).items() if k != "out"}, "runs": []}
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+        for coalesce in (False, True):
+            tools._buckets_spec = None  # fresh buckets per run
+            report["runs"].append(await bench(args.callers, args.searches, args.distinct, coalesce, args.seed))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
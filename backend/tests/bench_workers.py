@@ -0,0 +1,124 @@
+"""Throughput of queued graph runs with 1..N worker processes.
+
+For each worker count in `--workers` (default 1,2,4) a fresh SQLite database
+is filled with `--jobs` queued runs of a synthetic graph (see bench_workflow)
+on the mock backends, then that many `python -m app.worker --exit-when-idle`
+processes drain it. Reports, as JSON per worker count: wall time, jobs/s,
+final job statuses and how many jobs each worker ran.
+
+The mock backends only sleep, so this measures how the queue spreads runs
+across processes; with real CPU-bound work (local generation, PDF parsing)
+extra processes also add cores.
+
+Usage (from backend/):
+    python -m tests.bench_workers
+    python -m tests.bench_workers --workers 1,2,4,8 --jobs 32 --shape chain:3 --concurrency 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict
+
+
+def _env(db_path: str, args) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "MOCK_LLM": "1",
+        "MOCK_SEARCH": "1",
+        "MOCK_EMBEDDINGS": "1",
+        "MOCK_LLM_LATENCY_MS": str(args.llm_ms),
+        "MOCK_SEARCH_LATENCY_MS": str(args.search_ms),
+        "TRACING_ENABLED": "0",
+    })
+    return env
+
+
+# Runs in a child process so the app binds to that round's database
+_ENQUEUE = """
+import asyncio, sys
+from app.db.database import init_db
+from app.services import job_queue
+from tests.bench_workflow import build_shape
+
+async def main():
+    await init_db()
+    nodes, edges = build_shape(sys.argv[1])
+    for _ in range(int(sys.argv[2])):
+        await job_queue.enqueue({"nodes": nodes, "edges": edges}, "batch")
+
+asyncio.run(main())
+"""
+
+_SUMMARY = """
+import asyncio, json
+from sqlalchemy import select
+from app.db import models
+from app.db.database import AsyncSessionLocal
+
+async def main():
+    async with AsyncSessionLocal() as s:
+        rows = (await s.execute(select(models.ExecutionJob.status, models.ExecutionJob.worker_id))).all()
+    print(json.dumps([list(r) for r in rows]))
+
+asyncio.run(main())
+"""
+
+
+def bench(workers: int, args) -> Dict[str, Any]:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-workers-"), "app.db")
+    env = _env(db_path, args)
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": None if args.verbose else subprocess.DEVNULL}
+    subprocess.run([sys.executable, "-c", _ENQUEUE, args.shape, str(args.jobs)], env=env, check=True, **quiet)
+
+    t0 = time.perf_counter()
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "app.worker", "--exit-when-idle", "--concurrency", str(args.concurrency)], env=env, **quiet)
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.wait()
+    wall = time.perf_counter() - t0
+
+    out = subprocess.run([sys.executable, "-c", _SUMMARY], env=env, check=True, capture_output=True, text=True).stdout
+    rows = json.loads(out.strip().splitlines()[-1])
+    return {
+        "workers": workers,
+        "wall_s": round(wall, 3),
+        "jobs_per_s": round(len(rows) / wall, 2) if wall else None,
+        "statuses": dict(Counter(status for status, _ in rows)),
+        "jobs_per_worker": sorted(Counter(worker for _, worker in rows).values(), reverse=True),
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", default="1,2,4", help="comma-separated worker process counts")
+    ap.add_argument("--jobs", type=int, default=16)
+    ap.add_argument("--shape", default="fanout:3", help="synthetic graph per job (see bench_workflow)")
+    ap.add_argument("--concurrency", type=int, default=1, help="jobs each worker runs at once")
+    ap.add_argument("--llm-ms", type=float, default=100.0)
+    ap.add_argument("--search-ms", type=float, default=30.0)
+    ap.add_argument("--verbose", action="store_true", help="show the workers' stderr")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    report: Dict[str, Any] = {"config": {k: v for k, v in vars(args).items() if k != "out"}, "runs": []}
+    for n in (int(w) for w in args.workers.split(",") if w.strip()):
+        report["runs"].append(await asyncio.to_thread(bench, n, args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,269 @@
+"""Reproducible workflow-engine benchmark on mock LLM / search / embedding backends.
+
+Builds synthetic DAGs, stores each as a workflow, streams it through the
+/workflow/run engine (persisting the execution and its steps, as stored
+workflows do) and reports throughput, p50/p99 node latency, peak traced memory
+and DB write rate as JSON, so results can be diffed across commits. The
+database and the agents' files go to a temp directory.
+
+Usage (from backend/):
+    python -m tests.bench_workflow
+    python -m tests.bench_workflow --shapes chain:10,fanout:8,diamond:3,layers:4x6 \\
+        --llm-ms 50 --search-ms 20 --embed-ms 5 --runs 3 --concurrent 2 --out bench.json
+    python -m tests.bench_workflow --compare old.json   # print deltas vs an earlier report
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+# Mock backends must be selected before the app modules are imported.
+os.environ.setdefault("MOCK_LLM", "1")
+os.environ.setdefault("MOCK_SEARCH", "1")
+os.environ.setdefault("MOCK_EMBEDDINGS", "1")
+# A scratch database and data directory, so runs neither touch nor depend on backend/data
+_SCRATCH = tempfile.mkdtemp(prefix="bench-workflow-")
+os.environ["DATA_DIR"] = _SCRATCH
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_SCRATCH, 'app.db')}"
+
+Graph = Tuple[List[Dict[str, Any]], List[Dict[str, str]]]
+
+
+def _agent(nid: str) -> Dict[str, Any]:
+    return {"id": nid, "type": "agent", "data": {"goal": f"Research topic {nid} and save {nid}.txt"}}
+
+
+def chain(n: int) -> Graph:
+    nodes = [_agent(f"c{i}") for i in range(n)]
+    edges = [{"source": f"c{i}", "target": f"c{i + 1}"} for i in range(n - 1)]
+    return nodes, edges
+
+
+def fanout(width: int) -> Graph:
+    """root -> width parallel nodes -> sink (fan-out / fan-in)."""
+    nodes = [_agent("root")] + [_agent(f"f{i}") for i in range(width)] + [_agent("sink")]
+    edges = [{"source": "root", "target": f"f{i}"} for i in range(width)]
+    edges += [{"source": f"f{i}", "target": "sink"} for i in range(width)]
+    return nodes, edges
+
+
+def diamond(k: int) -> Graph:
+    """k stacked diamonds: top -> (left, right) -> bottom, bottom is the next top."""
+    nodes = [_agent("d0")]
+    edges: List[Dict[str, str]] = []
+    for i in range(k):
+        top, left, right, bottom = f"d{i}", f"d{i}l", f"d{i}r", f"d{i + 1}"
+        nodes += [_agent(left), _agent(right), _agent(bottom)]
+        edges += [
+            {"source": top, "target": left},
+            {"source": top, "target": right},
+            {"source": left, "target": bottom},
+            {"source": right, "target": bottom},
+        ]
+    return nodes, edges
+
+
+def layers(depth: int, width: int, fan_in: int = 2, seed: int = 11) -> Graph:
+    """`depth` layers of `width` nodes; each node has up to `fan_in` parents in the previous layer."""
+    rng = random.Random(seed)
+    nodes = [_agent(f"l{d}_{w}") for d in range(depth) for w in range(width)]
+    edges: List[Dict[str, str]] = []
+    for d in range(1, depth):
+        for w in range(width):
+            for p in rng.sample(range(width), min(fan_in, width)):
+                edges.append({"source": f"l{d - 1}_{p}", "target": f"l{d}_{w}"})
+    return nodes, edges
+
+
+def build_shape(spec: str) -> Graph:
+    kind, _, arg = spec.partition(":")
+    if kind == "chain":
+        return chain(int(arg or 10))
+    if kind == "fanout":
+        return fanout(int(arg or 8))
+    if kind == "diamond":
+        return diamond(int(arg or 3))
+    if kind == "layers":
+        depth, _, width = (arg or "4x6").partition("x")
+        return layers(int(depth), int(width or depth))
+    raise ValueError(f"unknown shape '{spec}'")
+
+
+async def store_workflow(name: str, nodes, edges) -> int:
+    from app.db import models
+    from app.db.database import AsyncSessionLocal, init_db
+
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        wf = models.Workflow(name=name, graph_json={"nodes": nodes, "edges": edges})
+        session.add(wf)
+        await session.commit()
+        return wf.id
+
+
+async def run_graph(nodes, edges, workflow_id: int | None = None) -> Tuple[List[float], int, int]:
+    """Stream one graph through the engine; returns (node latencies, nodes done, errors)."""
+    from app.routes.execution import WorkflowRequest, run_workflow_graph
+
+    # force: every run executes (and stores) all nodes instead of reusing the previous run's
+    payload = WorkflowRequest(nodes=nodes, edges=edges, workflow_id=workflow_id, force=True)
+    response = await run_workflow_graph(payload)
+    started: Dict[str, float] = {}
+    latencies: List[float] = []
+    done = errors = 0
+    async for line in response.body_iterator:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        for raw in line.splitlines():
+            if not raw.strip():
+                continue
+            ev = json.loads(raw)
+            now = time.perf_counter()
+            if ev.get("type") == "start":
+                started[ev["node_id"]] = now
+            elif ev.get("type") in ("result", "error") and ev.get("node_id"):
+                done += 1
+                errors += ev["type"] == "error"
+                if ev["node_id"] in started:
+                    latencies.append(now - started[ev["node_id"]])
+    return latencies, done, errors
+
+
+def _pct(values: List[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[idx] * 1000, 3)
+
+
+async def bench_shape(spec: str, runs: int, concurrent: int, trace_memory: bool) -> Dict[str, Any]:
+    from app.services.metrics import registry
+
+    nodes, edges = build_shape(spec)
+    workflow_id = await store_workflow(f"bench {spec}", nodes, edges)
+    db_hist = registry.histogram("db_commit_seconds")
+    db_before = db_hist.total_count()
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    latencies: List[float] = []
+    total_nodes = total_errors = 0
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        results = await asyncio.gather(*(run_graph(nodes, edges, workflow_id) for _ in range(concurrent)))
+        for lat, done, errors in results:
+            latencies += lat
+            total_nodes += done
+            total_errors += errors
+    wall = time.perf_counter() - t0
+
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    db_writes = db_hist.total_count() - db_before
+
+    return {
+        "shape": spec,
+        "nodes": len(nodes),
+        "edges": len(edges),
+        "runs": runs * concurrent,
+        "wall_s": round(wall, 4),
+        "throughput_nodes_per_s": round(total_nodes / wall, 3) if wall else None,
+        "node_latency_ms": {
+            "p50": _pct(latencies, 0.50),
+            "p99": _pct(latencies, 0.99),
+            "mean": round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+        },
+        "errors": total_errors,
+        "memory_peak_bytes": peak,
+        "db_writes": db_writes,
+        "db_writes_per_s": round(db_writes / wall, 3) if wall else None,
+    }
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    old_by_shape = {r["shape"]: r for r in old.get("results", [])}
+    rows = []
+    for r in new.get("results", []):
+        o = old_by_shape.get(r["shape"])
+        if not o:
+            continue
+        rows.append({
+            "shape": r["shape"],
+            "throughput_change_pct": round(100 * (r["throughput_nodes_per_s"] - o["throughput_nodes_per_s"]) / o["throughput_nodes_per_s"], 2)
+            if o.get("throughput_nodes_per_s") else None,
+            "p50_ms": [o["node_latency_ms"]["p50"], r["node_latency_ms"]["p50"]],
+            "p99_ms": [o["node_latency_ms"]["p99"], r["node_latency_ms"]["p99"]],
+        })
+    return rows
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--shapes", default="chain:10,fanout:8,diamond:3,layers:4x6")
+    ap.add_argument("--llm-ms", type=float, default=20.0)
+    ap.add_argument("--search-ms", type=float, default=10.0)
+    ap.add_argument("--embed-ms", type=float, default=2.0)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--runs", type=int, default=1, help="sequential repetitions per shape")
+    ap.add_argument("--concurrent", type=int, default=1, help="graphs executed at the same time per repetition")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows Python down)")
+    ap.add_argument("--verbose", action="store_true", help="keep the engine's own prints")
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--compare", default=None)
+    args = ap.parse_args()
+
+    os.environ["MOCK_LLM_LATENCY_MS"] = str(args.llm_ms)
+    os.environ["MOCK_SEARCH_LATENCY_MS"] = str(args.search_ms)
+    os.environ["MOCK_EMBED_LATENCY_MS"] = str(args.embed_ms)
+    os.environ["MOCK_LATENCY_JITTER"] = str(args.jitter)
+    random.seed(args.seed)
+
+    # Import (and initialise) the app outside the timed region.
+    import app.routes.execution  # noqa: F401
+
+    results = []
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+        for spec in args.shapes.split(","):
+            results.append(await bench_shape(spec.strip(), args.runs, args.concurrent, not args.no_memory))
+
+    shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+    report = {
+        "commit": _git_rev(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            report["compare"] = compare(json.load(fh), report)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -19,6 +19,7 @@ import './styles/index.css';
 
 import AgentNode from './components/AgentNode';
 import Sidebar from './components/Sidebar';
+import { createWorkflow } from './api/workflows';
 
 const nodeTypes = { agent: AgentNode };
 
@@ -33,6 +34,18 @@ const initialNodes: Node[] = [
 
 const initialEdges: Edge[] = [];
 
+// Long strings arrive once as `blob` events and are referenced as {"$ref": id} afterwards.
+function resolveRefs(value: any, blobs: Map<string, string>): any {
+  if (Array.isArray(value)) return value.map((v) => resolveRefs(v, blobs));
+  if (value && typeof value === 'object') {
+    if (typeof value.$ref === 'string' && Object.keys(value).length === 1) return blobs.get(value.$ref) ?? '';
+    const out: any = {};
+    for (const k of Object.keys(value)) out[k] = resolveRefs(value[k], blobs);
+    return out;
+  }
+  return value;
+}
+
 function Flow() {
   const [nodes, setNodes, onNodesChange] = useNodesState(initialNodes);
   const [edges, setEdges, onEdgesChange] = useEdgesState(initialEdges);
@@ -42,6 +55,8 @@ function Flow() {
   const { getNodes, getEdges, screenToFlowPosition } = useReactFlow();
 
   const reactFlowWrapper = useRef<HTMLDivElement | null>(null);
+  // Stored workflow backing this editor session; lets the backend re-run only edited nodes
+  const workflowIdRef = useRef<number | null>(null);
 
   const onConnect = useCallback(
     (params: Connection) => setEdges((eds) => addEdge(params, eds)),
@@ -54,10 +69,18 @@ function Flow() {
       // Always fetch fresh state from the store
       const currentNodes = getNodes();
       const currentEdges = getEdges();
-      const payload = { nodes: currentNodes, edges: currentEdges };
+      if (workflowIdRef.current === null) {
+        try {
+          const wf = await createWorkflow('Editor session', { nodes: currentNodes, edges: currentEdges });
+          workflowIdRef.current = wf.id;
+        } catch (e) {
+          console.warn('Could not store workflow; running without incremental reuse', e);
+        }
+      }
+      const payload = { nodes: currentNodes, edges: currentEdges, workflow_id: workflowIdRef.current };
       console.log('🚀 Sending Payload:', payload);
 
-      const res = await fetch('http://127.0.0.1:8000/workflow/run', {
+      const res = await fetch('http://127.0.0.1:8000/workflow/run?verbosity=summary', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
@@ -69,6 +92,7 @@ function Flow() {
 
       const reader = res.body.getReader();
       const decoder = new TextDecoder();
+      const blobs = new Map<string, string>();
       let buf = '';
 
       // Read stream in a loop
@@ -91,13 +115,24 @@ function Flow() {
             console.warn('Failed to parse NDJSON line', line);
             continue;
           }
+          if (msg.type === 'blob') {
+            blobs.set(msg.id, msg.data);
+            continue;
+          }
+          msg = resolveRefs(msg, blobs);
 
-          // Handle event types: start, result, error, end
+          // Handle event types: blob (above), start, progress, result, error, end
           if (msg.type === 'start') {
             const nid = msg.node_id;
             setNodes((nds) =>
               nds.map((n) => (n.id === nid ? { ...n, data: { ...n.data, status: 'running' } } : n))
             );
+          } else if (msg.type === 'progress') {
+            // map node: one event per finished item
+            const nid = msg.node_id;
+            setNodes((nds) =>
+              nds.map((n) => (n.id === nid ? { ...n, data: { ...n.data, status: 'running', result: `${msg.done}/${msg.total} items` } } : n))
+            );
           } else if (msg.type === 'result') {
             const nid = msg.node_id;
             const result = msg.result;
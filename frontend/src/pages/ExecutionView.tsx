@@ -14,10 +14,19 @@ export default function ExecutionView({ execId }: { execId: number }) {
       setLoading(false)
     }
     fetch()
-    const t = setInterval(fetch, 2000)
+    // Follow the live run over SSE and refresh on every node event; fall back to polling
+    // when the execution has no live channel (finished long ago, or another server).
+    let t: ReturnType<typeof setInterval> | null = null
+    const es = new EventSource(`http://localhost:8000/execution/${execId}/events?verbosity=minimal`)
+    for (const type of ['result', 'error', 'end']) es.addEventListener(type, () => fetch())
+    es.onerror = () => {
+      es.close()
+      if (!t) t = setInterval(fetch, 2000)
+    }
     return () => {
       mounted = false
-      clearInterval(t)
+      es.close()
+      if (t) clearInterval(t)
     }
   }, [execId])
 